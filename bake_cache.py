@@ -0,0 +1,260 @@
+import hashlib
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+import bpy
+
+from profiling import profiled
+
+# bakes live in <root>/<kind>/<key>, the key hashes every parameter the simulation depends on,
+# so a changed script bakes into a new directory and an unchanged one reuses the old bake
+CACHE_ROOT = os.environ.get("BLENDER_BAKE_CACHE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache"))
+MANIFEST = "manifest.json"
+LOCK = ".baking"
+# a baking process touches its lock this often, a lock untouched for LOCK_TIMEOUT seconds is left by a crash
+LOCK_HEARTBEAT = 30
+LOCK_TIMEOUT = 300
+
+bake_cache_stats = {'hits': 0, 'misses': 0, 'bake_time': 0.0}
+
+# settings that describe where or how far a bake is, not what is simulated
+_IGNORED_PROPS = {'cache_directory', 'cache_type', 'image_output_path', 'name', 'show_viewport', 'show_render', 'show_in_editmode',
+                  'show_on_cage', 'show_expanded', 'is_active', 'is_override_data'}
+
+def script_argv():
+    # blender passes everything after "--" through to the script untouched
+    return sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+
+def rebake_requested():
+    # blender -b --python script.py -- --rebake, or BLENDER_REBAKE=1
+    return "--rebake" in script_argv() or os.environ.get("BLENDER_REBAKE") == "1"
+
+def _value(value):
+    if (isinstance(value, set)):
+        return sorted(value)
+    if (hasattr(value, '__len__') and not isinstance(value, str)):
+        return [_value(v) for v in value]
+    if (isinstance(value, float)):
+        return round(value, 6)
+    return value
+
+def rna_values(struct):
+    values = {}
+    for prop in struct.bl_rna.properties:
+        if (prop.is_readonly or prop.identifier in _IGNORED_PROPS
+                or prop.type not in {'BOOLEAN', 'INT', 'FLOAT', 'STRING', 'ENUM'}):
+            continue
+        values[prop.identifier] = _value(getattr(struct, prop.identifier))
+    return values
+
+def _animation_values(obj):
+    action = obj.animation_data and obj.animation_data.action
+    if (action is None):
+        return []
+    curves = []
+    for fcurve in action.fcurves:
+        curves.append({
+            'path': fcurve.data_path,
+            'index': fcurve.array_index,
+            'keys': [(_value(k.co), _value(k.handle_left), _value(k.handle_right), k.interpolation)
+                     for k in fcurve.keyframe_points],
+            'modifiers': [rna_values(m) for m in fcurve.modifiers],
+        })
+    return curves
+
+def _geometry_digest(obj):
+    if (obj.type != 'MESH'):
+        return None
+    mesh = obj.data
+    digest = hashlib.sha1()
+    co = [0.0] * (len(mesh.vertices) * 3)
+    mesh.vertices.foreach_get('co', co)
+    digest.update(repr([round(c, 6) for c in co]).encode())
+    indices = [0] * len(mesh.loops)
+    mesh.loops.foreach_get('vertex_index', indices)
+    digest.update(repr(indices).encode())
+    return digest.hexdigest()
+
+def object_values(obj):
+    return {
+        'name': obj.name,
+        'matrix_world': _value(obj.matrix_world),
+        'geometry': _geometry_digest(obj),
+        'modifiers': [dict(rna_values(m), type=m.type) for m in obj.modifiers],
+        'animation': _animation_values(obj),
+    }
+
+def params_key(params):
+    return hashlib.sha1(json.dumps(params, sort_keys=True, default=repr).encode()).hexdigest()[:16]
+
+def cache_directory(kind, key, root=None):
+    return os.path.join(root or CACHE_ROOT, kind, key)
+
+def directory_size(directory):
+    size = 0
+    for path, _, files in os.walk(directory):
+        size += sum(os.path.getsize(os.path.join(path, name)) for name in files)
+    return size
+
+def read_manifest(directory):
+    with open(os.path.join(directory, MANIFEST)) as f:
+        return json.load(f)
+
+def is_baked(directory):
+    return os.path.isfile(os.path.join(directory, MANIFEST))
+
+def _acquire_lock(lock):
+    # O_EXCL makes taking the lock atomic, of the workers that start together exactly one bakes
+    try:
+        fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return False
+    with os.fdopen(fd, "w") as f:
+        f.write("%d %s %f" % (os.getpid(), socket.gethostname(), time.time()))
+    return True
+
+def _release_lock(lock):
+    try:
+        os.remove(lock)
+    except FileNotFoundError:
+        pass
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def _lock_is_stale(lock):
+    # the baking process died (same host) or stopped touching the lock (any host)
+    try:
+        age = time.time() - os.path.getmtime(lock)
+        with open(lock) as f:
+            fields = f.read().split()
+    except FileNotFoundError:
+        return False
+    if (len(fields) == 3 and fields[1] == socket.gethostname() and not _pid_alive(int(fields[0]))):
+        return True
+    return age > LOCK_TIMEOUT
+
+def _heartbeat(lock, stop):
+    while (not stop.wait(LOCK_HEARTBEAT)):
+        try:
+            os.utime(lock)
+        except FileNotFoundError:
+            return
+
+def bake(kind, params, bake_function, root=None, timeout=24 * 3600):
+    # runs bake_function(directory) unless a bake for the same params is on disk,
+    # returns (directory, hit); another process (a render_farm worker) baking the same key is waited for
+    key = params_key(params)
+    directory = cache_directory(kind, key, root)
+    os.makedirs(directory, exist_ok=True)
+    rebake = rebake_requested()
+    lock = os.path.join(directory, LOCK)
+    start = time.perf_counter()
+    while (True):
+        if (not rebake and is_baked(directory)):
+            bake_cache_stats['hits'] += 1
+            return directory, True
+        if (_acquire_lock(lock)):
+            break
+        if (_lock_is_stale(lock)):
+            _release_lock(lock)
+            continue
+        if (time.perf_counter() - start > timeout):
+            raise TimeoutError("waited %d s for the bake in %s, remove %s if no process is baking it" % (timeout, directory, lock))
+        time.sleep(1)
+
+    stop = threading.Event()
+    threading.Thread(target=_heartbeat, args=(lock, stop), daemon=True).start()
+    try:
+        # another process may have finished between the check and taking the lock
+        if (not rebake and is_baked(directory)):
+            bake_cache_stats['hits'] += 1
+            return directory, True
+        if (rebake and is_baked(directory)):
+            os.remove(os.path.join(directory, MANIFEST))
+        start = time.perf_counter()
+        bake_function(directory)
+        bake_time = time.perf_counter() - start
+        with open(os.path.join(directory, MANIFEST), "w") as f:
+            json.dump({'kind': kind, 'key': key, 'bake_time': bake_time, 'created': time.time(), 'params': params},
+                      f, indent=1, sort_keys=True, default=repr)
+    finally:
+        stop.set()
+        _release_lock(lock)
+    bake_cache_stats['misses'] += 1
+    bake_cache_stats['bake_time'] += bake_time
+    return directory, False
+
+def bake_cache_info():
+    hits = bake_cache_stats['hits']
+    misses = bake_cache_stats['misses']
+    total = hits + misses
+    return {'hits': hits, 'misses': misses, 'hit_rate': hits / total if total else 0.0,
+            'bake_time': bake_cache_stats['bake_time']}
+
+def bake_cache_report():
+    info = bake_cache_info()
+    print("bake cache: %d hit(s), %d miss(es), hit rate %.0f%%, baked in %.1f s"
+          % (info['hits'], info['misses'], info['hit_rate'] * 100, info['bake_time']))
+
+def fluid_modifier(obj):
+    for modifier in obj.modifiers:
+        if (modifier.type == 'FLUID'):
+            return modifier
+    return None
+
+def fluid_params(domain):
+    scene = bpy.context.scene
+    settings = fluid_modifier(domain).domain_settings
+    params = {
+        'fps': scene.render.fps,
+        'fps_base': round(scene.render.fps_base, 6),
+        'domain': object_values(domain),
+        'domain_settings': rna_values(settings),
+        'objects': [],
+    }
+    # every flow and effector in the scene can reach the domain
+    for obj in sorted(scene.objects, key=lambda o: o.name):
+        modifier = fluid_modifier(obj)
+        if (modifier is None or obj == domain):
+            continue
+        if (modifier.fluid_type == 'FLOW'):
+            settings = rna_values(modifier.flow_settings)
+        elif (modifier.fluid_type == 'EFFECTOR'):
+            settings = rna_values(modifier.effector_settings)
+        else:
+            continue
+        params['objects'].append(dict(object_values(obj), fluid_type=modifier.fluid_type, settings=settings))
+    return params
+
+@profiled
+def bake_fluid(domain, root=None):
+    settings = fluid_modifier(domain).domain_settings
+
+    def bake_all(directory):
+        settings.cache_directory = directory
+        settings.cache_type = 'ALL'
+        with bpy.context.temp_override(object=domain, active_object=domain):
+            bpy.ops.fluid.free_all()
+            bpy.ops.fluid.bake_all()
+
+    directory, hit = bake('fluid', fluid_params(domain), bake_all, root)
+    if (hit):
+        # a replay cache reads every frame that is already on disk instead of simulating it
+        settings.cache_type = 'REPLAY'
+        settings.cache_directory = directory
+    print("fluid cache %s: %s, resolution %d, baked in %.1f s, %.1f MB on disk"
+          % (os.path.basename(directory), "hit" if hit else "baked", settings.resolution_max,
+             read_manifest(directory)['bake_time'], directory_size(directory) / 2**20))
+    bake_cache_report()
+    return directory
@@ -0,0 +1,74 @@
+# compare the stacked ARRAY building with the geometry nodes lattice, evaluation time and memory
+# run with: python benchmarks/building_instancing.py --blender /path/to/blender
+import argparse
+
+from headless import ROOT, probe_report, run_blender
+SIZES = [(8, 8, 16), (32, 32, 64)]
+VARIANTS = ('array', 'instanced', 'realized')
+
+# runs inside blender, one process per case so peak memory is per case
+PROBE = """
+import json, resource, statistics, sys, time
+import bpy, bmesh
+sys.path.append({root!r})
+from building import add_lattice
+
+variant, x, y, z, repeat = {variant!r}, {x}, {y}, {z}, {repeat}
+baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+mesh = bpy.data.meshes.new("cell")
+obj = bpy.data.objects.new("building", mesh)
+bpy.context.scene.collection.objects.link(obj)
+bpy.context.view_layer.objects.active = obj
+bm = bmesh.new()
+bmesh.ops.create_cube(bm, size=2)
+bm.to_mesh(mesh)
+bm.free()
+
+if (variant == 'array'):
+    for axis, count in enumerate((x, y, z)):
+        array = obj.modifiers.new("Array", type='ARRAY')
+        array.count = count
+        array.relative_offset_displace = [float(i == axis) for i in range(3)]
+    obj.modifiers.new("Solidify", type='SOLIDIFY').thickness = 1
+    obj.modifiers.new("Wireframe", type='WIREFRAME').thickness = 0.2
+else:
+    obj.modifiers.new("Solidify", type='SOLIDIFY').thickness = 1
+    obj.modifiers.new("Wireframe", type='WIREFRAME').thickness = 0.2
+    add_lattice(obj, (x, y, z), realize=variant == 'realized')
+
+depsgraph = bpy.context.evaluated_depsgraph_get()
+start = time.perf_counter()
+depsgraph.update()
+first = time.perf_counter() - start
+times = []
+for _ in range(repeat):
+    mesh.update()
+    start = time.perf_counter()
+    depsgraph.update()
+    times.append(time.perf_counter() - start)
+memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline
+print("building_probe " + json.dumps({{'first': first, 'update': statistics.median(times), 'memory_kb': memory}}))
+"""
+
+def probe(blender, variant, size, repeat):
+    x, y, z = size
+    expr = PROBE.format(root=ROOT, variant=variant, x=x, y=y, z=z, repeat=repeat)
+    output = run_blender([blender, "-b", "--factory-startup", "--python-expr", expr])
+    return probe_report(output, "building_probe", "the probe")
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare ARRAY and geometry nodes building evaluation.")
+    parser.add_argument("--blender", default="blender")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    for size in SIZES:
+        print("%d x %d x %d" % size)
+        for variant in VARIANTS:
+            result = probe(args.blender, variant, size, args.repeat)
+            print("  %-10s first eval %8.1f ms  update %8.1f ms  peak memory +%8.1f MB"
+                  % (variant, result['first'] * 1000, result['update'] * 1000, result['memory_kb'] / 1024))
+
+if __name__ == "__main__":
+    main()
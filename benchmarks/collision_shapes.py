@@ -0,0 +1,53 @@
+# simulate physics.py frame by frame with the rack as one triangle mesh shape and as a compound of
+# primitive shapes, and compare the rigid body step time per frame
+# run with: python benchmarks/collision_shapes.py --blender /path/to/blender
+import argparse
+import os
+import re
+
+from headless import probe_report, run_blender, script_command
+
+MODES = ('mesh', 'compound')
+
+# steps forward one frame at a time, the way the simulation runs during a bake or a render
+PROBE = """
+import json, statistics, time
+import bpy
+
+scene = bpy.context.scene
+scene.frame_set(scene.frame_start)
+times = []
+for frame in range(scene.frame_start + 1, scene.frame_end + 1):
+    start = time.perf_counter()
+    scene.frame_set(frame)
+    times.append(time.perf_counter() - start)
+print("collision_probe " + json.dumps({'median': statistics.median(times), 'mean': statistics.mean(times),
+                                       'max': max(times), 'total': sum(times)}))
+"""
+
+def simulate(blender, mode, builder):
+    # POINT_CACHE_BAKE=0 keeps the rigid body world live instead of playing a bake back
+    env = dict(os.environ, PHYSICS_COLLISION=mode, PHYSICS_RACK_BUILDER=builder, POINT_CACHE_BAKE="0")
+    output = run_blender(script_command(blender, "physics.py", exprs=[PROBE]), env)
+    result = probe_report(output, "collision_probe", "physics.py")
+    shapes = re.search(r"collision: \S+ compound of (.*) parts", output)
+    result['shapes'] = shapes.group(1) if shapes else "triangle mesh"
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare rigid body step time for MESH and compound rack shapes.")
+    parser.add_argument("--blender", default="blender")
+    parser.add_argument("--builder", default='bmesh', choices=('bmesh', 'ops'), help="PHYSICS_RACK_BUILDER")
+    args = parser.parse_args()
+
+    results = {}
+    for mode in MODES:
+        results[mode] = simulate(args.blender, mode, args.builder)
+        result = results[mode]
+        print("%-9s per frame median %7.2f ms  mean %7.2f ms  max %7.2f ms  total %6.2f s  (%s)"
+              % (mode, result['median'] * 1000, result['mean'] * 1000, result['max'] * 1000, result['total'],
+                 result['shapes']))
+    print("compound speedup: %.2fx" % (results['mesh']['mean'] / results['compound']['mean']))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+# compare the lookup table color conversion with the per channel formula
+# run with: python benchmarks/colors_benchmark.py (no blender needed)
+import os, sys
+import timeit
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import colors
+
+def formula_hex_to_rgb(h, alpha=1):
+    r = (h & 0xff0000) >> 16
+    g = (h & 0x00ff00) >> 8
+    b = (h & 0x0000ff)
+    return tuple([colors.srgb_to_linearrgb(c/0xff) for c in (r,g,b)] + [alpha])
+
+def check_outputs(palette, tolerance=1e-7):
+    expected = np.array([formula_hex_to_rgb(int(h)) for h in palette])
+    scalar = np.array([colors.hex_to_rgb(int(h)) for h in palette])
+    vectorized = colors.hex_to_rgb_array(palette)
+    assert np.abs(scalar - expected).max() <= tolerance
+    assert np.abs(vectorized - expected).max() <= tolerance
+
+def benchmark(palette_size=5000, repeat=5):
+    rng = np.random.default_rng(0)
+    palette = rng.integers(0, 0x1000000, palette_size)
+    hexes = [int(h) for h in palette]
+    check_outputs(palette)
+
+    results = {
+        'formula': lambda: [formula_hex_to_rgb(h) for h in hexes],
+        # drop the cache so the table lookup itself is measured
+        'table': lambda: (colors.hex_to_rgb.cache_clear(), [colors.hex_to_rgb(h) for h in hexes]),
+        'numpy palette': lambda: colors.hex_to_rgb_array(palette),
+    }
+    for name, func in results.items():
+        seconds = min(timeit.repeat(func, number=1, repeat=repeat))
+        print('%-16s %8.3f ms  (%d colors)' % (name, seconds * 1000, palette_size))
+
+if __name__ == "__main__":
+    benchmark()
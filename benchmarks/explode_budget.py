@@ -0,0 +1,59 @@
+# scrub transformations.py at a few fragment budgets, simulated live and read from the baked point cache,
+# and compare per-frame evaluation time and peak memory
+# run with: python benchmarks/explode_budget.py --blender /path/to/blender
+import argparse
+import os
+import re
+import tempfile
+
+from headless import SCRIPTS, probe_report, run_blender, script_command
+
+# the 36k default and 4x that
+BUDGETS = (36000, 144000)
+
+# jumps back and forth over the range like a scrubbing user or a render chunk starting mid-sequence
+PROBE = """
+import json, resource, statistics, time
+import bpy
+
+scene = bpy.context.scene
+frames = [scene.frame_end // 2, scene.frame_start, scene.frame_end, scene.frame_end // 4, scene.frame_end * 3 // 4]
+times = []
+for frame in frames:
+    start = time.perf_counter()
+    scene.frame_set(frame)
+    times.append(time.perf_counter() - start)
+print("explode_probe " + json.dumps({
+    'frame_eval': statistics.median(times),
+    'frame_eval_max': max(times),
+    'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+}))
+"""
+
+def measure(blender, fragments, baked, cache_root):
+    env = dict(os.environ, EXPLODE_FRAGMENTS=str(fragments), POINT_CACHE_BAKE="1" if baked else "0",
+               BLENDER_BAKE_CACHE=cache_root)
+    script = "transformations.py"
+    output = run_blender(script_command(blender, script, SCRIPTS[script], exprs=[PROBE]), env)
+    result = probe_report(output, "explode_probe", script)
+    result['bake_time'] = sum(float(seconds) for seconds in
+                              re.findall(r"particles cache \w+: \w+, frames \d+-\d+, baked in ([0-9.]+) s", output))
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare live and baked explode evaluation per fragment budget.")
+    parser.add_argument("--blender", default="blender")
+    parser.add_argument("--budgets", type=int, nargs="+", default=BUDGETS)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as cache_root:
+        for fragments in args.budgets:
+            print("%d fragments per torus" % fragments)
+            for baked in (False, True):
+                result = measure(args.blender, fragments, baked, cache_root)
+                print("  %-5s frame eval median %8.1f ms  max %8.1f ms  peak memory %8.1f MB  bake %6.1f s"
+                      % ("baked" if baked else "live", result['frame_eval'] * 1000, result['frame_eval_max'] * 1000,
+                         result['peak_rss_mb'], result['bake_time']))
+
+if __name__ == "__main__":
+    main()
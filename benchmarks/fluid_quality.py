@@ -0,0 +1,34 @@
+# bake a fluid script once per quality profile and compare bake time and cache size
+# run with: python benchmarks/fluid_quality.py --blender /path/to/blender --script washing_text.py
+import argparse
+import os
+import re
+import tempfile
+
+from headless import run_blender, script_command
+
+PROFILES = ('preview', 'draft', 'final')
+
+def bake(blender, script, operator, profile, cache_root):
+    env = dict(os.environ, BLENDER_BAKE_CACHE=cache_root)
+    output = run_blender(script_command(blender, script, operator, args=["--quality", profile, "--rebake"]), env)
+    match = re.search(r"fluid cache \w+: \w+, resolution (\d+), baked in ([0-9.]+) s, ([0-9.]+) MB on disk", output)
+    if (match is None):
+        raise RuntimeError("%s did not report a fluid bake:\n%s" % (script, output))
+    return int(match.group(1)), float(match.group(2)), float(match.group(3))
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare fluid bake time and cache size per quality profile.")
+    parser.add_argument("--blender", default="blender")
+    parser.add_argument("--script", default="washing_text.py")
+    parser.add_argument("--operator", help="operator the script registers, e.g. object.water_balancing")
+    parser.add_argument("--profiles", nargs="+", default=PROFILES, choices=PROFILES)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as cache_root:
+        for profile in args.profiles:
+            resolution, seconds, size = bake(args.blender, args.script, args.operator, profile, cache_root)
+            print("%-8s resolution %3d  bake %7.1f s  cache %8.1f MB" % (profile, resolution, seconds, size))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+# count how often each script's scene setup moves the scene to another frame,
+# every frame change re-evaluates the rigid body, cloth, fluid and particle caches
+# run with: python benchmarks/frame_changes.py --blender /path/to/blender --max 0
+import argparse
+import re
+import sys
+
+from headless import REMOVE_DEFAULT_CUBE, ROOT, SCRIPTS, run_blender, script_command
+
+START = REMOVE_DEFAULT_CUBE + "; import sys; sys.path.append(%r); from keyframes import count_frame_changes; count_frame_changes()" % ROOT
+REPORT = "from keyframes import frame_change_report; frame_change_report()"
+
+def frame_changes(blender, script, operator):
+    output = run_blender(script_command(blender, script, operator, start=START, exprs=[REPORT]))
+    match = re.search(r"frame changes: (\d+)", output)
+    if (match is None):
+        raise RuntimeError("%s did not report its frame changes:\n%s" % (script, output))
+    return int(match.group(1))
+
+def main():
+    parser = argparse.ArgumentParser(description="Count the frame changes each script's scene setup triggers.")
+    parser.add_argument("--blender", default="blender")
+    parser.add_argument("--scripts", nargs="+", default=list(SCRIPTS), choices=list(SCRIPTS))
+    parser.add_argument("--max", type=int, help="fail when a script changes frame more often than this")
+    args = parser.parse_args()
+
+    failed = []
+    for script in args.scripts:
+        count = frame_changes(args.blender, script, SCRIPTS[script])
+        over = args.max is not None and count > args.max
+        print("%-28s %6d%s" % (script, count, "  over budget" if over else ""))
+        if (over):
+            failed.append(script)
+    if (failed):
+        sys.exit("%d script(s) over %d frame changes: %s" % (len(failed), args.max, ", ".join(failed)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+# what the benchmarks share: the effect scripts, the command that runs one headless
+# and the json line a probe prints back
+import json
+import os
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# script -> operator it registers, the setup of those runs in execute()
+SCRIPTS = {
+    'bubbles.py': None,
+    'chipped_texture.py': None,
+    'cracks.py': None,
+    'create_sparkle.py': None,
+    'dynamic_paint_dissolve.py': None,
+    'expanding_holes.py': None,
+    'following_orbs.py': None,
+    'physics.py': None,
+    'scroll.py': None,
+    'terrain.py': None,
+    'transformations.py': 'object.transformations',
+    'washing_text.py': None,
+    'water_balancing.py': 'object.water_balancing',
+}
+# the scripts expect the startup scene without its default cube
+REMOVE_DEFAULT_CUBE = "import bpy; cube = bpy.data.objects.get('Cube'); cube and bpy.data.objects.remove(cube)"
+
+def script_command(blender, script, operator=None, start=REMOVE_DEFAULT_CUBE, exprs=(), args=()):
+    # start runs before the script, exprs after it and its operator, args go to the script after "--"
+    command = [blender, "-b", "--factory-startup", "--python-expr", start, "--python", os.path.join(ROOT, script)]
+    if (operator):
+        command += ["--python-expr", "import bpy; bpy.ops.%s()" % operator]
+    for expr in exprs:
+        command += ["--python-expr", expr]
+    if (args):
+        command += ["--"] + list(args)
+    return command
+
+def run_blender(command, env=None):
+    # washing_text.py and scroll.py load their files relative to the repository
+    return subprocess.run(command, env=env, cwd=ROOT, capture_output=True, text=True, check=True).stdout
+
+def probe_report(output, prefix, name):
+    # a probe prints one "<prefix> <json>" line
+    for line in output.splitlines():
+        if (line.startswith(prefix + " ")):
+            return json.loads(line[len(prefix) + 1:])
+    raise RuntimeError("%s did not report:\n%s" % (name, output))
@@ -0,0 +1,111 @@
+# run an effect script headless with every bpy.ops call logged, then rank the call sites by total time
+# and name the data API call that does the same without context polling, undo pushes and redraws
+# python benchmarks/ops_report.py physics.py
+# python benchmarks/ops_report.py water_balancing.py --operator object.water_balancing --top 30 --json ops.json
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from headless import REMOVE_DEFAULT_CUBE, ROOT, script_command
+
+START = REMOVE_DEFAULT_CUBE + "; import sys; sys.path.append(%r); import profiling; profiling.log_ops()" % ROOT
+WRITE = "import profiling; profiling.write_ops_log(%r)"
+
+# operator -> data API equivalent, prefixes end with "_"
+EQUIVALENTS = {
+    'transform.translate': "obj.location += Vector(value), mesh.transform(Matrix.Translation(value)) for edit mode data",
+    'transform.resize': "obj.scale *= value, mesh.transform(Matrix.Diagonal(value).to_4x4()) for edit mode data",
+    'transform.rotate': "obj.rotation_euler, mesh.transform(Matrix.Rotation(angle, 4, axis)) for edit mode data",
+    'object.mode_set': "bmesh.new() / bm.from_mesh(mesh) / bm.to_mesh(mesh), no mode switch",
+    'object.modifier_add': "obj.modifiers.new(name, type)",
+    'object.modifier_apply': "bpy.data.meshes.new_from_object(obj.evaluated_get(depsgraph))",
+    'object.convert': "bpy.data.meshes.new_from_object(obj.evaluated_get(depsgraph))",
+    'object.shade_smooth': "mesh.shade_smooth()",
+    'object.shade_flat': "mesh.shade_flat()",
+    'object.subdivision_set': "obj.modifiers.new('Subdivision', 'SUBSURF').levels = level",
+    'object.delete': "bpy.data.objects.remove(obj)",
+    'object.join': "bmesh.ops.duplicate into one bmesh, bm.to_mesh(mesh)",
+    'object.select_all': "obj.select_set(state) per object",
+    'object.material_slot_remove': "obj.data.materials.clear()",
+    'object.particle_system_add': "obj.modifiers.new(name, 'PARTICLE_SYSTEM')",
+    'object.effector_add': "bpy.data.objects.new(name, None), obj.field.type = type",
+    'object.text_add': "bpy.data.objects.new(name, bpy.data.curves.new(name, 'FONT'))",
+    'object.light_add': "bpy.data.objects.new(name, bpy.data.lights.new(name, type))",
+    'mesh.select_all': "mesh.vertices.foreach_set('select', ...) or bmesh element .select",
+    'mesh.subdivide': "bmesh.ops.subdivide_edges(bm, edges=..., cuts=n, use_grid_fill=True)",
+    'mesh.delete': "bmesh.ops.delete(bm, geom=..., context=...)",
+    'mesh.extrude_region_move': "bmesh.ops.extrude_face_region + bmesh.ops.translate",
+    'mesh.loopcut_slide': "bmesh.ops.subdivide_edges on the ring from bmesh.ops.bisect_plane or edge loops",
+    'mesh.primitive_': "bmesh.ops.create_* into a bpy.data.meshes.new mesh, bpy.data.objects.new",
+    'anim.keyframe_insert_by_name': "keyframes.insert_keys(obj, path, frames, values)",
+    'anim.keyframe_insert': "keyframes.insert_keys(obj, path, frames, values)",
+    'rigidbody.object_add': "scene.rigidbody_world.collection.objects.link(obj)",
+    'rigidbody.world_add': "scene.rigidbody_world is created once, settings set directly",
+}
+
+def equivalent(op):
+    if (op in EQUIVALENTS):
+        return EQUIVALENTS[op]
+    for prefix, suggestion in EQUIVALENTS.items():
+        if (prefix.endswith("_") and op.startswith(prefix)):
+            return suggestion
+    return None
+
+def run(args, log_path):
+    command = script_command(args.blender, args.script, args.operator, start=START, exprs=[WRITE % log_path])
+    # not checked, a failing script still has its output printed below
+    result = subprocess.run(command, cwd=ROOT, capture_output=True, text=True)
+    if (not os.path.isfile(log_path)):
+        sys.exit("%s did not finish, blender output:\n%s%s" % (args.script, result.stdout, result.stderr))
+    with open(log_path) as f:
+        return json.load(f)
+
+def call_sites(log):
+    # calls from the --python-expr lines are left out, the operator a script registers contains all the others
+    sites = {}
+    for call in log:
+        if (not os.path.isabs(call['file']) or not call['file'].startswith(ROOT + os.sep)):
+            continue
+        key = (os.path.relpath(call['file'], ROOT), call['line'], call['op'])
+        site = sites.setdefault(key, {'file': key[0], 'line': key[1], 'op': key[2], 'calls': 0, 'time': 0.0,
+                                      'modes': [], 'equivalent': equivalent(key[2])})
+        site['calls'] += 1
+        site['time'] += call['time']
+        if (call['mode'] not in site['modes']):
+            site['modes'].append(call['mode'])
+    return sorted(sites.values(), key=lambda site: -site['time'])
+
+def report(sites, top):
+    total = sum(site['time'] for site in sites)
+    replaceable = sum(site['time'] for site in sites if site['equivalent'])
+    print("%d operator calls from %d call sites, %.3f s" % (sum(site['calls'] for site in sites), len(sites), total))
+    print("%.3f s (%.0f%%) in calls with a data API equivalent" % (replaceable, replaceable / total * 100 if total else 0))
+    print()
+    for site in sites[:top]:
+        location = "%s:%d" % (site['file'], site['line'])
+        print("%8.3f s %5d x  %-28s %-32s %s" % (site['time'], site['calls'], location, site['op'], ",".join(site['modes'])))
+        if (site['equivalent']):
+            print("%18s-> %s" % ("", site['equivalent']))
+
+def main():
+    parser = argparse.ArgumentParser(description="Log the bpy.ops calls of an effect script and rank them by cost.")
+    parser.add_argument("script", help="effect script, relative to the repository")
+    parser.add_argument("--operator", help="operator the script registers, e.g. object.water_balancing")
+    parser.add_argument("--top", type=int, default=20, help="call sites to list")
+    parser.add_argument("--json", help="also write the ranked call sites here")
+    parser.add_argument("--blender", default="blender")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        log = run(args, os.path.join(directory, "ops.json"))
+    sites = call_sites(log)
+    report(sites, args.top)
+    if (args.json):
+        with open(args.json, 'w') as f:
+            json.dump(sites, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+# time physics.py scene setup with the operator built rack and the bmesh built rack
+# run with: python benchmarks/physics_setup.py --blender /path/to/blender --repeat 3
+import argparse
+import os
+import re
+import statistics
+
+from headless import run_blender, script_command
+
+def setup_time(blender, builder):
+    env = dict(os.environ, PHYSICS_RACK_BUILDER=builder)
+    output = run_blender(script_command(blender, "physics.py"), env)
+    match = re.search(r"scene setup \(\w+ rack\): ([0-9.]+) s", output)
+    if (match is None):
+        raise RuntimeError("physics.py did not report its setup time:\n" + output)
+    return float(match.group(1))
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare physics.py scene setup time for both rack builders.")
+    parser.add_argument("--blender", default="blender")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    results = {}
+    for builder in ('ops', 'bmesh'):
+        results[builder] = [setup_time(args.blender, builder) for _ in range(args.repeat)]
+        print("%-6s median %.3f s  (%s)" % (builder, statistics.median(results[builder]),
+                                           ", ".join("%.3f" % t for t in results[builder])))
+    print("speedup %.1fx" % (statistics.median(results['ops']) / statistics.median(results['bmesh'])))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+# time every effect script headless: scene build, first depsgraph evaluation, sampled frames
+# rendered with cycles on the cpu, and peak memory, written to json and compared with a baseline
+# python benchmarks/scene_build.py --blender /path/to/blender --output results.json --save-baseline baseline.json
+# python benchmarks/scene_build.py --blender /path/to/blender --output results.json --baseline baseline.json
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+from headless import REMOVE_DEFAULT_CUBE, SCRIPTS, probe_report, run_blender, script_command
+
+METRICS = ('build', 'first_eval', 'frame_eval', 'frame_render', 'peak_rss_mb')
+
+# runs before the effect script, the state survives in driver_namespace until the probe reads it
+START = REMOVE_DEFAULT_CUBE + "; import time; bpy.app.driver_namespace['scene_probe'] = time.perf_counter()"
+
+PROBE = """
+import json, resource, statistics, tempfile, time
+import bpy
+
+build = time.perf_counter() - bpy.app.driver_namespace.pop('scene_probe')
+scene = bpy.context.scene
+# the script has evaluated its scene by now, the first evaluation is timed on a fresh load of this copy
+bpy.ops.wm.save_as_mainfile(filepath={blend!r}, copy=True)
+
+scene.render.engine = 'CYCLES'
+scene.cycles.device = 'CPU'
+scene.cycles.samples = {samples}
+scene.render.resolution_percentage = {resolution}
+scene.render.filepath = tempfile.mkdtemp()
+count = {frames}
+frames = sorted({{scene.frame_start + round((scene.frame_end - scene.frame_start) * i / max(count - 1, 1)) for i in range(count)}})
+evals, renders = [], []
+for frame in frames:
+    start = time.perf_counter()
+    scene.frame_set(frame)
+    evals.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    bpy.ops.render.render(write_still=False)
+    renders.append(time.perf_counter() - start)
+
+print("scene_probe " + json.dumps({{
+    'build': build,
+    'frames': frames,
+    'frame_eval': statistics.median(evals),
+    'frame_render': statistics.median(renders),
+    'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+}}))
+"""
+
+# opening a file does not evaluate it in background mode, so this is the whole first evaluation
+FIRST_EVAL = """
+import json, time
+import bpy
+
+start = time.perf_counter()
+bpy.context.evaluated_depsgraph_get().update()
+print("first_eval_probe " + json.dumps(time.perf_counter() - start))
+"""
+
+def measure(blender, script, operator, frames, samples, resolution):
+    with tempfile.TemporaryDirectory() as scratch:
+        blend = os.path.join(scratch, "scene.blend")
+        probe = PROBE.format(frames=frames, samples=samples, resolution=resolution, blend=blend)
+        output = run_blender(script_command(blender, script, operator, start=START, exprs=[probe]))
+        result = probe_report(output, "scene_probe", script)
+        output = run_blender([blender, "-b", "--factory-startup", blend, "--python-expr", FIRST_EVAL])
+        result['first_eval'] = probe_report(output, "first_eval_probe", script)
+    return result
+
+def compare(results, baseline, tolerance):
+    # a metric regresses when it grew by more than tolerance, 0.2 means 20% slower or larger
+    regressions = []
+    for script, result in results.items():
+        if (script not in baseline):
+            continue
+        for metric in METRICS:
+            before = baseline[script].get(metric)
+            if (not before):
+                continue
+            ratio = result[metric] / before
+            if (ratio > 1 + tolerance):
+                regressions.append((script, metric, before, result[metric], ratio))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark scene build, evaluation, rendering and memory of every effect script.")
+    parser.add_argument("--blender", default="blender")
+    parser.add_argument("--scripts", nargs="+", default=list(SCRIPTS), choices=list(SCRIPTS))
+    parser.add_argument("--frames", type=int, default=3, help="frames sampled across the scene range")
+    parser.add_argument("--samples", type=int, default=8)
+    parser.add_argument("--resolution", type=int, default=50, help="render resolution percentage")
+    parser.add_argument("--output", default="scene_build.json")
+    parser.add_argument("--baseline", help="results of an earlier run to compare against")
+    parser.add_argument("--save-baseline", help="also write the results here")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    results = {}
+    for script in args.scripts:
+        result = measure(args.blender, script, SCRIPTS[script], args.frames, args.samples, args.resolution)
+        results[script] = result
+        print("%-28s build %7.2f s  first eval %7.2f s  frame eval %7.2f s  render %7.2f s  peak %8.1f MB"
+              % (script, result['build'], result['first_eval'], result['frame_eval'], result['frame_render'], result['peak_rss_mb']))
+
+    for path in filter(None, (args.output, args.save_baseline)):
+        with open(path, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if (args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for script, metric, before, after, ratio in regressions:
+            print("regression %-28s %-12s %10.2f -> %10.2f (%.2fx)" % (script, metric, before, after, ratio))
+        if (regressions):
+            sys.exit("%d metric(s) regressed by more than %.0f%%" % (len(regressions), args.tolerance * 100))
+        print("no regressions against %s" % args.baseline)
+
+if __name__ == "__main__":
+    main()
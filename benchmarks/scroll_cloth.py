@@ -0,0 +1,51 @@
+# compare scroll.py's cloth simulated on the display mesh and on the coarse proxy:
+# bake time, per-frame cost simulated live, and per-frame cost read back from the bake
+# run with: python benchmarks/scroll_cloth.py --blender /path/to/blender --quality draft
+import argparse
+import os
+import re
+import tempfile
+
+from headless import probe_report, run_blender, script_command
+
+MODES = ('full', 'proxy')
+
+# steps forward one frame at a time, the way a bake or a render goes through the cloth
+PROBE = """
+import json, statistics, time
+import bpy
+
+scene = bpy.context.scene
+scene.frame_set(scene.frame_start)
+times = []
+for frame in range(scene.frame_start + 1, scene.frame_end + 1):
+    start = time.perf_counter()
+    scene.frame_set(frame)
+    times.append(time.perf_counter() - start)
+print("cloth_probe " + json.dumps({'median': statistics.median(times), 'total': sum(times)}))
+"""
+
+def run(blender, mode, quality, baked, cache_root):
+    env = dict(os.environ, SCROLL_CLOTH=mode, POINT_CACHE_BAKE="1" if baked else "0", BLENDER_BAKE_CACHE=cache_root)
+    output = run_blender(script_command(blender, "scroll.py", exprs=[PROBE], args=["--quality", quality]), env)
+    result = probe_report(output, "cloth_probe", "scroll.py")
+    bake = re.search(r"cloth cache \w+: \w+, frames \d+-\d+, baked in ([0-9.]+) s, ([0-9.]+) MB on disk", output)
+    result['bake_time'] = float(bake.group(1)) if bake else None
+    result['cache_mb'] = float(bake.group(2)) if bake else None
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare scroll.py cloth on the display mesh and on the proxy.")
+    parser.add_argument("--blender", default="blender")
+    parser.add_argument("--quality", default='draft', help="quality profile, sets the proxy resolution")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as cache_root:
+        for mode in MODES:
+            live = run(args.blender, mode, args.quality, False, cache_root)
+            baked = run(args.blender, mode, args.quality, True, cache_root)
+            print("%-6s live %8.1f ms/frame  baked %7.1f ms/frame  bake %7.1f s  cache %7.1f MB"
+                  % (mode, live['median'] * 1000, baked['median'] * 1000, baked['bake_time'], baked['cache_mb']))
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,11 @@ import bpy
 import mathutils
 from mathutils import Vector
 import math
+import os, sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from materials import cached_material
+from point_cache import bake_scene_particles
 
 def eulerToDegree(euler):
     return ( (euler) / (2 * math.pi) ) * 360
@@ -9,17 +14,6 @@ def eulerToDegree(euler):
 def degreeToEuler(degree):
     return degree / 180 * math.pi
 
-def srgb_to_linearrgb(c):
-    if   c < 0:       return 0
-    elif c < 0.04045: return c/12.92
-    else:             return ((c+0.055)/1.055)**2.4
-
-def hex_to_rgb(h,alpha=1):
-    r = (h & 0xff0000) >> 16
-    g = (h & 0x00ff00) >> 8
-    b = (h & 0x0000ff)
-    return tuple([srgb_to_linearrgb(c/0xff) for c in (r,g,b)] + [alpha])
-
 def background_settings():
     nodes = bpy.data.worlds["World"].node_tree.nodes
     links = bpy.data.worlds["World"].node_tree.links
@@ -31,6 +25,7 @@ def background_settings():
     env_node.image = forest
     links.new(env_node.outputs[0], background.inputs['Color'])
 
+@cached_material
 def principled_material(color=(0.8, 0.8, 0.8, 1), roughness=0.5):
     material = bpy.data.materials.new(name="Principled")
     material.use_nodes = True
@@ -75,6 +70,7 @@ def render(engine, frame_end, samples=32):
         scene.cycles.preview_samples = samples
         scene.cycles.samples = samples
 
+@cached_material
 def bubbles_material(color=(0.8, 0.8, 0.8, 1), roughness=0):
     material = bpy.data.materials.new(name="Principled")
     material.use_nodes = True
@@ -167,3 +163,5 @@ camera = bpy.data.objects['Camera']
 camera.data.lens = 300
 background_settings()
 render('BLENDER_EEVEE', 210)
+# the boids are baked once, any frame then loads from disk
+bake_scene_particles()
@@ -0,0 +1,118 @@
+import bpy
+
+from node_graph import build_node_tree, math_spec
+
+# one cell mesh placed on a lattice of points by geometry nodes, the cell's own modifiers
+# (solidify, wireframe) run once and every lattice point shares the result as an instance
+LATTICE_GROUP = "building_lattice"
+
+# group input sockets, in interface order
+_INPUTS = [
+    ("Geometry", 'NodeSocketGeometry', None),
+    ("Count X", 'NodeSocketInt', 1),
+    ("Count Y", 'NodeSocketInt', 1),
+    ("Count Z", 'NodeSocketInt', 1),
+    ("Offset X", 'NodeSocketVector', (2, 0, 0)),
+    ("Offset Y", 'NodeSocketVector', (0, 2, 0)),
+    ("Offset Z", 'NodeSocketVector', (0, 0, 2)),
+    ("Realize", 'NodeSocketBool', False),
+]
+
+def _vector_spec(operation, inputs=None):
+    spec = {'type': 'ShaderNodeVectorMath', 'props': {'operation': operation}}
+    if (inputs):
+        spec['inputs'] = inputs
+    return spec
+
+def lattice_node_group():
+    group = bpy.data.node_groups.get(LATTICE_GROUP)
+    if (group is not None):
+        return group
+    group = bpy.data.node_groups.new(LATTICE_GROUP, 'GeometryNodeTree')
+    for name, socket_type, default in _INPUTS:
+        socket = group.interface.new_socket(name=name, in_out='INPUT', socket_type=socket_type)
+        if (default is not None):
+            socket.default_value = default
+        if (socket_type == 'NodeSocketInt'):
+            socket.min_value = 1
+    group.interface.new_socket(name="Geometry", in_out='OUTPUT', socket_type='NodeSocketGeometry')
+
+    # point i sits at (i % x) * offset_x + (i // x % y) * offset_y + (i // (x * y)) * offset_z
+    graph = {
+        'nodes': {
+            'input': {'type': 'NodeGroupInput'},
+            'output': {'type': 'NodeGroupOutput'},
+            'count_xy': math_spec('MULTIPLY'),
+            'count': math_spec('MULTIPLY'),
+            'points': {'type': 'GeometryNodePoints'},
+            'index': {'type': 'GeometryNodeInputIndex'},
+            'ix': math_spec('MODULO'),
+            'row': math_spec('DIVIDE'),
+            'row_floor': math_spec('FLOOR'),
+            'iy': math_spec('MODULO'),
+            'layer': math_spec('DIVIDE'),
+            'iz': math_spec('FLOOR'),
+            'x': _vector_spec('SCALE'),
+            'y': _vector_spec('SCALE'),
+            'z': _vector_spec('SCALE'),
+            'xy': _vector_spec('ADD'),
+            'xyz': _vector_spec('ADD'),
+            'instance': {'type': 'GeometryNodeInstanceOnPoints'},
+            'realize': {'type': 'GeometryNodeRealizeInstances'},
+            'switch': {'type': 'GeometryNodeSwitch', 'props': {'input_type': 'GEOMETRY'}},
+        },
+        'links': [
+            ('input', 1, 'count_xy', 0),
+            ('input', 2, 'count_xy', 1),
+            ('count_xy', 0, 'count', 0),
+            ('input', 3, 'count', 1),
+            ('count', 0, 'points', 'Count'),
+            ('index', 0, 'ix', 0),
+            ('input', 1, 'ix', 1),
+            ('index', 0, 'row', 0),
+            ('input', 1, 'row', 1),
+            ('row', 0, 'row_floor', 0),
+            ('row_floor', 0, 'iy', 0),
+            ('input', 2, 'iy', 1),
+            ('row_floor', 0, 'layer', 0),
+            ('input', 2, 'layer', 1),
+            ('layer', 0, 'iz', 0),
+            ('input', 4, 'x', 0),
+            ('ix', 0, 'x', 'Scale'),
+            ('input', 5, 'y', 0),
+            ('iy', 0, 'y', 'Scale'),
+            ('input', 6, 'z', 0),
+            ('iz', 0, 'z', 'Scale'),
+            ('x', 0, 'xy', 0),
+            ('y', 0, 'xy', 1),
+            ('xy', 0, 'xyz', 0),
+            ('z', 0, 'xyz', 1),
+            ('xyz', 0, 'points', 'Position'),
+            ('points', 0, 'instance', 'Points'),
+            ('input', 0, 'instance', 'Instance'),
+            ('instance', 0, 'realize', 0),
+            ('input', 7, 'switch', 'Switch'),
+            ('instance', 0, 'switch', 'False'),
+            ('realize', 0, 'switch', 'True'),
+            ('switch', 0, 'output', 0),
+        ],
+    }
+    build_node_tree(group, graph)
+    return group
+
+def cell_size(obj):
+    # local bounding box of the cell mesh, what an ARRAY modifier's relative offset is measured in
+    co = [v.co for v in obj.data.vertices]
+    return [max(c[axis] for c in co) - min(c[axis] for c in co) for axis in range(3)]
+
+def add_lattice(obj, counts, relative_offsets=((1, 0, 0), (0, 1, 0), (0, 0, 1)), realize=False):
+    # counts and relative_offsets work like three stacked ARRAY modifiers with relative offset,
+    # realize only when a later modifier (dynamic paint) needs real geometry
+    size = cell_size(obj)
+    modifier = obj.modifiers.new("Lattice", type='NODES')
+    modifier.node_group = lattice_node_group()
+    values = list(counts) + [[o * s for o, s in zip(offset, size)] for offset in relative_offsets] + [realize]
+    for item, value in zip([i for i in modifier.node_group.interface.items_tree if i.in_out == 'INPUT'][1:], values):
+        modifier[item.identifier] = value
+    obj.update_tag()
+    return modifier
@@ -2,6 +2,13 @@ import bpy
 import mathutils
 from mathutils import Vector
 import math
+import os, sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from colors import hex_to_rgb
+from keyframes import insert_keys
+from materials import cached_material
+from node_graph import build_material, material_build_report, math_spec
 
 def eulerToDegree(euler):
     return ( (euler) / (2 * math.pi) ) * 360
@@ -9,22 +16,6 @@ def eulerToDegree(euler):
 def degreeToEuler(degree):
     return degree / 180 * math.pi
 
-def srgb_to_linearrgb(c):
-    if   c < 0:       return 0
-    elif c < 0.04045: return c/12.92
-    else:             return ((c+0.055)/1.055)**2.4
-
-def hex_to_rgb(h,alpha=1):
-    r = (h & 0xff0000) >> 16
-    g = (h & 0x00ff00) >> 8
-    b = (h & 0x0000ff)
-    return tuple([srgb_to_linearrgb(c/0xff) for c in (r,g,b)] + [alpha])
-
-def math_node(nodes, operation):
-    math_node = nodes.new(type='ShaderNodeMath')
-    math_node.operation = operation
-    return math_node
-
 def render(engine, frame_end, samples=32):
     scene = bpy.context.scene
     scene.frame_end = frame_end
@@ -54,70 +45,51 @@ def background_settings(color=(0, 0, 0, 1), image_path=bpy.utils.resource_path('
     else:
         background.inputs[0].default_value = color
 
+@cached_material
 def chipped_material():
-    material = bpy.data.materials.new(name="chipped")
-    material.use_nodes = True
-    nodes = material.node_tree.nodes
-    links = material.node_tree.links
-
-    nodes.clear()
-    output_node = nodes.new(type='ShaderNodeOutputMaterial')
-    principled_node = nodes.new(type='ShaderNodeBsdfPrincipled')
-    principled_node.inputs['Base Color'].default_value = hex_to_rgb(0xff0000)
-    principled_node1 = nodes.new(type='ShaderNodeBsdfPrincipled')
-    #principled_node1.inputs['Base Color'].default_value = chipped_color
+    graph = {
+        'nodes': {
+            'output': {'type': 'ShaderNodeOutputMaterial'},
+            'principled': {'type': 'ShaderNodeBsdfPrincipled', 'inputs': {'Base Color': hex_to_rgb(0xff0000)}},
+            'principled1': {'type': 'ShaderNodeBsdfPrincipled'},
+            # large detail, edge jagged, rough, detail
+            'noise': {'type': 'ShaderNodeTexNoise', 'inputs': {'Scale': 5, 'Detail': 5}},
+            # control chipped area, smaller value, more chipped area
+            'greater_than': math_spec('GREATER_THAN', {1: 0.61}),
+            # control how much flat area, large value, more flat area
+            'maximum': math_spec('MAXIMUM', {1: 0.6}),
+            # control chipped area smoothness, larger value, chipped area will rough
+            'minimum': math_spec('MINIMUM', {1: 0.61}),
+            'mix': {'type': 'ShaderNodeMixShader'},
+            # control depth, 0 would be flat
+            'displacement': {'type': 'ShaderNodeDisplacement', 'inputs': {'Scale': -5}},
+        },
+        'links': [
+            ('noise', 'Fac', 'greater_than', 0),
+            ('noise', 'Fac', 'maximum', 0),
+            ('maximum', 0, 'minimum', 0),
+            ('greater_than', 0, 'mix', 0),
+            ('principled', 0, 'mix', 1),
+            ('principled1', 0, 'mix', 2),
+            ('minimum', 0, 'displacement', 'Height'),
+            ('mix', 0, 'output', 0),
+            ('displacement', 0, 'output', 'Displacement'),
+        ],
+    }
+    material, nodes = build_material("chipped", graph)
 
-    noise_node = material.node_tree.nodes.new(type='ShaderNodeTexNoise')
-    noise_node.inputs['Scale'].default_value = 5
-    # large value, edge jagged, rough, detail
-    noise_node.inputs['Detail'].default_value = 10
     # animation
-    noise_node.inputs['Scale'].default_value = 5
-    noise_node.inputs['Detail'].default_value = 5
-    noise_node.inputs['Scale'].keyframe_insert("default_value", frame=1)
-    noise_node.inputs['Detail'].keyframe_insert("default_value", frame=1)
-    noise_node.inputs['Scale'].default_value = 20
-    noise_node.inputs['Detail'].default_value = 0
-    noise_node.inputs['Scale'].keyframe_insert("default_value", frame=120)
-    noise_node.inputs['Detail'].keyframe_insert("default_value", frame=120)
-    noise_node.inputs['Scale'].default_value = 5
-    noise_node.inputs['Detail'].default_value = 0
-    noise_node.inputs['Scale'].keyframe_insert("default_value", frame=210)
-    noise_node.inputs['Detail'].keyframe_insert("default_value", frame=210)
-
-    greater_than = math_node(nodes, 'GREATER_THAN')
-    # control chipped area, smaller value, more chipped area
-    greater_than.inputs[1].default_value = 0.61
-
-    maximum = math_node(nodes, 'MAXIMUM')
-    # control how much flat area, large value, more flat area
-    maximum.inputs[1].default_value = 0.6
-
-    links.new(greater_than.inputs[0], noise_node.outputs['Fac'])
-    links.new(maximum.inputs[0], noise_node.outputs['Fac'])
-
-    minimum = math_node(nodes, 'MINIMUM')
-    # control chipped area smoothness, larger value, chipped area will rough
-    minimum.inputs[1].default_value = 0.61
-    links.new(minimum.inputs[0], maximum.outputs[0])
-
-    mix_node = nodes.new(type='ShaderNodeMixShader')
-    links.new(mix_node.inputs[0], greater_than.outputs[0])
-    links.new(mix_node.inputs[1], principled_node.outputs[0]) 
-    links.new(mix_node.inputs[2], principled_node1.outputs[0])
-
-    displacement_node = nodes.new(type='ShaderNodeDisplacement')
-    # control depth, 0 would be flat
-    displacement_node.inputs['Scale'].default_value = -5
-    links.new(minimum.outputs[0], displacement_node.inputs['Height'])
-
-    links.new(mix_node.outputs[0], output_node.inputs[0])
-    links.new(displacement_node.outputs[0], output_node.inputs['Displacement'])
+    noise_node = nodes['noise']
+    scale = noise_node.inputs['Scale']
+    detail = noise_node.inputs['Detail']
+    insert_keys(scale, 'default_value', [1, 120, 210], [scale.default_value, 20, 5])
+    insert_keys(detail, 'default_value', [1, 120, 210], [detail.default_value, 0, 0])
     return material
 
 bpy.ops.mesh.primitive_cube_add(enter_editmode=False, align='WORLD', location=(0, 0, 0), scale=(1.2, 1.2, 1.2))
 
 material = chipped_material()
 bpy.context.object.data.materials.append(material)
+material_build_report()
 render('BLENDER_EEVEE', 210)
 background_settings(color='TexSky')
@@ -0,0 +1,30 @@
+from functools import lru_cache
+
+import numpy as np
+
+def srgb_to_linearrgb(c):
+    if   c < 0:       return 0
+    elif c < 0.04045: return c/12.92
+    else:             return ((c+0.055)/1.055)**2.4
+
+# linear value of every 8 bit sRGB channel, computed once at import
+SRGB_TO_LINEAR = tuple(srgb_to_linearrgb(c/0xff) for c in range(256))
+SRGB_TO_LINEAR_ARRAY = np.array(SRGB_TO_LINEAR, dtype=np.float64)
+
+@lru_cache(maxsize=1024)
+def hex_to_rgb(h, alpha=1):
+    r = (h & 0xff0000) >> 16
+    g = (h & 0x00ff00) >> 8
+    b = (h & 0x0000ff)
+    return (SRGB_TO_LINEAR[r], SRGB_TO_LINEAR[g], SRGB_TO_LINEAR[b], alpha)
+
+def hex_to_rgb_array(palette, alpha=1, dtype=np.float32):
+    # convert a whole palette of hex codes in one call, returns an (n, 4) array
+    # ready for foreach_set on color attributes or per instance colors
+    palette = np.asarray(palette, dtype=np.uint32)
+    rgba = np.empty(palette.shape + (4,), dtype=dtype)
+    rgba[..., 0] = SRGB_TO_LINEAR_ARRAY[(palette >> 16) & 0xff]
+    rgba[..., 1] = SRGB_TO_LINEAR_ARRAY[(palette >> 8) & 0xff]
+    rgba[..., 2] = SRGB_TO_LINEAR_ARRAY[palette & 0xff]
+    rgba[..., 3] = alpha
+    return rgba
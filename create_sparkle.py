@@ -2,6 +2,13 @@ import bpy
 import mathutils
 from mathutils import Vector
 import math
+import os, sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from colors import hex_to_rgb
+from keyframes import insert_keys
+from materials import cached_material
+from point_cache import bake_scene_particles
 
 def eulerToDegree(euler):
     return ( (euler) / (2 * math.pi) ) * 360
@@ -9,17 +16,7 @@ def eulerToDegree(euler):
 def degreeToEuler(degree):
     return degree / 180 * math.pi
 
-def srgb_to_linearrgb(c):
-    if   c < 0:       return 0
-    elif c < 0.04045: return c/12.92
-    else:             return ((c+0.055)/1.055)**2.4
-
-def hex_to_rgb(h,alpha=1):
-    r = (h & 0xff0000) >> 16
-    g = (h & 0x00ff00) >> 8
-    b = (h & 0x0000ff)
-    return tuple([srgb_to_linearrgb(c/0xff) for c in (r,g,b)] + [alpha])
-
+@cached_material
 def emission_material(color, strength):
     material = bpy.data.materials.new(name="Emission")
     material.use_nodes = True
@@ -36,6 +33,7 @@ def emission_material(color, strength):
     links.new(emission_node.outputs[0], output_node.inputs[0])
     return material
 
+@cached_material
 def glossy_material(roughness):
     material = bpy.data.materials.new(name="Glossy")
     material.use_nodes = True
@@ -76,18 +74,8 @@ bpy.ops.object.shade_smooth()
 
 bpy.context.scene.frame_end = 120
 bpy.context.scene.render.fps = 30
-bpy.context.scene.frame_current = 1
 uv_sphere.location = Vector((4, 1.2, 4))
-uv_sphere.keyframe_insert(data_path='location')
-
-bpy.context.scene.frame_current = 60
-uv_sphere.location = Vector((-1, 1.2, 2))
-uv_sphere.keyframe_insert(data_path='location')
-
-bpy.context.scene.frame_current = 100
-uv_sphere.location = Vector((2, 1.2, 1))
-uv_sphere.keyframe_insert(data_path='location')
-bpy.context.scene.frame_current = 1
+insert_keys(uv_sphere, 'location', [1, 60, 100], [(4, 1.2, 4), (-1, 1.2, 2), (2, 1.2, 1)])
 
 # add material to emitter
 material = bpy.data.materials.new(name="Red")
@@ -180,3 +168,6 @@ text.data.materials.append(material)
 bpy.ops.mesh.primitive_plane_add(size=100)
 plane = bpy.context.active_object
 plane.location = Vector((0, 0, -0.25))
+
+# the sparkle bake, a render chunk starting at frame 100 reads it instead of stepping through 99 frames
+bake_scene_particles()
@@ -0,0 +1,262 @@
+import os
+
+import bpy
+from bpy.app.handlers import persistent
+import numpy as np
+
+from bake_cache import bake, bake_cache_report, fluid_modifier, fluid_params, object_values, rna_values
+from node_graph import build_node_tree
+from profiling import profiled
+
+# DYNAMIC_PAINT_BAKE=0 keeps the canvases live, as they were before baking existed
+BAKE_DYNAMIC_PAINT = os.environ.get("DYNAMIC_PAINT_BAKE", "1") != "0"
+VERTEX_CACHE = "vertex_cache.npy"
+WEIGHT_ATTRIBUTE = "dp_weight"
+IMAGE_RESOLUTION = 512
+
+# canvas name -> (memory mapped cache, surface type, output name, first frame)
+_vertex_caches = {}
+
+def dynamic_paint_modifier(obj):
+    for modifier in obj.modifiers:
+        if (modifier.type == 'DYNAMIC_PAINT'):
+            return modifier
+    return None
+
+def canvas_params(canvas, surface):
+    scene = bpy.context.scene
+    params = {
+        'fps': scene.render.fps,
+        'canvas': object_values(canvas),
+        'surface': rna_values(surface),
+        'brushes': [],
+    }
+    for obj in sorted(scene.objects, key=lambda o: o.name):
+        modifier = dynamic_paint_modifier(obj)
+        if (obj == canvas or modifier is None or modifier.brush_settings is None):
+            continue
+        brush = dict(object_values(obj), settings=rna_values(modifier.brush_settings))
+        psys = modifier.brush_settings.particle_system
+        if (modifier.brush_settings.paint_source == 'PARTICLE_SYSTEM' and psys is not None):
+            brush['particles'] = dict(rna_values(psys.settings), seed=psys.seed)
+        # a fluid domain paints with its simulated surface, so the fluid bake key is part of this one
+        fluid = fluid_modifier(obj)
+        if (fluid is not None and fluid.fluid_type == 'DOMAIN'):
+            brush['fluid'] = fluid_params(obj)
+        params['brushes'].append(brush)
+    return params
+
+def _uses_images(canvas, surface):
+    # weight surfaces only exist as vertex data
+    return surface.surface_type != 'WEIGHT' and len(canvas.data.uv_layers) > 0
+
+def _output_path(directory, surface, frame):
+    extension = "exr" if surface.image_fileformat == 'OPENEXR' else "png"
+    return os.path.join(directory, "%s%04d.%s" % (surface.output_name_a, frame, extension))
+
+def _image_sequence(directory, surface):
+    image = bpy.data.images.load(_output_path(directory, surface, surface.frame_start), check_existing=True)
+    image.source = 'SEQUENCE'
+    return image
+
+def _setup_image_user(image_user, surface):
+    image_user.frame_start = surface.frame_start
+    image_user.frame_offset = surface.frame_start - 1
+    image_user.frame_duration = surface.frame_end - surface.frame_start + 1
+    image_user.use_auto_refresh = True
+
+def _bake_images(canvas, surface, directory):
+    surface.image_output_path = directory
+    with bpy.context.temp_override(object=canvas, active_object=canvas):
+        bpy.ops.dpaint.bake()
+
+def _use_images(canvas, surface, directory):
+    image = _image_sequence(directory, surface)
+    if (surface.surface_type == 'PAINT'):
+        # the paintmap attribute in the materials becomes an image texture on the same uv map
+        for material in canvas.data.materials:
+            if (material is None or not material.use_nodes):
+                continue
+            nodes = material.node_tree.nodes
+            links = material.node_tree.links
+            for attribute in [n for n in nodes if n.bl_idname == 'ShaderNodeAttribute' and n.attribute_name == surface.output_name_a]:
+                texture = nodes.new(type='ShaderNodeTexImage')
+                texture.image = image
+                _setup_image_user(texture.image_user, surface)
+                uv = nodes.new(type='ShaderNodeUVMap')
+                uv.uv_map = surface.uv_layer
+                links.new(uv.outputs[0], texture.inputs['Vector'])
+                for output in attribute.outputs:
+                    for link in list(output.links):
+                        links.new(texture.outputs['Alpha' if output.name == 'Alpha' else 'Color'], link.to_socket)
+                nodes.remove(attribute)
+    else:
+        # wave and displace surfaces become a displace modifier in place of the canvas
+        texture = bpy.data.textures.new(name=surface.name, type='IMAGE')
+        texture.image = image
+        _setup_image_user(texture.image_user, surface)
+        displace = canvas.modifiers.new(name="dp_displace", type='DISPLACE')
+        displace.texture = texture
+        displace.texture_coords = 'UV'
+        displace.uv_layer = surface.uv_layer
+        # wave images hold 0.5 + h / 2, displace images 0.5 - d / 2 with d divided by depth_clamp when it is set
+        displace.mid_level = 0.5
+        if (surface.surface_type == 'WAVE'):
+            displace.strength = 2
+        else:
+            displace.strength = -2 * (surface.depth_clamp or 1)
+        index = list(canvas.modifiers).index(dynamic_paint_modifier(canvas))
+        with bpy.context.temp_override(object=canvas, active_object=canvas):
+            bpy.ops.object.modifier_move_to_index(modifier=displace.name, index=index + 1)
+
+def _realize_canvas_input(canvas, modifier):
+    # the vertex cache is indexed like the mesh the canvas sees, so the modifiers in front of it are applied
+    with bpy.context.temp_override(object=canvas, active_object=canvas):
+        while (canvas.modifiers[0] != modifier):
+            bpy.ops.object.modifier_apply(modifier=canvas.modifiers[0].name)
+
+def _add_weight_capture(canvas, surface, modifier):
+    # vertex groups are not in mesh.attributes, a geometry nodes modifier right after the canvas stores
+    # the painted group as a float attribute so each frame is read with one foreach_get
+    group = bpy.data.node_groups.new("dp_weight_capture", 'GeometryNodeTree')
+    group.interface.new_socket(name="Geometry", in_out='INPUT', socket_type='NodeSocketGeometry')
+    group.interface.new_socket(name="Geometry", in_out='OUTPUT', socket_type='NodeSocketGeometry')
+    graph = {
+        'nodes': {
+            'input': {'type': 'NodeGroupInput'},
+            'output': {'type': 'NodeGroupOutput'},
+            'weight': {'type': 'GeometryNodeInputNamedAttribute', 'props': {'data_type': 'FLOAT'},
+                       'inputs': {'Name': surface.output_name_a}},
+            'store': {'type': 'GeometryNodeStoreNamedAttribute', 'props': {'data_type': 'FLOAT', 'domain': 'POINT'},
+                      'inputs': {'Name': WEIGHT_ATTRIBUTE}},
+        },
+        'links': [
+            ('input', 0, 'store', 'Geometry'),
+            ('weight', 'Attribute', 'store', 'Value'),
+            ('store', 'Geometry', 'output', 0),
+        ],
+    }
+    build_node_tree(group, graph)
+    capture = canvas.modifiers.new(name="dp_weight_capture", type='NODES')
+    capture.node_group = group
+    index = list(canvas.modifiers).index(modifier)
+    with bpy.context.temp_override(object=canvas, active_object=canvas):
+        bpy.ops.object.modifier_move_to_index(modifier=capture.name, index=index + 1)
+    return capture
+
+def _read_values(mesh, surface):
+    if (surface.surface_type == 'WEIGHT'):
+        # unpainted vertices are not in the group, the named attribute reads them as 0
+        attribute = mesh.attributes[WEIGHT_ATTRIBUTE]
+        values = np.empty(len(attribute.data), dtype=np.float32)
+        attribute.data.foreach_get('value', values)
+        return values.reshape(-1, 1)
+    if (surface.surface_type == 'PAINT'):
+        attribute = mesh.attributes[surface.output_name_a]
+        values = np.empty(len(attribute.data) * 4, dtype=np.float32)
+        attribute.data.foreach_get('color', values)
+        return values.reshape(-1, 4)
+    values = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get('co', values)
+    return values.reshape(-1, 3)
+
+def _capture_vertices(canvas, surface, modifier, directory):
+    scene = bpy.context.scene
+    frame = scene.frame_current
+    # the modifiers after the canvas (a mask) would change the vertex count
+    after = list(canvas.modifiers)[list(canvas.modifiers).index(modifier) + 1:]
+    shown = [m.show_viewport for m in after]
+    for m in after:
+        m.show_viewport = False
+    capture = _add_weight_capture(canvas, surface, modifier) if surface.surface_type == 'WEIGHT' else None
+    cache = None
+    try:
+        frames = range(surface.frame_start, surface.frame_end + 1)
+        for i, f in enumerate(frames):
+            scene.frame_set(f)
+            evaluated = canvas.evaluated_get(bpy.context.evaluated_depsgraph_get())
+            values = _read_values(evaluated.data, surface)
+            if (cache is None):
+                cache = np.lib.format.open_memmap(os.path.join(directory, VERTEX_CACHE), mode='w+',
+                                                  dtype=np.float32, shape=(len(frames),) + values.shape)
+            cache[i] = values
+        cache.flush()
+    finally:
+        if (capture is not None):
+            group = capture.node_group
+            canvas.modifiers.remove(capture)
+            bpy.data.node_groups.remove(group)
+        for m, show in zip(after, shown):
+            m.show_viewport = show
+        scene.frame_set(frame)
+
+def _write_vertex_values(obj, kind, name, values):
+    mesh = obj.data
+    if (kind == 'WEIGHT'):
+        group = obj.vertex_groups.get(name) or obj.vertex_groups.new(name=name)
+        # one call per weight level instead of one per vertex
+        levels = np.round(values[:, 0] * 255).astype(np.uint8)
+        group.remove(np.flatnonzero(levels == 0).tolist())
+        for level in np.unique(levels[levels > 0]).tolist():
+            group.add(np.flatnonzero(levels == level).tolist(), level / 255, 'REPLACE')
+    elif (kind == 'PAINT'):
+        domain = 'POINT' if len(values) == len(mesh.vertices) else 'CORNER'
+        attribute = mesh.attributes.get(name) or mesh.color_attributes.new(name, 'FLOAT_COLOR', domain)
+        attribute.data.foreach_set('color', values.ravel())
+    else:
+        mesh.vertices.foreach_set('co', values.ravel())
+    mesh.update()
+
+@persistent
+def vertex_cache_playback(scene, depsgraph=None):
+    for name, (cache, kind, output, frame_start) in _vertex_caches.items():
+        obj = scene.objects.get(name)
+        if (obj is None):
+            continue
+        index = min(max(scene.frame_current - frame_start, 0), len(cache) - 1)
+        _write_vertex_values(obj, kind, output, cache[index])
+
+def _use_vertex_cache(canvas, surface, directory):
+    cache = np.load(os.path.join(directory, VERTEX_CACHE), mmap_mode='r')
+    _vertex_caches[canvas.name] = (cache, surface.surface_type, surface.output_name_a, surface.frame_start)
+    if (vertex_cache_playback not in bpy.app.handlers.frame_change_pre):
+        bpy.app.handlers.frame_change_pre.append(vertex_cache_playback)
+    # writing mesh data from a handler while rendering needs a locked interface
+    bpy.context.scene.render.use_lock_interface = True
+    vertex_cache_playback(bpy.context.scene)
+
+@profiled
+def bake_canvas(canvas, surface_name=None, image_resolution=IMAGE_RESOLUTION):
+    # bakes the canvas once, later runs with the same parameters read the cache,
+    # rendering then reads images or the vertex cache and the canvas modifier is switched off
+    if (not BAKE_DYNAMIC_PAINT):
+        return None
+    modifier = dynamic_paint_modifier(canvas)
+    surfaces = modifier.canvas_settings.canvas_surfaces
+    surface = surfaces[surface_name] if surface_name else surfaces.active
+    surfaces.active_index = list(surfaces).index(surface)
+    surface.frame_end = min(surface.frame_end, bpy.context.scene.frame_end)
+
+    images = _uses_images(canvas, surface)
+    if (images):
+        surface.surface_format = 'IMAGE'
+        surface.uv_layer = canvas.data.uv_layers.active.name
+        surface.image_resolution = image_resolution
+        surface.image_fileformat = 'OPENEXR'
+        directory, hit = bake('dynamic_paint', canvas_params(canvas, surface),
+                              lambda directory: _bake_images(canvas, surface, directory))
+        _use_images(canvas, surface, directory)
+    else:
+        # hashed before the input modifiers are applied so they are part of the key,
+        # they are applied on a hit too because the vertex cache is indexed like the realized mesh
+        params = canvas_params(canvas, surface)
+        _realize_canvas_input(canvas, modifier)
+        directory, hit = bake('dynamic_paint', params,
+                              lambda directory: _capture_vertices(canvas, surface, modifier, directory))
+        _use_vertex_cache(canvas, surface, directory)
+    modifier.show_viewport = False
+    modifier.show_render = False
+    print("dynamic paint cache %s: %s (%s)" % (os.path.basename(directory), "hit" if hit else "baked",
+                                               "images" if images else "vertices"))
+    bake_cache_report()
+    return directory
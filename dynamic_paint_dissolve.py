@@ -2,6 +2,18 @@ import bpy, bmesh
 import mathutils
 from mathutils import Vector
 import math
+import os, sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from building import add_lattice
+from colors import hex_to_rgb
+from dynamic_paint import bake_canvas
+from materials import cached_material
+from node_graph import build_node_tree
+from point_cache import bake_scene_particles
 
 def eulerToDegree(euler):
     return ( (euler) / (2 * math.pi) ) * 360
@@ -9,22 +21,12 @@ def eulerToDegree(euler):
 def degreeToEuler(degree):
     return degree / 180 * math.pi
 
-def srgb_to_linearrgb(c):
-    if   c < 0:       return 0
-    elif c < 0.04045: return c/12.92
-    else:             return ((c+0.055)/1.055)**2.4
-
-def hex_to_rgb(h,alpha=1):
-    r = (h & 0xff0000) >> 16
-    g = (h & 0x00ff00) >> 8
-    b = (h & 0x0000ff)
-    return tuple([srgb_to_linearrgb(c/0xff) for c in (r,g,b)] + [alpha])
-
 def math_node(nodes, operation):
     math_node = nodes.new(type='ShaderNodeMath')
     math_node.operation = operation
     return math_node
 
+@cached_material
 def emission_material(color, strength):
     material = bpy.data.materials.new(name="Emission")
     material.use_nodes = True
@@ -41,6 +43,7 @@ def emission_material(color, strength):
     links.new(emission_node.outputs[0], output_node.inputs[0])
     return material
 
+@cached_material
 def principled_material(color=(0.8, 0.8, 0.8, 1), roughness=0.5, metallic=0, transmission=0):
     material = bpy.data.materials.new(name="Principled")
     material.use_nodes = True
@@ -124,40 +127,135 @@ def create_plane(location=(0, 0, 0), size=100):
 
 def create_stairs(location):
     bpy.ops.mesh.primitive_cube_add(enter_editmode=False, align='WORLD', location=location, scale=(0.1, 0.1, 0.1))
-    bpy.ops.object.modifier_add(type='ARRAY')
-    bpy.context.object.modifiers["Array"].count = 8
-    bpy.ops.object.modifier_add(type='ARRAY')
-    bpy.context.object.modifiers["Array.001"].count = 8
-    bpy.context.object.modifiers["Array.001"].relative_offset_displace[0] = 0
-    bpy.context.object.modifiers["Array.001"].relative_offset_displace[1] = 1
-    bpy.context.object.modifiers["Array.001"].relative_offset_displace[2] = 1
-
-def create_building(location=(0, 0, 0), scale=(0.1, 0.1, 0.1), x=8, y=8, z=16, wireframe=True, smooth=True):
+    # 8 cubes along x, 8 steps going up in y and z
+    add_lattice(bpy.context.object, (8, 8, 1), relative_offsets=((1, 0, 0), (0, 1, 1), (0, 0, 1)))
+
+def create_building(location=(0, 0, 0), scale=(0.1, 0.1, 0.1), x=8, y=8, z=16, wireframe=True, smooth=True, realize=False):
     # the building
     #bpy.ops.mesh.primitive_cube_add(enter_editmode=False, align='WORLD', location=(0, 0, 0), scale=(0.1, 0.1, 0.1))
     bpy.ops.mesh.primitive_cube_add(enter_editmode=False, align='WORLD', location=location, scale=(1, 1, 1))
     bpy.ops.transform.resize(value=scale, orient_type='GLOBAL', orient_matrix=((1, 0, 0), (0, 1, 0), (0, 0, 1)), orient_matrix_type='GLOBAL', mirror=False, use_proportional_edit=False, proportional_edit_falloff='SMOOTH', proportional_size=1, use_proportional_connected=False, use_proportional_projected=False, snap=False, snap_elements={'INCREMENT'}, use_snap_project=False, snap_target='CLOSEST', use_snap_self=True, use_snap_edit=True, use_snap_nonedit=True, use_snap_selectable=False)
     obj = bpy.context.object
 
-    bpy.ops.object.modifier_add(type='ARRAY')
-    bpy.context.object.modifiers["Array"].count = x
-    bpy.ops.object.modifier_add(type='ARRAY')
-    bpy.context.object.modifiers["Array.001"].count = y
-    bpy.context.object.modifiers["Array.001"].relative_offset_displace[0] = 0
-    bpy.context.object.modifiers["Array.001"].relative_offset_displace[1] = 1
-    bpy.ops.object.modifier_add(type='ARRAY')
-    bpy.context.object.modifiers["Array.002"].count = z
-    bpy.context.object.modifiers["Array.002"].relative_offset_displace[0] = 0
-    bpy.context.object.modifiers["Array.002"].relative_offset_displace[2] = 1
+    # solidify and wireframe shape a single cell, the lattice instances it x * y * z times
     bpy.ops.object.modifier_add(type='SOLIDIFY')
     bpy.context.object.modifiers["Solidify"].thickness = 1
     if (wireframe):
         bpy.ops.object.modifier_add(type='WIREFRAME')
         bpy.context.object.modifiers["Wireframe"].thickness = 0.2
+    add_lattice(obj, (x, y, z), realize=realize)
 
     if (smooth):
         bpy.ops.object.shade_smooth()
 
+def realize_modifiers(obj):
+    with bpy.context.temp_override(object=obj, active_object=obj):
+        for modifier in list(obj.modifiers):
+            bpy.ops.object.modifier_apply(modifier=modifier.name)
+
+def _painted(co, location, radius):
+    # vertices within radius of any particle, one numpy distance pass per block of particles
+    # over the vertices inside the particles' bounding box
+    painted = np.zeros(len(co), dtype=bool)
+    if (not len(location)):
+        return painted
+    reach = radius.max()
+    inside = ((co >= location.min(axis=0) - reach) & (co <= location.max(axis=0) + reach)).all(axis=1)
+    candidates = np.flatnonzero(inside)
+    if (not len(candidates)):
+        return painted
+    points = co[candidates]
+    squared = (points * points).sum(axis=1)
+    # keeps the particles x vertices distance block around 4M floats
+    chunk = max(1, 2**22 // len(points))
+    for i in range(0, len(location), chunk):
+        p = location[i:i + chunk]
+        distance = squared[None, :] - 2 * p @ points.T + (p * p).sum(axis=1)[:, None]
+        painted[candidates[(distance <= radius[i:i + chunk, None] ** 2).any(axis=0)]] = True
+    return painted
+
+def paint_timeline(obj, emitter, frame_start, frame_end):
+    # first and last frame a particle comes within its radius of each vertex, from one replay of the particles
+    scene = bpy.context.scene
+    mesh = obj.data
+    matrix = np.array(obj.matrix_world, dtype=np.float32)
+    co = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get('co', co)
+    co = co.reshape(-1, 3) @ matrix[:3, :3].T + matrix[:3, 3]
+
+    first = np.full(len(co), np.inf, dtype=np.float32)
+    last = np.full(len(co), -np.inf, dtype=np.float32)
+    frame = scene.frame_current
+    for f in range(frame_start, frame_end + 1):
+        scene.frame_set(f)
+        particles = emitter.evaluated_get(bpy.context.evaluated_depsgraph_get()).particle_systems[0].particles
+        count = len(particles)
+        location = np.empty(count * 3, dtype=np.float32)
+        particles.foreach_get('location', location)
+        size = np.empty(count, dtype=np.float32)
+        particles.foreach_get('size', size)
+        birth = np.empty(count, dtype=np.float32)
+        particles.foreach_get('birth_time', birth)
+        death = np.empty(count, dtype=np.float32)
+        particles.foreach_get('die_time', death)
+        alive = (birth <= f) & (death > f)
+        hits = _painted(co, location.reshape(-1, 3)[alive], size[alive])
+        first[hits] = np.minimum(first[hits], f)
+        last[hits] = f
+    scene.frame_set(frame)
+    return first, last
+
+def dissolve_node_group():
+    # deletes the points whose dissolve_start <= frame < dissolve_end
+    group = bpy.data.node_groups.new("dissolve_timeline", 'GeometryNodeTree')
+    group.interface.new_socket(name="Geometry", in_out='INPUT', socket_type='NodeSocketGeometry')
+    group.interface.new_socket(name="Geometry", in_out='OUTPUT', socket_type='NodeSocketGeometry')
+    graph = {
+        'nodes': {
+            'input': {'type': 'NodeGroupInput'},
+            'output': {'type': 'NodeGroupOutput'},
+            'time': {'type': 'GeometryNodeInputSceneTime'},
+            'start': {'type': 'GeometryNodeInputNamedAttribute', 'props': {'data_type': 'FLOAT'}, 'inputs': {'Name': "dissolve_start"}},
+            'end': {'type': 'GeometryNodeInputNamedAttribute', 'props': {'data_type': 'FLOAT'}, 'inputs': {'Name': "dissolve_end"}},
+            'started': {'type': 'FunctionNodeCompare', 'props': {'data_type': 'FLOAT', 'operation': 'GREATER_EQUAL'}},
+            'ended': {'type': 'FunctionNodeCompare', 'props': {'data_type': 'FLOAT', 'operation': 'LESS_THAN'}},
+            'hidden': {'type': 'FunctionNodeBooleanMath', 'props': {'operation': 'AND'}},
+            'delete': {'type': 'GeometryNodeDeleteGeometry', 'props': {'domain': 'POINT'}},
+        },
+        'links': [
+            ('input', 0, 'delete', 'Geometry'),
+            ('time', 'Frame', 'started', 0),
+            ('start', 'Attribute', 'started', 1),
+            ('time', 'Frame', 'ended', 0),
+            ('end', 'Attribute', 'ended', 1),
+            ('started', 'Result', 'hidden', 0),
+            ('ended', 'Result', 'hidden', 1),
+            ('hidden', 'Boolean', 'delete', 'Selection'),
+            ('delete', 'Geometry', 'output', 0),
+        ],
+    }
+    build_node_tree(group, graph)
+    return group
+
+def dissolve_timeline(obj, emitter, dissolve_speed):
+    # same look as a dynamic paint weight canvas with linear dissolve masking the painted vertices:
+    # a vertex disappears when first painted and comes back dissolve_speed frames after the last paint
+    start = time.perf_counter()
+    scene = bpy.context.scene
+    realize_modifiers(obj)
+    first, last = paint_timeline(obj, emitter, scene.frame_start, scene.frame_end)
+    mesh = obj.data
+    mesh.attributes.new("dissolve_start", 'FLOAT', 'POINT').data.foreach_set('value', first)
+    mesh.attributes.new("dissolve_end", 'FLOAT', 'POINT').data.foreach_set('value', last + dissolve_speed)
+    modifier = obj.modifiers.new("dissolve", type='NODES')
+    modifier.node_group = dissolve_node_group()
+    print("dissolve timeline: %d of %d vertices painted, %.2f s"
+          % (np.isfinite(first).sum(), len(first), time.perf_counter() - start))
+
+# 'dynamic_paint' masks with a weight canvas, 'timeline' precomputes when each vertex is painted
+DISSOLVE_MODE = os.environ.get("DISSOLVE_MODE", 'dynamic_paint')
+DISSOLVE_SPEED = 50
+
 create_plane(location=(0, 0, -0.2))
 create_stairs(location=(0.7, -1.7, 0))
 #material = principled_material(hex_to_rgb(0xe757cf))
@@ -168,7 +266,9 @@ create_building(scale=(0.2, 0.2, 0.2), z=4, smooth=False)
 material = principled_material(hex_to_rgb(0x70ccf3), metallic=1)
 bpy.context.object.data.materials.append(material)
 
-create_building(location=(0, 0, 1.6), scale=(0.2, 0.2, 0.2), wireframe=False, smooth=False)
+# dynamic paint and the dissolve timeline need the real vertices of this one
+create_building(location=(0, 0, 1.6), scale=(0.2, 0.2, 0.2), wireframe=False, smooth=False, realize=True)
+building = bpy.context.object
 # add material
 #material = principled_material(hex_to_rgb(0x70ccf3), metallic=1)
 bpy.context.object.data.materials.append(material)
@@ -177,19 +277,20 @@ material = emission_material(hex_to_rgb(0xff0000), 20)
 bpy.context.object.data.materials.append(material)
 bpy.context.object.modifiers["Solidify"].material_offset = 1
 
-bpy.ops.object.modifier_add(type='DYNAMIC_PAINT')
-bpy.ops.dpaint.type_toggle(type='CANVAS')
-bpy.context.object.modifiers["Dynamic Paint"].canvas_settings.canvas_surfaces["Surface"].surface_type = 'WEIGHT'
+if (DISSOLVE_MODE == 'dynamic_paint'):
+    bpy.ops.object.modifier_add(type='DYNAMIC_PAINT')
+    bpy.ops.dpaint.type_toggle(type='CANVAS')
+    bpy.context.object.modifiers["Dynamic Paint"].canvas_settings.canvas_surfaces["Surface"].surface_type = 'WEIGHT'
 
-# make surface reappear
-bpy.context.object.modifiers["Dynamic Paint"].canvas_settings.canvas_surfaces["Surface"].use_dissolve = True
-bpy.context.object.modifiers["Dynamic Paint"].canvas_settings.canvas_surfaces["Surface"].dissolve_speed = 50
-bpy.context.object.modifiers["Dynamic Paint"].canvas_settings.canvas_surfaces["Surface"].use_dissolve_log = False
+    # make surface reappear
+    bpy.context.object.modifiers["Dynamic Paint"].canvas_settings.canvas_surfaces["Surface"].use_dissolve = True
+    bpy.context.object.modifiers["Dynamic Paint"].canvas_settings.canvas_surfaces["Surface"].dissolve_speed = DISSOLVE_SPEED
+    bpy.context.object.modifiers["Dynamic Paint"].canvas_settings.canvas_surfaces["Surface"].use_dissolve_log = False
 
-bpy.ops.dpaint.output_toggle(output='A')
-bpy.ops.object.modifier_add(type='MASK')
-bpy.context.object.modifiers["Mask"].vertex_group = "dp_weight"
-bpy.context.object.modifiers["Mask"].invert_vertex_group = True
+    bpy.ops.dpaint.output_toggle(output='A')
+    bpy.ops.object.modifier_add(type='MASK')
+    bpy.context.object.modifiers["Mask"].vertex_group = "dp_weight"
+    bpy.context.object.modifiers["Mask"].invert_vertex_group = True
 
 # the particles emitter
 #location=(0.7, 0.7, 1.5+1.6)
@@ -198,11 +299,12 @@ bpy.ops.mesh.primitive_uv_sphere_add(enter_editmode=False, align='WORLD', locati
 bpy.ops.object.particle_system_add()
 bpy.data.particles["ParticleSettings"].count = 100
 bpy.data.particles["ParticleSettings"].effector_weights.gravity = 0
-bpy.ops.object.modifier_add(type='DYNAMIC_PAINT')
-bpy.context.object.modifiers["Dynamic Paint"].ui_type = 'BRUSH'
-bpy.ops.dpaint.type_toggle(type='BRUSH')
-bpy.context.object.modifiers["Dynamic Paint"].brush_settings.paint_source = 'PARTICLE_SYSTEM'
-bpy.context.object.modifiers["Dynamic Paint"].brush_settings.particle_system = bpy.data.objects["Sphere"].particle_systems["ParticleSystem"]
+if (DISSOLVE_MODE == 'dynamic_paint'):
+    bpy.ops.object.modifier_add(type='DYNAMIC_PAINT')
+    bpy.context.object.modifiers["Dynamic Paint"].ui_type = 'BRUSH'
+    bpy.ops.dpaint.type_toggle(type='BRUSH')
+    bpy.context.object.modifiers["Dynamic Paint"].brush_settings.paint_source = 'PARTICLE_SYSTEM'
+    bpy.context.object.modifiers["Dynamic Paint"].brush_settings.particle_system = bpy.data.objects["Sphere"].particle_systems["ParticleSystem"]
 #bpy.context.object.hide_viewport = True
 #bpy.context.object.hide_render=True
 
@@ -215,3 +317,11 @@ camera = bpy.data.objects['Camera']
 camera.location = Vector((19, -16, 16))
 camera.rotation_euler = mathutils.Euler((math.radians(64), 0, math.radians(46)), 'XYZ')
 render('BLENDER_EEVEE', 240)
+# the timeline and the canvas bake both step through every frame of the particles, they read the bake
+bake_scene_particles()
+
+if (DISSOLVE_MODE == 'timeline'):
+    dissolve_timeline(building, bpy.data.objects["Sphere"], DISSOLVE_SPEED)
+else:
+    # simulate the dissolve once, rendering plays back the cached weights
+    bake_canvas(building)
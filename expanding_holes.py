@@ -2,17 +2,11 @@ import bpy
 import mathutils
 from mathutils import Vector
 import math
+import os, sys
 
-def srgb_to_linearrgb(c):
-    if   c < 0:       return 0
-    elif c < 0.04045: return c/12.92
-    else:             return ((c+0.055)/1.055)**2.4
-
-def hex_to_rgb(h,alpha=1):
-    r = (h & 0xff0000) >> 16
-    g = (h & 0x00ff00) >> 8
-    b = (h & 0x0000ff)
-    return tuple([srgb_to_linearrgb(c/0xff) for c in (r,g,b)] + [alpha])
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from colors import hex_to_rgb
+from keyframes import insert_keys
 
 bpy.ops.mesh.primitive_monkey_add(size=2, enter_editmode=False, align='WORLD', location=(0, 0, 0), scale=(1, 1, 1))
 monkey = bpy.context.active_object
@@ -54,9 +48,7 @@ math_node.operation = 'GREATER_THAN'
 # greater this value will use transparent node, cause holes
 #math_node.inputs[1].default_value = 0.65
 math_node.inputs[1].default_value = 0.68
-math_node.inputs[1].keyframe_insert("default_value", frame=1)
-math_node.inputs[1].default_value = 0.54
-math_node.inputs[1].keyframe_insert("default_value", frame=100)
+insert_keys(math_node.inputs[1], 'default_value', [1, 100], [0.68, 0.54])
 links.new(math_node.inputs[0], noise_node.outputs['Color'])
 
 transparent_node = material.node_tree.nodes.new(type='ShaderNodeBsdfTransparent')
@@ -80,22 +72,9 @@ bpy.context.object.modifiers["Wireframe"].thickness = 0.05/2
 
 bpy.context.scene.frame_end = 120
 bpy.context.scene.render.fps = 30
-bpy.context.scene.frame_current = 1
 monkey.rotation_euler = mathutils.Euler((0.0, 0.0, 0.0), 'XYZ')
-monkey.keyframe_insert(data_path='rotation_euler')
-bpy.context.scene.frame_current = 90
-monkey.rotation_euler = mathutils.Euler((0.0, 0.0, math.radians(-90)), 'XYZ')
-monkey.keyframe_insert(data_path='rotation_euler')
-bpy.context.scene.frame_current = 120
-monkey.rotation_euler = mathutils.Euler((0.0, 0.0, math.radians(-270)), 'XYZ')
-monkey.keyframe_insert(data_path='rotation_euler')
-bpy.context.scene.frame_current = 1
-
-# change interpolation to BEZIER
-fcurves = monkey.animation_data.action.fcurves
-for fcurve in fcurves:
-    for kf in fcurve.keyframe_points:
-        kf.interpolation = 'BEZIER'
+insert_keys(monkey, 'rotation_euler', [1, 90, 120],
+            [(0.0, 0.0, 0.0), (0.0, 0.0, math.radians(-90)), (0.0, 0.0, math.radians(-270))], interpolation='BEZIER')
 
 # set world to black
 #bpy.data.worlds["World"].node_tree.nodes["Background"].inputs[0].default_value = (0, 0, 0, 1)
@@ -2,6 +2,12 @@ import bpy
 import mathutils
 from mathutils import Vector
 import math
+import os, sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from colors import hex_to_rgb
+from materials import cached_material
+from point_cache import bake_scene_particles
 
 def eulerToDegree(euler):
     return ( (euler) / (2 * math.pi) ) * 360
@@ -9,17 +15,6 @@ def eulerToDegree(euler):
 def degreeToEuler(degree):
     return degree / 180 * math.pi
 
-def srgb_to_linearrgb(c):
-    if   c < 0:       return 0
-    elif c < 0.04045: return c/12.92
-    else:             return ((c+0.055)/1.055)**2.4
-
-def hex_to_rgb(h,alpha=1):
-    r = (h & 0xff0000) >> 16
-    g = (h & 0x00ff00) >> 8
-    b = (h & 0x0000ff)
-    return tuple([srgb_to_linearrgb(c/0xff) for c in (r,g,b)] + [alpha])
-
 def math_node(nodes, operation):
     math_node = nodes.new(type='ShaderNodeMath')
     math_node.operation = operation
@@ -59,6 +54,7 @@ def background_settings(color=(0, 0, 0, 1), image_path=bpy.utils.resource_path('
     else:
         background.inputs[0].default_value = color
 
+@cached_material
 def emission_material(color, strength):
     material = bpy.data.materials.new(name="Emission")
     material.use_nodes = True
@@ -75,6 +71,7 @@ def emission_material(color, strength):
     links.new(emission_node.outputs[0], output_node.inputs[0])
     return material
 
+@cached_material
 def emission_diffuse_material(emission_color, emission_strength, diffuse_color, diffuse_roughness, blend):
     material = bpy.data.materials.new(name="emission_diffuse")
     material.use_nodes = True
@@ -152,6 +149,8 @@ settings.instance_object = bpy.data.objects["Sphere"]
 settings.particle_size = 0.3
 
 render('CYCLES', 300, 10)
+# the boids land on the terrain collider, baked once and loaded from disk afterwards
+bake_scene_particles()
 # set camera
 camera = bpy.data.objects['Camera']
 camera.location = Vector((23, -1, 5.4))
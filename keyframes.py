@@ -0,0 +1,92 @@
+import numpy as np
+
+import bpy
+from bpy.app.handlers import persistent
+
+# enum values as stored in each keyframe, foreach_set writes them directly
+INTERPOLATION = {'CONSTANT': 0, 'LINEAR': 1, 'BEZIER': 2}
+# the handle type keyframe_insert gives new keys
+HANDLE_AUTO_CLAMPED = 4
+
+def _action(id_data):
+    animation_data = id_data.animation_data or id_data.animation_data_create()
+    if (animation_data.action is None):
+        animation_data.action = bpy.data.actions.new(id_data.name + "Action")
+    return animation_data.action
+
+def _fcurve(action, path, index, group):
+    fcurve = action.fcurves.find(path, index=index)
+    if (fcurve is None):
+        fcurve = action.fcurves.new(path, index=index, action_group=group or "")
+    return fcurve
+
+def _write_keys(fcurve, frames, values, interpolation):
+    points = fcurve.keyframe_points
+    modes = np.full(len(frames), INTERPOLATION[interpolation], dtype=np.int32)
+    if (len(points)):
+        # keep the keys already there, a new key replaces an old one on the same frame
+        old = np.empty(len(points) * 2, dtype=np.float32)
+        points.foreach_get('co', old)
+        old = old.reshape(-1, 2)
+        old_modes = np.empty(len(points), dtype=np.int32)
+        points.foreach_get('interpolation', old_modes)
+        keep = ~np.isin(old[:, 0], frames)
+        frames = np.concatenate([old[keep, 0], frames])
+        values = np.concatenate([old[keep, 1], values])
+        modes = np.concatenate([old_modes[keep], modes])
+        points.clear()
+
+    order = np.argsort(frames, kind='stable')
+    points.add(len(frames))
+    points.foreach_set('co', np.column_stack([frames, values])[order].ravel())
+    points.foreach_set('interpolation', modes[order])
+    handles = np.full(len(frames), HANDLE_AUTO_CLAMPED, dtype=np.int32)
+    points.foreach_set('handle_left_type', handles)
+    points.foreach_set('handle_right_type', handles)
+    # sorts the keys and computes the auto handles
+    fcurve.update()
+
+def insert_keys(struct, prop, frames, values, interpolation='BEZIER', group=None):
+    # the bulk version of struct.keyframe_insert(prop, frame=f) for every frame,
+    # values holds one value per frame, or one row per frame for array properties (location, colors);
+    # scene.frame_current is never changed
+    frames = np.asarray(frames, dtype=np.float32)
+    values = np.asarray(values, dtype=np.float32).reshape(len(frames), -1)
+    action = _action(struct.id_data)
+    path = struct.path_from_id(prop)
+    fcurves = []
+    for index in range(values.shape[1]):
+        fcurve = _fcurve(action, path, index, group)
+        _write_keys(fcurve, frames, values[:, index], interpolation)
+        fcurves.append(fcurve)
+    return fcurves
+
+# every move to another frame during setup re-runs rigid body, cloth, fluid and particle caches,
+# frame_set is seen by frame_change_post, a frame_current assignment by the next depsgraph update
+frame_change_stats = {'frame_changes': 0, 'frame': None}
+
+def _frame_changed(scene):
+    if (scene.frame_current != frame_change_stats['frame']):
+        frame_change_stats['frame_changes'] += 1
+        frame_change_stats['frame'] = scene.frame_current
+
+@persistent
+def _count_frame_change(scene, depsgraph=None):
+    _frame_changed(scene)
+
+def count_frame_changes():
+    # starts counting from the frame the scene is on now
+    frame_change_stats['frame_changes'] = 0
+    frame_change_stats['frame'] = bpy.context.scene.frame_current
+    if (_count_frame_change not in bpy.app.handlers.frame_change_post):
+        bpy.app.handlers.frame_change_post.append(_count_frame_change)
+    if (_count_frame_change not in bpy.app.handlers.depsgraph_update_post):
+        bpy.app.handlers.depsgraph_update_post.append(_count_frame_change)
+
+def frame_changes():
+    # a frame_current assignment nothing evaluated yet still counts
+    _frame_changed(bpy.context.scene)
+    return frame_change_stats['frame_changes']
+
+def frame_change_report():
+    print("frame changes: %d" % frame_changes())
@@ -0,0 +1,62 @@
+import hashlib
+import inspect
+from functools import wraps
+
+import bpy
+
+# custom property holding the content hash of the builder call that made a material
+MATERIAL_KEY = "material_key"
+
+material_cache_stats = {'hits': 0, 'misses': 0}
+_material_names = {}
+
+def _code_signature(code):
+    # bytecode plus constants, so two scripts' principled_material variants never share a key
+    consts = [_code_signature(c) if inspect.iscode(c) else repr(c) for c in code.co_consts]
+    return code.co_code.hex() + repr(consts)
+
+def material_key(builder, *args, **kwargs):
+    bound = inspect.signature(builder).bind(*args, **kwargs)
+    bound.apply_defaults()
+    digest = hashlib.sha1()
+    digest.update(builder.__name__.encode())
+    digest.update(_code_signature(builder.__code__).encode())
+    digest.update(repr(sorted(bound.arguments.items())).encode())
+    return digest.hexdigest()
+
+def find_material(key):
+    material = bpy.data.materials.get(_material_names.get(key, ''))
+    if (material is not None and material.get(MATERIAL_KEY) == key):
+        return material
+    # materials from an earlier run in this .blend
+    for material in bpy.data.materials:
+        if (material.get(MATERIAL_KEY) == key):
+            _material_names[key] = material.name
+            return material
+    return None
+
+def cached_material(builder):
+    @wraps(builder)
+    def wrapper(*args, **kwargs):
+        key = material_key(builder, *args, **kwargs)
+        material = find_material(key)
+        if (material is not None):
+            material_cache_stats['hits'] += 1
+            return material
+        material_cache_stats['misses'] += 1
+        material = builder(*args, **kwargs)
+        material[MATERIAL_KEY] = key
+        _material_names[key] = material.name
+        return material
+    return wrapper
+
+def material_cache_info():
+    hits = material_cache_stats['hits']
+    misses = material_cache_stats['misses']
+    total = hits + misses
+    return {'hits': hits, 'misses': misses, 'hit_rate': hits / total if total else 0.0}
+
+def clear_material_cache():
+    _material_names.clear()
+    material_cache_stats['hits'] = 0
+    material_cache_stats['misses'] = 0
@@ -0,0 +1,160 @@
+import time
+
+import bpy
+
+# a node graph is a plain dict, so it can be diffed, versioned and dumped as json:
+# {
+#     'nodes': {
+#         'output': {'type': 'ShaderNodeOutputMaterial'},
+#         'noise': {'type': 'ShaderNodeTexNoise', 'props': {'noise_dimensions': '2D'}, 'inputs': {'Scale': 5}},
+#     },
+#     'links': [('noise', 'Fac', 'output', 'Displacement')],
+# }
+# sockets are addressed by name or by index, an index is needed when names repeat
+# (the two 'Value' inputs of a math node, the two 'Shader' inputs of a mix shader)
+
+# (bl_idname, 'inputs' | 'outputs', name) -> socket index, shared by every tree,
+# group nodes and names only unique among the enabled sockets are looked up every time
+_socket_indices = {}
+# (tree bl_idname, node bl_idname) -> default input values of a freshly created node
+_default_inputs = {}
+
+material_build_times = {}
+
+def math_spec(operation, inputs=None):
+    spec = {'type': 'ShaderNodeMath', 'props': {'operation': operation}}
+    if (inputs):
+        spec['inputs'] = inputs
+    return spec
+
+def _find_socket(node, direction, key):
+    # -> (index, cacheable)
+    sockets = getattr(node, direction)
+    matches = [i for i, socket in enumerate(sockets) if socket.name == key]
+    if (not matches):
+        raise KeyError("%s has no %s socket '%s'" % (node.bl_idname, direction[:-1], key))
+    if (len(matches) == 1):
+        return matches[0], True
+    # nodes like the switch keep one socket per data type under the same name, only one of them is enabled
+    enabled = [i for i in matches if sockets[i].enabled]
+    if (len(enabled) != 1):
+        raise KeyError("%s has %d %s sockets named '%s', address it by index"
+                       % (node.bl_idname, len(matches), direction[:-1], key))
+    return enabled[0], False
+
+def socket_index(node, direction, key):
+    if (isinstance(key, int)):
+        return key
+    # group nodes share their bl_idname whatever group they wrap
+    if (hasattr(node, 'node_tree')):
+        return _find_socket(node, direction, key)[0]
+    cache_key = (node.bl_idname, direction, key)
+    index = _socket_indices.get(cache_key)
+    if (index is None):
+        index, cacheable = _find_socket(node, direction, key)
+        if (cacheable):
+            _socket_indices[cache_key] = index
+    return index
+
+def build_node_tree(node_tree, graph, clear=True):
+    nodes = node_tree.nodes
+    links = node_tree.links
+    if (clear):
+        nodes.clear()
+
+    built = {}
+    for name, spec in graph['nodes'].items():
+        node = nodes.new(type=spec['type'])
+        node.name = name
+        if ('location' in spec):
+            node.location = spec['location']
+        for prop, value in spec.get('props', {}).items():
+            setattr(node, prop, value)
+        inputs = node.inputs
+        for key, value in spec.get('inputs', {}).items():
+            inputs[socket_index(node, 'inputs', key)].default_value = value
+        built[name] = node
+
+    for from_name, from_key, to_name, to_key in graph.get('links', ()):
+        from_node = built[from_name]
+        to_node = built[to_name]
+        links.new(from_node.outputs[socket_index(from_node, 'outputs', from_key)],
+                  to_node.inputs[socket_index(to_node, 'inputs', to_key)])
+    return built
+
+def build_material(name, graph):
+    start = time.perf_counter()
+    material = bpy.data.materials.new(name=name)
+    material.use_nodes = True
+    nodes = build_node_tree(material.node_tree, graph)
+    material_build_times.setdefault(name, []).append(time.perf_counter() - start)
+    return material, nodes
+
+def material_build_report():
+    for name, times in sorted(material_build_times.items()):
+        print("%-24s built %d time(s), %.2f ms each" % (name, len(times), sum(times) / len(times) * 1000))
+
+def _value(value):
+    if (hasattr(value, '__len__') and not isinstance(value, str)):
+        return tuple(value)
+    return value
+
+def _socket_key(sockets, socket):
+    # prefer the readable name unless another socket shares it
+    names = [s.name for s in sockets]
+    if (names.count(socket.name) == 1):
+        return socket.name
+    return [s.identifier for s in sockets].index(socket.identifier)
+
+# node tree type -> base class of its nodes, the properties every node has are not serialized
+_NODE_BASES = {'ShaderNodeTree': 'ShaderNode', 'GeometryNodeTree': 'GeometryNode', 'CompositorNodeTree': 'CompositorNode'}
+
+def _node_defaults(tree_type, bl_idname):
+    defaults = _default_inputs.get((tree_type, bl_idname))
+    if (defaults is None):
+        group = bpy.data.node_groups.new("node_graph_defaults", tree_type)
+        node = group.nodes.new(type=bl_idname)
+        defaults = {
+            'props': {p.identifier: _value(getattr(node, p.identifier)) for p in _node_props(tree_type, node)},
+            'inputs': [_value(s.default_value) if hasattr(s, 'default_value') else None for s in node.inputs],
+        }
+        bpy.data.node_groups.remove(group)
+        _default_inputs[(tree_type, bl_idname)] = defaults
+    return defaults
+
+def _node_props(tree_type, node):
+    base = getattr(bpy.types, _NODE_BASES.get(tree_type, 'Node')).bl_rna.properties
+    for prop in node.bl_rna.properties:
+        if (prop.identifier in base or prop.is_readonly or prop.type not in {'BOOLEAN', 'INT', 'FLOAT', 'STRING', 'ENUM'}):
+            continue
+        yield prop
+
+def serialize_node_tree(node_tree):
+    graph = {'nodes': {}, 'links': []}
+    tree_type = node_tree.bl_idname
+    for node in node_tree.nodes:
+        defaults = _node_defaults(tree_type, node.bl_idname)
+        spec = {'type': node.bl_idname}
+        props = {}
+        for prop in _node_props(tree_type, node):
+            value = _value(getattr(node, prop.identifier))
+            if (value != defaults['props'].get(prop.identifier)):
+                props[prop.identifier] = value
+        if (props):
+            spec['props'] = props
+        inputs = {}
+        for index, socket in enumerate(node.inputs):
+            if (socket.is_linked or not hasattr(socket, 'default_value')):
+                continue
+            value = _value(socket.default_value)
+            if (value != defaults['inputs'][index]):
+                inputs[_socket_key(node.inputs, socket)] = value
+        if (inputs):
+            spec['inputs'] = inputs
+        graph['nodes'][node.name] = spec
+
+    for link in node_tree.links:
+        graph['links'].append((link.from_node.name, _socket_key(link.from_node.outputs, link.from_socket),
+                               link.to_node.name, _socket_key(link.to_node.inputs, link.to_socket)))
+    graph['links'].sort(key=repr)
+    return graph
@@ -2,18 +2,20 @@ import bpy, bmesh
 import mathutils
 from mathutils import Vector
 import math
+import os, sys
+import time
 
-def srgb_to_linearrgb(c):
-    if   c < 0:       return 0
-    elif c < 0.04045: return c/12.92
-    else:             return ((c+0.055)/1.055)**2.4
+import numpy as np
 
-def hex_to_rgb(h,alpha=1):
-    r = (h & 0xff0000) >> 16
-    g = (h & 0x00ff00) >> 8
-    b = (h & 0x0000ff)
-    return tuple([srgb_to_linearrgb(c/0xff) for c in (r,g,b)] + [alpha])
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from colors import hex_to_rgb
+from keyframes import insert_keys
+from materials import cached_material
+from point_cache import bake_rigid_bodies
+from profiling import profiled
+from selection import all_of, half_space, select_vertices, vectors
 
+@profiled
 def render(engine, frame_end, samples=32):
     scene = bpy.context.scene
     scene.frame_end = frame_end
@@ -25,6 +27,7 @@ def render(engine, frame_end, samples=32):
         scene.cycles.preview_samples = samples
         scene.cycles.samples = samples
 
+@cached_material
 def principled_material(color=(0.8, 0.8, 0.8, 1), roughness=0.5, metallic=0):
     material = bpy.data.materials.new(name="Principled")
     material.use_nodes = True
@@ -53,42 +56,23 @@ def principled_material(color=(0.8, 0.8, 0.8, 1), roughness=0.5, metallic=0):
     links.new(principled_node.outputs[0], output_node.inputs[0])
     return material
 
+@profiled
 def create_plane():
     bpy.ops.object.mode_set(mode='OBJECT')
     bpy.ops.mesh.primitive_plane_add(enter_editmode=False, align='WORLD', location=(0, 0, -3.2), size=100)
     obj = bpy.context.object
     obj.name = 'Floor'
 
-    mesh = obj.data
-    # select top edge
+    # select left edge
+    select_vertices(obj, half_space('X', 0, above=False))
     bpy.ops.object.mode_set(mode='EDIT')
     bpy.ops.mesh.select_mode(type="VERT")
-    bpy.ops.mesh.select_all(action = 'DESELECT')
-    # we need to switch from Edit mode to Object mode so the selection gets updated
-    bpy.ops.object.mode_set(mode='OBJECT')
-    verts = [v for v in mesh.vertices if v.co[0] < 0]
-    for v in verts:
-        v.select = True
-    """
-    for v in mesh.vertices:
-        if v.co[0] < 0:
-            v.select = True
-    """
-    bpy.ops.object.mode_set(mode='EDIT')
 
     # extrude z 50
     bpy.ops.mesh.extrude_region_move(MESH_OT_extrude_region={"use_normal_flip":False, "use_dissolve_ortho_edges":False, "mirror":False}, TRANSFORM_OT_translate={"value":(0, 0, 50), "orient_type":'GLOBAL', "orient_matrix":((1, 0, 0), (0, 1, 0), (0, 0, 1)), "orient_matrix_type":'GLOBAL', "constraint_axis":(False, False, True), "mirror":False, "use_proportional_edit":False, "proportional_edit_falloff":'SMOOTH', "proportional_size":1, "use_proportional_connected":False, "use_proportional_projected":False, "snap":False, "snap_elements":{'INCREMENT'}, "use_snap_project":False, "snap_target":'CLOSEST', "use_snap_self":True, "use_snap_edit":True, "use_snap_nonedit":True, "use_snap_selectable":False, "snap_point":(0, 0, 0), "snap_align":False, "snap_normal":(0, 0, 0), "gpencil_strokes":False, "cursor_transform":False, "texture_space":False, "remove_on_cancel":False, "use_duplicated_keyframes":False, "view2d_edge_pan":False, "release_confirm":False, "use_accurate":False, "use_automerge_and_split":False})
     
-    # select top edge
-    bpy.ops.mesh.select_mode(type="VERT")
-    bpy.ops.mesh.select_all(action = 'DESELECT')
-    # we need to switch from Edit mode to Object mode so the selection gets updated
-    bpy.ops.object.mode_set(mode='OBJECT')
-    for v in mesh.vertices:
-        if v.co[0] < 0 and v.co[2] < 1:
-            v.select = True
-
-    bpy.ops.object.mode_set(mode='EDIT')  
+    # select bottom of the left edge
+    select_vertices(obj, all_of(half_space('X', 0, above=False), half_space('Z', 1, above=False)))
     bpy.ops.mesh.bevel(offset=10, offset_pct=0, segments=10, affect='EDGES')
 
     bpy.ops.object.mode_set(mode='OBJECT')
@@ -98,6 +82,7 @@ def create_plane():
     material = principled_material()
     bpy.context.object.data.materials.append(material)
 
+@profiled
 def create_rigid_body_passive(collision_shape = 'CONVEX_HULL'):
     bpy.ops.rigidbody.object_add()
     obj = bpy.context.object
@@ -119,6 +104,7 @@ def add_bevel():
     settings.width = 0.01
     settings.segments = 2
 
+@profiled
 def rigid_body_passive():
     bpy.ops.mesh.primitive_cube_add(enter_editmode=False, align='WORLD', location=(0, 0, 0), scale=(0.8, 0.1, 3))
     add_bevel()
@@ -150,6 +136,7 @@ def rigid_body_passive():
     bpy.ops.mesh.primitive_cylinder_add(enter_editmode=False, align='WORLD', location=(-0.2, 2.8, -2.5), scale=(0.1, 0.1, 2), rotation=(math.radians(100), 0, 0))
     create_rigid_body_passive()
 
+@profiled
 def rigid_body_active():
     bpy.ops.mesh.primitive_uv_sphere_add(radius=1, enter_editmode=False, align='WORLD', location=(0, 1, 3), scale=(0.3, 0.3, 0.3))
     bpy.ops.object.shade_smooth()
@@ -169,6 +156,7 @@ def rigid_body_active():
     material = principled_material(hex_to_rgb(0x0000ff), roughness = 0.3, metallic = 0.3)
     bpy.context.object.data.materials.append(material)
 
+@profiled
 def join_passive():
     bpy.ops.object.select_all(action='DESELECT')
     bpy.data.objects['Cube'].select_set(True)
@@ -188,7 +176,154 @@ def join_passive():
     bpy.context.object.rigid_body.collision_shape = 'MESH'
     bpy.context.object.rigid_body.mass = 10
     bpy.context.scene.rigidbody_world.substeps_per_frame = 3
-
+    if (collision_mode == 'compound'):
+        compound_collision(bpy.context.object)
+
+# rack parts as (primitive, location, rotation in degrees, scale), same layout as rigid_body_passive()
+RACK_PARTS = [
+    ('CUBE', (0, 0, 0), (0, 0, 0), (0.8, 0.1, 3)),
+    ('CUBE', (0, 4.8, 0), (0, 0, 0), (0.8, 0.1, 3)),
+    ('CUBE', (0, 2.5, -3.1), (0, 0, 0), (2, 3, 0.1)),
+    ('CYLINDER', (0.2, 2, 2), (75, 0, 0), (0.1, 0.1, 2)),
+    ('CYLINDER', (-0.2, 2, 2), (75, 0, 0), (0.1, 0.1, 2)),
+    ('CYLINDER', (0.2, 2.8, 0.5), (100, 0, 0), (0.1, 0.1, 2)),
+    ('CYLINDER', (-0.2, 2.8, 0.5), (100, 0, 0), (0.1, 0.1, 2)),
+    ('CYLINDER', (0.2, 2, -1), (75, 0, 0), (0.1, 0.1, 2)),
+    ('CYLINDER', (-0.2, 2, -1), (75, 0, 0), (0.1, 0.1, 2)),
+    ('CYLINDER', (0.2, 2.8, -2.5), (100, 0, 0), (0.1, 0.1, 2)),
+    ('CYLINDER', (-0.2, 2.8, -2.5), (100, 0, 0), (0.1, 0.1, 2)),
+]
+
+def part_matrix(location, rotation, scale):
+    rotation = mathutils.Euler([math.radians(angle) for angle in rotation], 'XYZ')
+    return mathutils.Matrix.LocRotScale(Vector(location), rotation, Vector(scale))
+
+def rack_mesh(parts=RACK_PARTS, origin=(0.2, 2, 2), cylinder_vertices=32):
+    # all parts in one bmesh, relative to the origin of the rigid body
+    bm = bmesh.new()
+    uv_layer = bm.loops.layers.uv.new("UVMap")
+    to_origin = mathutils.Matrix.Translation(-Vector(origin))
+    for primitive, location, rotation, scale in parts:
+        matrix = to_origin @ part_matrix(location, rotation, scale)
+        if (primitive == 'CUBE'):
+            bmesh.ops.create_cube(bm, size=2, matrix=matrix, calc_uvs=True)
+        else:
+            bmesh.ops.create_cone(bm, cap_ends=True, cap_tris=False, segments=cylinder_vertices, radius1=1, radius2=1, depth=2, matrix=matrix, calc_uvs=True)
+    mesh = bpy.data.meshes.new("Rack")
+    bm.to_mesh(mesh)
+    bm.free()
+    return mesh
+
+def add_rigid_body(obj, type='ACTIVE', **settings):
+    # one operator call per object, no selection changes
+    with bpy.context.temp_override(object=obj, active_object=obj, selected_objects=[obj], selected_editable_objects=[obj]):
+        bpy.ops.rigidbody.object_add(type=type)
+    for name, value in settings.items():
+        setattr(obj.rigid_body, name, value)
+    return obj.rigid_body
+
+def mesh_islands(mesh):
+    # connected parts as arrays of vertex indices, labels spread along the edges until they settle
+    edges = np.empty(len(mesh.edges) * 2, dtype=np.int32)
+    mesh.edges.foreach_get('vertices', edges)
+    a, b = edges[0::2], edges[1::2]
+    labels = np.arange(len(mesh.vertices))
+    while True:
+        low = np.minimum(labels[a], labels[b])
+        spread = labels.copy()
+        np.minimum.at(spread, a, low)
+        np.minimum.at(spread, b, low)
+        spread = spread[spread]
+        if (np.array_equal(spread, labels)):
+            break
+        labels = spread
+    return [np.flatnonzero(labels == label) for label in np.unique(labels)]
+
+def _frame(center, axes):
+    # right handed, so it is a rotation
+    if (np.linalg.det(axes) < 0):
+        axes[:, 0] = -axes[:, 0]
+    matrix = mathutils.Matrix(axes.tolist()).to_4x4()
+    matrix.translation = Vector(center.tolist())
+    return matrix
+
+def fit_shape(co, tolerance=0.02):
+    # principal axes of the part, then the simplest shape all its vertices lie on:
+    # every vertex on a corner is a box, two rims of equal radius at both ends is a cylinder,
+    # anything else keeps its convex hull; returns (shape, frame, half extents)
+    mean = co.mean(axis=0)
+    _, axes = np.linalg.eigh(np.cov((co - mean).T))
+    local = (co - mean) @ axes
+    low, high = local.min(axis=0), local.max(axis=0)
+    center = mean + axes @ ((low + high) / 2)
+    local = (co - center) @ axes
+    half = (high - low) / 2
+    tol = tolerance * half.max()
+    if (np.all(np.abs(np.abs(local) - half) < tol)):
+        return 'BOX', _frame(center, axes), half
+    for axis in range(3):
+        others = [i for i in range(3) if i != axis]
+        radius = np.linalg.norm(local[:, others], axis=1)
+        if (np.all(np.abs(np.abs(local[:, axis]) - half[axis]) < tol) and np.ptp(radius) < tol
+                and abs(half[others[0]] - half[others[1]]) < tol):
+            # blender's cylinder shape runs along local z
+            return 'CYLINDER', _frame(center, axes[:, others + [axis]]), half[others + [axis]]
+    return 'CONVEX_HULL', _frame(center, axes), half
+
+def collision_part(parent, shape, frame, half, co):
+    # hidden child carrying one shape of the compound, sized by its mesh, placed by its world matrix
+    bm = bmesh.new()
+    if (shape == 'BOX'):
+        bmesh.ops.create_cube(bm, size=2, matrix=mathutils.Matrix.Diagonal(Vector(half.tolist())).to_4x4())
+    elif (shape == 'CYLINDER'):
+        bmesh.ops.create_cone(bm, cap_ends=True, cap_tris=False, segments=16, radius1=half[0], radius2=half[0], depth=half[2] * 2)
+    else:
+        to_frame = frame.inverted()
+        for v in co.tolist():
+            bm.verts.new(to_frame @ Vector(v))
+        bmesh.ops.convex_hull(bm, input=bm.verts)
+    mesh = bpy.data.meshes.new(parent.name + "_" + shape.lower())
+    bm.to_mesh(mesh)
+    bm.free()
+    obj = bpy.data.objects.new(mesh.name, mesh)
+    bpy.context.collection.objects.link(obj)
+    obj.parent = parent
+    obj.matrix_parent_inverse = parent.matrix_world.inverted()
+    obj.matrix_world = frame
+    obj.display_type = 'WIRE'
+    obj.hide_render = True
+    add_rigid_body(obj, parent.rigid_body.type, collision_shape=shape,
+                   friction=parent.rigid_body.friction, restitution=parent.rigid_body.restitution)
+    return obj
+
+@profiled
+def compound_collision(obj, tolerance=0.02):
+    # each connected part of obj becomes a primitive shape instead of one triangle mesh,
+    # parts that are neither box nor cylinder fall back to their own convex hull
+    co = vectors(obj.data.vertices)
+    matrix = np.array(obj.matrix_world, dtype=np.float32)
+    co = co @ matrix[:3, :3].T + matrix[:3, 3]
+    shapes = {'BOX': 0, 'CYLINDER': 0, 'CONVEX_HULL': 0}
+    for island in mesh_islands(obj.data):
+        shape, frame, half = fit_shape(co[island], tolerance)
+        collision_part(obj, shape, frame, half, co[island])
+        shapes[shape] += 1
+    obj.rigid_body.collision_shape = 'COMPOUND'
+    print("collision: %s compound of %d box, %d cylinder, %d convex hull parts"
+          % (obj.name, shapes['BOX'], shapes['CYLINDER'], shapes['CONVEX_HULL']))
+    return shapes
+
+@profiled
+def create_rack(origin=(0.2, 2, 2)):
+    obj = bpy.data.objects.new("Rack", rack_mesh(origin=origin))
+    obj.location = origin
+    bpy.context.collection.objects.link(obj)
+    add_rigid_body(obj, 'ACTIVE', collision_shape='MESH', mass=10, friction=1, restitution=1)
+    if (collision_mode == 'compound'):
+        compound_collision(obj)
+    return obj
+
+@profiled
 def large_ball():
     bpy.ops.mesh.primitive_uv_sphere_add(radius=1, enter_editmode=False, align='WORLD', location=(0, -12, 0), scale=(3, 3, 3))
     bpy.ops.object.shade_smooth()
@@ -203,38 +338,44 @@ def large_ball():
     obj.rigid_body.mass = 10
     obj.rigid_body.kinematic = True
 
-    bpy.context.scene.frame_current = 61
-    bpy.ops.transform.translate(value=(-0, -5, -0), orient_type='GLOBAL', orient_matrix=((1, 0, 0), (0, 1, 0), (0, 0, 1)), orient_matrix_type='GLOBAL', constraint_axis=(False, True, False), mirror=False, use_proportional_edit=False, proportional_edit_falloff='SMOOTH', proportional_size=1, use_proportional_connected=False, use_proportional_projected=False, snap=False, snap_elements={'INCREMENT'}, use_snap_project=False, snap_target='CLOSEST', use_snap_self=True, use_snap_edit=True, use_snap_nonedit=True, use_snap_selectable=False)
-    bpy.ops.anim.keyframe_insert_by_name(type="Location")
-
-    bpy.context.scene.frame_current = 64
-    bpy.ops.transform.translate(value=(-0, 5, -0), orient_type='GLOBAL', orient_matrix=((1, 0, 0), (0, 1, 0), (0, 0, 1)), orient_matrix_type='GLOBAL', constraint_axis=(False, True, False), mirror=False, use_proportional_edit=False, proportional_edit_falloff='SMOOTH', proportional_size=1, use_proportional_connected=False, use_proportional_projected=False, snap=False, snap_elements={'INCREMENT'}, use_snap_project=False, snap_target='CLOSEST', use_snap_self=True, use_snap_edit=True, use_snap_nonedit=True, use_snap_selectable=False)
-    bpy.ops.anim.keyframe_insert_by_name(type="Location")
-    obj.keyframe_insert('rigid_body.kinematic')
-
-    bpy.context.scene.frame_current = 65
-    bpy.context.object.rigid_body.kinematic = False
-    obj.keyframe_insert('rigid_body.kinematic')
+    # pulled back 5 on frame 61, swings in by frame 64, then the simulation takes over
+    location = obj.location.copy()
+    insert_keys(obj, 'location', [61, 64], [location + Vector((0, -5, 0)), location], group="Object Transforms")
+    insert_keys(obj.rigid_body, 'kinematic', [64, 65], [True, False], interpolation='CONSTANT')
+    obj.rigid_body.kinematic = False
 
+@profiled
 def rigid_world():
     scene = bpy.context.scene
     scene.rigidbody_world.enabled = True
     scene.rigidbody_world.time_scale = 2.5
     bpy.context.scene.rigidbody_world.substeps_per_frame = 3
 
+@profiled
 def create_light(energy):
     light = bpy.data.objects['Light']
     light.data.energy = energy
     light.data.shadow_soft_size = 3
 
-rigid_body_passive()
+# PHYSICS_RACK_BUILDER=ops builds the rack with the original operator calls, for timing comparisons
+rack_builder = os.environ.get('PHYSICS_RACK_BUILDER', 'bmesh')
+# PHYSICS_COLLISION=compound replaces the rack's triangle mesh shape with primitive shapes per part,
+# the floor keeps its mesh shape, its curved wall is concave
+collision_mode = os.environ.get('PHYSICS_COLLISION', 'mesh')
+setup_start = time.perf_counter()
+if (rack_builder == 'ops'):
+    rigid_body_passive()
+else:
+    create_rack()
 rigid_body_active()
 rigid_world()
 create_plane()
 create_rigid_body_passive(collision_shape='MESH')
 
-join_passive()
+if (rack_builder == 'ops'):
+    join_passive()
 large_ball()
+print("scene setup (%s rack): %.3f s" % (rack_builder, time.perf_counter() - setup_start))
 
 # set camera
 camera = bpy.data.objects['Camera']
@@ -242,6 +383,8 @@ camera.location = Vector((25, 10, 5))
 camera.rotation_euler = mathutils.Euler((math.radians(80), 0, math.radians(108)), 'XYZ')
 
 render('BLENDER_EEVEE', 150)
+# simulated once for the 150 frames, later runs and every render worker play the baked transforms back
+bake_rigid_bodies()
 create_light(3000)
 bpy.data.worlds["World"].node_tree.nodes["Background"].inputs[0].default_value = hex_to_rgb(0x828282)
 #material = bpy.data.materials.get('WoodP')
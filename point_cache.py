@@ -0,0 +1,265 @@
+import atexit
+import os
+import shutil
+import tempfile
+
+import bpy
+from mathutils import Matrix
+import numpy as np
+
+from bake_cache import bake, bake_cache_report, directory_size, object_values, read_manifest, rna_values
+from keyframes import insert_keys
+from profiling import profiled
+
+# POINT_CACHE_BAKE=0 simulates particles, cloth and rigid bodies live from the first frame, as before baking existed
+BAKE_POINT_CACHES = os.environ.get("POINT_CACHE_BAKE", "1") != "0"
+# 'NO', 'LIGHT' or 'HEAVY', smaller bakes for slower reads, render farms on shared storage want 'LIGHT'
+COMPRESSION = os.environ.get("POINT_CACHE_COMPRESSION", 'NO')
+EXTENSION = ".bphys"
+RIGID_BODY_TRANSFORMS = "transforms.npz"
+
+def _disk_cache_directory():
+    # blender only writes point caches to disk next to a saved .blend, headless scripts never save,
+    # so the session is saved to a scratch file once and the baked frames are moved out of its blendcache.
+    # a copy would leave bpy.data.filepath empty and blender refuses the disk bake, so the session really
+    # moves there: bpy.data.filepath and '//' paths point into the scratch directory for the rest of the run,
+    # the directory is removed when blender exits
+    if (not bpy.data.filepath):
+        scratch = tempfile.mkdtemp(prefix="point_cache_")
+        atexit.register(shutil.rmtree, scratch, ignore_errors=True)
+        bpy.ops.wm.save_as_mainfile(filepath=os.path.join(scratch, "session.blend"), check_existing=False)
+    name = os.path.splitext(os.path.basename(bpy.data.filepath))[0]
+    return bpy.path.abspath("//blendcache_%s" % name)
+
+def _cache_index(directory, name):
+    # <name>_<frame>_<index>.bphys, the index tells caches of the same object apart
+    for filename in os.listdir(directory):
+        if (filename.startswith(name + "_") and filename.endswith(EXTENSION)):
+            parts = filename[len(name) + 1:-len(EXTENSION)].split("_")
+            return int(parts[1]) if len(parts) > 1 else -1
+    return -1
+
+def _bake_to(obj, cache, name, directory, compression):
+    # the session has to be saved before the disk cache is switched on, blender turns it off again otherwise
+    source = _disk_cache_directory()
+    cache.use_external = False
+    cache.name = name
+    cache.use_disk_cache = True
+    if (not cache.use_disk_cache):
+        raise RuntimeError("%s: blender did not enable the disk cache for %s" % (name, obj.name))
+    cache.compression = compression
+    with bpy.context.temp_override(object=obj, active_object=obj, point_cache=cache):
+        bpy.ops.ptcache.free_bake()
+        bpy.ops.ptcache.bake(bake=True)
+    moved = 0
+    for filename in os.listdir(source) if os.path.isdir(source) else []:
+        if (filename.startswith(name + "_") and filename.endswith(EXTENSION)):
+            shutil.move(os.path.join(source, filename), os.path.join(directory, filename))
+            moved += 1
+    # an empty directory must not become a cache entry
+    if (not moved):
+        raise RuntimeError("%s: the bake of %s wrote no %s files to %s" % (name, obj.name, EXTENSION, source))
+
+def use_external(cache, directory, name):
+    # an external cache reads any frame straight from its file, nothing before it is simulated
+    cache.use_external = True
+    cache.name = name
+    cache.index = _cache_index(directory, name)
+    cache.filepath = directory
+
+def bake_point_cache(kind, obj, cache, params, compression=COMPRESSION):
+    # bakes cache once per params, later runs with the same parameters load the files from the bake cache,
+    # compression only changes how the frames are stored so it is not part of the key
+    if (compression not in {'NO', 'LIGHT', 'HEAVY'}):
+        raise ValueError("unknown point cache compression '%s', expected NO, LIGHT or HEAVY" % compression)
+    name = kind
+    directory, hit = bake(kind, params, lambda directory: _bake_to(obj, cache, name, directory, compression))
+    use_external(cache, directory, name)
+    print("%s cache %s: %s, frames %d-%d, baked in %.1f s, %.1f MB on disk"
+          % (kind, os.path.basename(directory), "hit" if hit else "baked", cache.frame_start, cache.frame_end,
+             read_manifest(directory)['bake_time'], directory_size(directory) / 2**20))
+    return directory
+
+def _effector_values(scene):
+    # force fields and colliders anywhere in the scene can push the particles
+    values = []
+    for obj in sorted(scene.objects, key=lambda o: o.name):
+        field = obj.field
+        collision = any(m.type == 'COLLISION' for m in obj.modifiers)
+        if ((field is None or field.type == 'NONE') and not collision):
+            continue
+        values.append(dict(object_values(obj), field=rna_values(field) if field else None,
+                           collision=rna_values(obj.collision) if collision else None))
+    return values
+
+def _rule_values(rule):
+    # goal, avoid and follow leader rules steer toward an object
+    target = getattr(rule, 'object', None)
+    return dict(rna_values(rule), type=rule.type, object=target and object_values(target))
+
+def particle_params(obj, psys):
+    scene = bpy.context.scene
+    settings = psys.settings
+    return {
+        'fps': scene.render.fps,
+        'emitter': object_values(obj),
+        'settings': rna_values(settings),
+        'seed': psys.seed,
+        'effector_weights': rna_values(settings.effector_weights),
+        'boids': settings.boids and [dict(rna_values(state), rules=[_rule_values(rule) for rule in state.rules])
+                                     for state in settings.boids.states],
+        'textures': [dict(rna_values(slot), texture=slot.texture and rna_values(slot.texture))
+                     for slot in settings.texture_slots if slot],
+        # the particle cache runs from settings.frame_start to the particles' last death, clamped to the scene
+        'frame_end': scene.frame_end,
+        'effectors': _effector_values(scene),
+    }
+
+def cloth_modifier(obj):
+    for modifier in obj.modifiers:
+        if (modifier.type == 'CLOTH'):
+            return modifier
+    return None
+
+def _deform_targets(obj):
+    # curve and lattice modifiers shape the cloth before it simulates
+    targets = []
+    for modifier in obj.modifiers:
+        target = getattr(modifier, 'object', None)
+        if (target is None):
+            continue
+        values = object_values(target)
+        if (target.type == 'CURVE'):
+            values['points'] = [[list(point.co) for point in spline.points] + [list(point.co) for point in spline.bezier_points]
+                                for spline in target.data.splines]
+        targets.append(values)
+    return targets
+
+def cloth_params(obj, modifier):
+    scene = bpy.context.scene
+    return {
+        'fps': scene.render.fps,
+        'cloth': object_values(obj),
+        'settings': rna_values(modifier.settings),
+        'collision_settings': rna_values(modifier.collision_settings),
+        'effector_weights': rna_values(modifier.settings.effector_weights),
+        'frames': [modifier.point_cache.frame_start, modifier.point_cache.frame_end],
+        'deform_targets': _deform_targets(obj),
+        'effectors': _effector_values(scene),
+    }
+
+@profiled
+def bake_cloth(obj, compression=COMPRESSION):
+    # call once the colliders and scene.frame_end are final, see _disk_cache_directory for an unsaved session
+    if (not BAKE_POINT_CACHES):
+        return None
+    modifier = cloth_modifier(obj)
+    cache = modifier.point_cache
+    cache.frame_end = min(cache.frame_end, bpy.context.scene.frame_end)
+    directory = bake_point_cache('cloth', obj, cache, cloth_params(obj, modifier), compression)
+    bake_cache_report()
+    return directory
+
+@profiled
+def bake_particles(obj, compression=COMPRESSION):
+    # call once everything that moves the particles is in the scene, scene.frame_end included,
+    # see _disk_cache_directory for an unsaved session
+    if (not BAKE_POINT_CACHES):
+        return []
+    directories = []
+    for psys in obj.particle_systems:
+        directories.append(bake_point_cache('particles', obj, psys.point_cache, particle_params(obj, psys), compression))
+    bake_cache_report()
+    return directories
+
+def bake_scene_particles(compression=COMPRESSION):
+    # every particle system in the scene, a render worker can then start at any frame without stepping up to it
+    directories = {}
+    for obj in sorted(bpy.context.scene.objects, key=lambda o: o.name):
+        if (len(obj.particle_systems)):
+            directories[obj.name] = bake_particles(obj, compression)
+    return directories
+
+def _rigid_bodies(scene):
+    return sorted(scene.rigidbody_world.collection.objects, key=lambda o: o.name)
+
+def rigid_body_params(scene):
+    world = scene.rigidbody_world
+    constraints = world.constraints.objects if world.constraints else []
+    return {
+        'fps': scene.render.fps,
+        'fps_base': round(scene.render.fps_base, 6),
+        'gravity': [round(g, 6) for g in scene.gravity] if scene.use_gravity else None,
+        'world': rna_values(world),
+        'frames': [world.point_cache.frame_start, world.point_cache.frame_end],
+        'bodies': [dict(object_values(obj), rigid_body=rna_values(obj.rigid_body)) for obj in _rigid_bodies(scene)],
+        'constraints': [dict(object_values(obj), constraint=rna_values(obj.rigid_body_constraint))
+                        for obj in sorted(constraints, key=lambda o: o.name)],
+    }
+
+def _capture_rigid_bodies(scene, bodies, directory):
+    # the rigid body cache lives in memory only, so the one pass the simulation needs anyway
+    # records the world matrix of every body on every frame
+    cache = scene.rigidbody_world.point_cache
+    frames = np.arange(cache.frame_start, cache.frame_end + 1)
+    matrices = np.empty((len(frames), len(bodies), 4, 4), dtype=np.float32)
+    frame = scene.frame_current
+    try:
+        for i, f in enumerate(frames.tolist()):
+            scene.frame_set(f)
+            depsgraph = bpy.context.evaluated_depsgraph_get()
+            for j, obj in enumerate(bodies):
+                matrices[i, j] = obj.evaluated_get(depsgraph).matrix_world
+    finally:
+        scene.frame_set(frame)
+    np.savez(os.path.join(directory, RIGID_BODY_TRANSFORMS), frames=frames,
+             names=np.array([obj.name for obj in bodies]), matrices=matrices)
+
+def _key_rigid_bodies(scene, directory):
+    # one key per frame on every body that moves, quaternions keep the rotation continuous where euler
+    # angles would wrap; the parts of a compound follow their parent, the other bodies have no parent
+    # so their world matrix is their local one
+    data = np.load(os.path.join(directory, RIGID_BODY_TRANSFORMS))
+    frames = data['frames']
+    keyed = 0
+    for name, matrices in zip(data['names'].tolist(), data['matrices'].transpose(1, 0, 2, 3)):
+        obj = scene.objects.get(name)
+        if (obj is None or obj.parent is not None or np.ptp(matrices, axis=0).max() < 1e-6):
+            continue
+        locations, rotations, scales = [], [], []
+        previous = None
+        for matrix in matrices:
+            location, rotation, scale = Matrix(matrix.tolist()).decompose()
+            if (previous is not None):
+                rotation.make_compatible(previous)
+            previous = rotation
+            locations.append(location)
+            rotations.append(rotation)
+            scales.append(scale)
+        obj.rotation_mode = 'QUATERNION'
+        insert_keys(obj, 'location', frames, locations, interpolation='LINEAR', group="Object Transforms")
+        insert_keys(obj, 'rotation_quaternion', frames, rotations, interpolation='LINEAR', group="Object Transforms")
+        insert_keys(obj, 'scale', frames, scales, interpolation='LINEAR', group="Object Transforms")
+        keyed += 1
+    # the keys are the simulation now, an enabled world would simulate again on top of them
+    scene.rigidbody_world.enabled = False
+    return keyed
+
+@profiled
+def bake_rigid_bodies():
+    # call once the bodies, the world settings and scene.frame_end are final,
+    # any frame is then a keyframe lookup and a render worker can start anywhere
+    scene = bpy.context.scene
+    world = scene.rigidbody_world
+    if (not BAKE_POINT_CACHES or world is None or not world.enabled):
+        return None
+    world.point_cache.frame_end = min(world.point_cache.frame_end, scene.frame_end)
+    bodies = _rigid_bodies(scene)
+    directory, hit = bake('rigid_body', rigid_body_params(scene),
+                          lambda directory: _capture_rigid_bodies(scene, bodies, directory))
+    keyed = _key_rigid_bodies(scene, directory)
+    print("rigid body cache %s: %s, %d of %d bodies keyed, frames %d-%d, baked in %.1f s"
+          % (os.path.basename(directory), "hit" if hit else "baked", keyed, len(bodies), world.point_cache.frame_start,
+             world.point_cache.frame_end, read_manifest(directory)['bake_time']))
+    bake_cache_report()
+    return directory
@@ -0,0 +1,133 @@
+import atexit
+import functools
+import json
+import os
+import sys
+import time
+
+import bpy
+from bpy.app.handlers import persistent
+
+# BLENDER_PROFILE=profile.txt turns the hooks on, without it @profiled returns the function untouched.
+# the file is in collapsed stack format, one "outer;inner <microseconds>" line per step with its self time,
+# flamegraph.pl profile.txt > profile.svg or speedscope draw it
+PROFILE_PATH = os.environ.get("BLENDER_PROFILE")
+
+# step name -> {'calls', 'time', 'ops', 'datablocks', 'depsgraph_updates'}, totals including nested steps
+profile_stats = {}
+# stack path -> self time in seconds
+_self_times = {}
+_stack = []
+_counters = {'ops': 0, 'depsgraph_updates': 0}
+# one entry per operator call while log_ops() is on
+ops_log = []
+_ops_logging = [False]
+
+def profiling_enabled():
+    return PROFILE_PATH is not None
+
+def datablock_count():
+    # every ID in bpy.data: objects, meshes, materials, node groups, images, actions...
+    return sum(len(getattr(bpy.data, prop.identifier)) for prop in bpy.data.bl_rna.properties
+               if prop.type == 'COLLECTION' and prop.identifier != 'window_managers')
+
+@persistent
+def _count_depsgraph_update(scene, depsgraph=None):
+    _counters['depsgraph_updates'] += 1
+
+def _count_ops():
+    # every bpy.ops.<module>.<operator>(...) goes through this __call__
+    from bpy.ops import _BPyOpsSubModOp
+    call = _BPyOpsSubModOp.__call__
+    if (getattr(call, 'profiled', False)):
+        return
+
+    def counted_call(self, *args, **kwargs):
+        _counters['ops'] += 1
+        if (not _ops_logging[0]):
+            return call(self, *args, **kwargs)
+        caller = sys._getframe(1)
+        mode = bpy.context.mode
+        start = time.perf_counter()
+        try:
+            return call(self, *args, **kwargs)
+        finally:
+            ops_log.append({'op': self.idname_py(), 'file': caller.f_code.co_filename, 'line': caller.f_lineno,
+                            'time': time.perf_counter() - start, 'mode': mode})
+    counted_call.profiled = True
+    _BPyOpsSubModOp.__call__ = counted_call
+
+def log_ops():
+    # records every operator call from now on: operator, calling line, duration and context mode
+    _count_ops()
+    _ops_logging[0] = True
+
+def write_ops_log(path):
+    with open(path, 'w') as f:
+        json.dump(ops_log, f)
+
+class profile_step:
+    # with profile_step("create_pipe"): ...  times the block as one step nested under the running steps
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        if (not profiling_enabled()):
+            return self
+        _stack.append(self)
+        self.children = 0.0
+        self.start = (time.perf_counter(), _counters['ops'], datablock_count(), _counters['depsgraph_updates'])
+        return self
+
+    def __exit__(self, *exc):
+        if (not profiling_enabled()):
+            return False
+        start, ops, datablocks, updates = self.start
+        elapsed = time.perf_counter() - start
+        path = ";".join(step.name for step in _stack)
+        _stack.pop()
+        if (_stack):
+            _stack[-1].children += elapsed
+        _self_times[path] = _self_times.get(path, 0.0) + elapsed - self.children
+
+        stats = profile_stats.setdefault(self.name, {'calls': 0, 'time': 0.0, 'ops': 0, 'datablocks': 0, 'depsgraph_updates': 0})
+        stats['calls'] += 1
+        stats['time'] += elapsed
+        stats['ops'] += _counters['ops'] - ops
+        stats['datablocks'] += datablock_count() - datablocks
+        stats['depsgraph_updates'] += _counters['depsgraph_updates'] - updates
+        return False
+
+def profiled(function):
+    if (not profiling_enabled()):
+        return function
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        with profile_step(function.__qualname__):
+            return function(*args, **kwargs)
+    return wrapper
+
+def write_profile(path=None):
+    path = path or PROFILE_PATH
+    with open(path, 'w') as f:
+        for stack, seconds in sorted(_self_times.items()):
+            f.write("%s %d\n" % (stack, round(seconds * 1e6)))
+
+def profile_report():
+    print("%-32s %6s %10s %6s %10s %10s" % ("step", "calls", "time", "ops", "datablocks", "updates"))
+    for name, stats in sorted(profile_stats.items(), key=lambda item: -item[1]['time']):
+        print("%-32s %6d %8.3f s %6d %10d %10d" % (name, stats['calls'], stats['time'], stats['ops'],
+                                                  stats['datablocks'], stats['depsgraph_updates']))
+
+def _finish():
+    if (profile_stats):
+        write_profile()
+        profile_report()
+        print("profile written to %s" % os.path.abspath(PROFILE_PATH))
+
+if (profiling_enabled()):
+    _count_ops()
+    if (_count_depsgraph_update not in bpy.app.handlers.depsgraph_update_post):
+        bpy.app.handlers.depsgraph_update_post.append(_count_depsgraph_update)
+    atexit.register(_finish)
@@ -0,0 +1,58 @@
+import os
+
+from bake_cache import script_argv
+
+# settings that trade bake and build time for detail, always changed together
+# frames: fraction of the script's cache range that is simulated
+# upres: mesh upres for liquids, noise upres for gas, the base grid stays coarse
+# pipe_segments: segments around and along the water_balancing pipe
+# cloth_proxy_cuts: cuts along and across the scroll's cloth proxy, final matches the display mesh
+PROFILES = {
+    'preview': {'resolution_max': 24, 'upres': 1, 'particle_radius': 1.4, 'frames': 0.5, 'pipe_segments': 8,
+                'cloth_proxy_cuts': (10, 5)},
+    'draft': {'resolution_max': 64, 'upres': 1, 'particle_radius': 1.2, 'frames': 1.0, 'pipe_segments': 12,
+              'cloth_proxy_cuts': (20, 10)},
+    'final': {'resolution_max': 96, 'upres': 2, 'particle_radius': 1.0, 'frames': 1.0, 'pipe_segments': 24,
+              'cloth_proxy_cuts': (40, 20)},
+}
+# values quality_value() gives when no profile is asked for, fluid domains then keep the script's own settings
+DEFAULT_PROFILE = 'draft'
+
+def quality_name():
+    # blender -b --python script.py -- --quality final, or BLENDER_QUALITY=final, None when neither is given
+    argv = script_argv()
+    if ("--quality" in argv):
+        index = argv.index("--quality") + 1
+        name = argv[index] if index < len(argv) else None
+        if (name is None):
+            raise ValueError("--quality needs a profile name, expected one of %s" % ", ".join(PROFILES))
+    else:
+        name = os.environ.get("BLENDER_QUALITY")
+    if (name is not None and name not in PROFILES):
+        raise ValueError("unknown quality profile '%s', expected one of %s" % (name, ", ".join(PROFILES)))
+    return name
+
+def quality_value(key, name=None):
+    return PROFILES[name or quality_name() or DEFAULT_PROFILE][key]
+
+def apply_quality(settings, name=None):
+    # call after cache_frame_end is set, the profile shortens the range from there;
+    # without a profile the domain keeps the resolution and range the script gave it
+    name = name or quality_name()
+    if (name is None):
+        print("quality: script defaults, resolution %d, frames %d-%d" % (settings.resolution_max, settings.cache_frame_start,
+                                                                      settings.cache_frame_end))
+        return None
+    profile = PROFILES[name]
+    settings.resolution_max = profile['resolution_max']
+    if (settings.domain_type == 'LIQUID'):
+        settings.particle_radius = profile['particle_radius']
+        settings.mesh_scale = profile['upres']
+    else:
+        settings.use_noise = profile['upres'] > 1
+        settings.noise_scale = max(profile['upres'], 2)
+    frames = settings.cache_frame_end - settings.cache_frame_start
+    settings.cache_frame_end = settings.cache_frame_start + round(frames * profile['frames'])
+    print("quality %s: resolution %d, upres %d, frames %d-%d" % (name, settings.resolution_max, profile['upres'],
+                                                              settings.cache_frame_start, settings.cache_frame_end))
+    return name
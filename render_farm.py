@@ -0,0 +1,156 @@
+# render one of the effect scripts headless, split across several blender processes
+# python render_farm.py physics.py --workers 4 --output renders/physics --video renders/physics.mp4
+# python render_farm.py water_balancing.py --operator object.water_balancing --frames 1-120
+import argparse
+import os
+import re
+import subprocess
+import sys
+import time
+
+FORMATS = {'PNG': 'png', 'OPEN_EXR': 'exr'}
+FRAME_NAME = "frame_"
+# workers write here and move each frame out once it is complete, a killed worker leaves no half-written frame behind
+PARTIAL_DIR = ".partial"
+PROBE_MARKER = "render_farm frame range:"
+
+# runs after the effect script, it replaces the FFMPEG output the scripts set up
+OVERRIDE = """
+import os
+import bpy
+scene = bpy.context.scene
+def promote(scene, *args):
+    path = scene.render.frame_path(frame=scene.frame_current)
+    os.replace(path, os.path.join({output!r}, os.path.basename(path)))
+bpy.app.handlers.render_write.append(promote)
+scene.render.engine = {engine!r}
+if scene.render.engine == 'CYCLES':
+    scene.cycles.device = 'CPU'
+    if {samples} > 0:
+        scene.cycles.samples = {samples}
+"""
+
+def parse_frames(text):
+    start, _, end = text.partition('-')
+    return int(start), int(end or start)
+
+def frame_list(frames):
+    # [1, 2, 3, 7, 9, 10] -> "1..3,7,9..10", the syntax of blender's -f option
+    parts = []
+    start = previous = frames[0]
+    for frame in frames[1:] + [None]:
+        if (frame is not None and frame == previous + 1):
+            previous = frame
+            continue
+        parts.append(str(start) if start == previous else "%d..%d" % (start, previous))
+        start = previous = frame
+    return ",".join(parts)
+
+def frame_path(output, frame, extension):
+    return os.path.join(output, "%s%04d.%s" % (FRAME_NAME, frame, extension))
+
+def missing_frames(output, frame_start, frame_end, extension):
+    # frames already on disk are skipped, so an interrupted render resumes where it stopped,
+    # only finished frames are ever moved into the output directory
+    missing = []
+    for frame in range(frame_start, frame_end + 1):
+        path = frame_path(output, frame, extension)
+        if (not os.path.isfile(path) or os.path.getsize(path) == 0):
+            missing.append(frame)
+    return missing
+
+def split_frames(frames, workers):
+    chunk = -(-len(frames) // workers)
+    return [frames[i:i + chunk] for i in range(0, len(frames), chunk)]
+
+def scene_command(args):
+    command = [args.blender, "-b"]
+    if (args.blend):
+        command.append(args.blend)
+    if (args.factory_startup):
+        command.append("--factory-startup")
+    command += ["--python", os.path.abspath(args.script)]
+    if (args.operator):
+        command += ["--python-expr", "import bpy; bpy.ops.%s()" % args.operator]
+    return command
+
+def probe_frame_range(args):
+    expr = "import bpy; scene = bpy.context.scene; print(%r, scene.frame_start, scene.frame_end)" % PROBE_MARKER
+    output = subprocess.run(scene_command(args) + ["--python-expr", expr], capture_output=True, text=True).stdout
+    match = re.search(re.escape(PROBE_MARKER) + r" (\d+) (\d+)", output)
+    if (match is None):
+        sys.exit("could not read the frame range of %s, pass --frames" % args.script)
+    return int(match.group(1)), int(match.group(2))
+
+def worker_command(args, frames, threads):
+    output = os.path.abspath(args.output)
+    override = OVERRIDE.format(engine=args.engine, samples=args.samples, output=output)
+    return scene_command(args) + [
+        "--python-expr", override,
+        "-o", os.path.join(output, PARTIAL_DIR, FRAME_NAME + "####"),
+        "-F", args.format,
+        "-x", "1",
+        "-t", str(threads),
+        "-f", frame_list(frames),
+        "--", "--cycles-device", "CPU",
+    ]
+
+def render(args, frames):
+    threads = args.threads or max(1, (os.cpu_count() or 1) // args.workers)
+    log_dir = os.path.join(args.output, "logs")
+    os.makedirs(log_dir, exist_ok=True)
+    os.makedirs(os.path.join(args.output, PARTIAL_DIR), exist_ok=True)
+    workers = []
+    for index, chunk in enumerate(split_frames(frames, args.workers)):
+        log = open(os.path.join(log_dir, "worker_%02d.log" % index), "w")
+        print("worker %d: frames %s, %d threads" % (index, frame_list(chunk), threads))
+        workers.append((subprocess.Popen(worker_command(args, chunk, threads), stdout=log, stderr=subprocess.STDOUT), log))
+    failed = 0
+    for process, log in workers:
+        failed += process.wait() != 0
+        log.close()
+    return failed
+
+def concatenate(args, frame_start, extension):
+    command = ["ffmpeg", "-y", "-framerate", str(args.fps), "-start_number", str(frame_start),
+               "-i", os.path.join(args.output, "%s%%04d.%s" % (FRAME_NAME, extension)),
+               "-c:v", "libx264", "-pix_fmt", "yuv420p", args.video]
+    subprocess.run(command, check=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Render an effect script in parallel frame chunks.")
+    parser.add_argument("script")
+    parser.add_argument("--blend", help="open this .blend before running the script")
+    parser.add_argument("--factory-startup", action="store_true")
+    parser.add_argument("--operator", help="operator the script registers, e.g. object.water_balancing")
+    parser.add_argument("--frames", type=parse_frames, help="start-end, read from the scene when omitted")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 1) // 4))
+    parser.add_argument("--threads", type=int, default=0, help="threads per worker, default splits the cores")
+    parser.add_argument("--engine", default='CYCLES')
+    parser.add_argument("--samples", type=int, default=0, help="override the script's sample count")
+    parser.add_argument("--format", default='PNG', choices=sorted(FORMATS))
+    parser.add_argument("--output", default="renders")
+    parser.add_argument("--video", help="concatenate the frames into this file with ffmpeg")
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--blender", default="blender")
+    args = parser.parse_args()
+
+    frame_start, frame_end = args.frames or probe_frame_range(args)
+    extension = FORMATS[args.format]
+    os.makedirs(args.output, exist_ok=True)
+    frames = missing_frames(args.output, frame_start, frame_end, extension)
+    print("%d of %d frames to render" % (len(frames), frame_end - frame_start + 1))
+
+    if (frames):
+        start = time.perf_counter()
+        failed = render(args, frames)
+        print("rendered in %.1f s" % (time.perf_counter() - start))
+        frames = missing_frames(args.output, frame_start, frame_end, extension)
+        if (failed or frames):
+            sys.exit("%d worker(s) failed, %d frames missing, see %s" % (failed, len(frames), os.path.join(args.output, "logs")))
+
+    if (args.video):
+        concatenate(args, frame_start, extension)
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,19 @@ import bpy, bmesh
 import mathutils
 from mathutils import Vector
 import math
+import os, sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from colors import hex_to_rgb
+from keyframes import insert_keys
+from materials import cached_material
+from point_cache import bake_cloth
+from quality import quality_value
+from transforms import compose, curve_median, transform_curve, transform_mesh
+
+# SCROLL_CLOTH=proxy simulates a coarse copy of the scroll, sized by the quality profile's cloth_proxy_cuts,
+# and the display mesh follows it through a surface deform binding; 'full' simulates the display mesh itself
+SCROLL_CLOTH = os.environ.get("SCROLL_CLOTH", 'full')
 
 def eulerToDegree(euler):
     return ( (euler) / (2 * math.pi) ) * 360
@@ -9,22 +22,12 @@ def eulerToDegree(euler):
 def degreeToEuler(degree):
     return degree / 180 * math.pi
 
-def srgb_to_linearrgb(c):
-    if   c < 0:       return 0
-    elif c < 0.04045: return c/12.92
-    else:             return ((c+0.055)/1.055)**2.4
-
-def hex_to_rgb(h,alpha=1):
-    r = (h & 0xff0000) >> 16
-    g = (h & 0x00ff00) >> 8
-    b = (h & 0x0000ff)
-    return tuple([srgb_to_linearrgb(c/0xff) for c in (r,g,b)] + [alpha])
-
 def math_node(nodes, operation):
     math_node = nodes.new(type='ShaderNodeMath')
     math_node.operation = operation
     return math_node
 
+@cached_material
 def principled_material(color=(0.8, 0.8, 0.8, 1), roughness=0.5, metallic=0, transmission=0):
     material = bpy.data.materials.new(name="Principled")
     material.use_nodes = True
@@ -54,6 +57,7 @@ def principled_material(color=(0.8, 0.8, 0.8, 1), roughness=0.5, metallic=0, tra
     links.new(principled_node.outputs[0], output_node.inputs[0])
     return material
 
+@cached_material
 def scroll_material(color=(0.8, 0.8, 0.8, 1), roughness=0.5, metallic=0, transmission=0):
     material = bpy.data.materials.new(name="Scroll")
     material.use_nodes = True
@@ -118,6 +122,38 @@ def create_light(energy, shadow_soft_size=0.1):
     light.data.energy = energy
     light.data.shadow_soft_size = shadow_soft_size
 
+def add_cloth(obj):
+    cloth = obj.modifiers.new("Cloth", type='CLOTH')
+    cloth.settings.quality = 10
+    cloth.collision_settings.use_self_collision = True
+    return cloth
+
+def create_cloth_proxy(display, cuts):
+    # same 4 x 2 sheet with cuts[0] cuts along and cuts[1] across, on the same spiral and in the same place
+    mesh = bpy.data.meshes.new("ScrollProxy")
+    bm = bmesh.new()
+    bmesh.ops.create_grid(bm, x_segments=cuts[0] + 1, y_segments=cuts[1] + 1, size=1, matrix=compose(scale=(2, 1, 1)))
+    bm.to_mesh(mesh)
+    bm.free()
+    proxy = bpy.data.objects.new("ScrollProxy", mesh)
+    bpy.context.collection.objects.link(proxy)
+    proxy.matrix_world = display.matrix_world
+    proxy.modifiers.new("Curve", type='CURVE').object = display.modifiers["Curve"].object
+    add_cloth(proxy)
+    # still simulated, the display mesh depends on it like it does on the hidden spiral
+    proxy.hide_viewport = True
+    proxy.hide_render = True
+
+    # bound on the rest pose, after the curve so both sheets are bent the same way
+    deform = display.modifiers.new("SurfaceDeform", type='SURFACE_DEFORM')
+    deform.target = proxy
+    with bpy.context.temp_override(object=display, active_object=display):
+        bpy.ops.object.surfacedeform_bind(modifier=deform.name)
+    # the binding happens on the next evaluation
+    bpy.context.evaluated_depsgraph_get().update()
+    print("scroll cloth proxy: %d vertices for %d display vertices" % (len(mesh.vertices), len(display.data.vertices)))
+    return proxy
+
 def create_plane(location=(0, 0, 0), size=100):
     bpy.ops.mesh.primitive_plane_add(enter_editmode=False, align='WORLD', location=location, size=size)
     bpy.context.object.name = 'Floor'
@@ -138,54 +174,41 @@ bpy.ops.mesh.primitive_cylinder_add(radius=1, depth=2, enter_editmode=False, ali
 obj = bpy.context.object
 bpy.ops.object.modifier_add(type='COLLISION')
 bpy.context.object.collision.thickness_outer = 0.001
-bpy.context.scene.frame_current = 20
-obj.keyframe_insert(data_path='location')
-obj.keyframe_insert(data_path='rotation_euler')
-
-bpy.context.scene.frame_current = 100
-obj.rotation_euler = mathutils.Euler((math.radians(90), math.radians(-360), 0.0), 'XYZ')
-obj.location = Vector((-0.9, -0.4, 0.45))
-obj.keyframe_insert(data_path='location')
-obj.keyframe_insert(data_path='rotation_euler')
+insert_keys(obj, 'location', [20, 100], [obj.location, (-0.9, -0.4, 0.45)])
+insert_keys(obj, 'rotation_euler', [20, 100], [obj.rotation_euler, (math.radians(90), math.radians(-360), 0.0)])
 
 #bpy.ops.object.duplicate_move(OBJECT_OT_duplicate={"linked":False, "mode":'TRANSLATION'}, TRANSFORM_OT_translate={"value":(-0.4, -0, -0), "orient_type":'GLOBAL', "orient_matrix":((1, 0, 0), (0, 1, 0), (0, 0, 1)), "orient_matrix_type":'GLOBAL', "constraint_axis":(True, True, True), "mirror":False, "use_proportional_edit":False, "proportional_edit_falloff":'SMOOTH', "proportional_size":1, "use_proportional_connected":False, "use_proportional_projected":False, "snap":False, "snap_elements":{'INCREMENT'}, "use_snap_project":False, "snap_target":'CLOSEST', "use_snap_self":False, "use_snap_edit":True, "use_snap_nonedit":True, "use_snap_selectable":False, "snap_point":(0, 0, 0), "snap_align":False, "snap_normal":(0, 0, 0), "gpencil_strokes":False, "cursor_transform":False, "texture_space":False, "remove_on_cancel":False, "use_duplicated_keyframes":False, "view2d_edge_pan":False, "release_confirm":False, "use_accurate":False, "use_automerge_and_split":False})
 bpy.ops.mesh.primitive_cylinder_add(radius=1, depth=2, enter_editmode=False, align='WORLD', location=(0.7, -0.4, 0.45), scale=(0.05, 0.05, 1.5), rotation=(math.radians(90), 0, 0))
 obj = bpy.context.object
 bpy.ops.object.modifier_add(type='COLLISION')
 bpy.context.object.collision.thickness_outer = 0.001
-bpy.context.scene.frame_current = 20
-obj.keyframe_insert(data_path='location')
-obj.keyframe_insert(data_path='rotation_euler')
-
-bpy.context.scene.frame_current = 100
-obj.rotation_euler = mathutils.Euler((math.radians(90), math.radians(360), 0.0), 'XYZ')
-obj.location = Vector((1.9, -0.4, 0.45))
-obj.keyframe_insert(data_path='location')
-obj.keyframe_insert(data_path='rotation_euler')
+insert_keys(obj, 'location', [20, 100], [obj.location, (1.9, -0.4, 0.45)])
+insert_keys(obj, 'rotation_euler', [20, 100], [obj.rotation_euler, (math.radians(90), math.radians(360), 0.0)])
 
 # add spiral
 bpy.ops.curve.spirals(align='WORLD', location=(0, 0, 0), rotation=(0, 0, 0), spiral_type='ARCH', turns=3, dif_radius=1)
-bpy.ops.transform.rotate(value=math.radians(90), orient_axis='Y', orient_type='GLOBAL', orient_matrix=((1, 0, 0), (0, 1, 0), (0, 0, 1)), orient_matrix_type='GLOBAL', constraint_axis=(False, True, False), mirror=False, use_proportional_edit=False, proportional_edit_falloff='SMOOTH', proportional_size=1, use_proportional_connected=False, use_proportional_projected=False, snap=False, snap_elements={'INCREMENT'}, use_snap_project=False, snap_target='CLOSEST', use_snap_self=True, use_snap_edit=True, use_snap_nonedit=True, use_snap_selectable=False)
-bpy.ops.transform.rotate(value=math.radians(-90), orient_axis='Z', orient_type='GLOBAL', orient_matrix=((1, 0, 0), (0, 1, 0), (0, 0, 1)), orient_matrix_type='GLOBAL', constraint_axis=(False, False, True), mirror=False, use_proportional_edit=False, proportional_edit_falloff='SMOOTH', proportional_size=1, use_proportional_connected=False, use_proportional_projected=False, snap=False, snap_elements={'INCREMENT'}, use_snap_project=False, snap_target='CLOSEST', use_snap_self=True, use_snap_edit=True, use_snap_nonedit=True, use_snap_selectable=False)
+obj = bpy.context.object
+spiral = obj.data
+# the rotations turn the points in place around their median, like transform.rotate does
+transform_curve(spiral, compose(rotate=[(math.radians(90), 'Y'), (math.radians(-90), 'Z')], pivot=curve_median(spiral)))
 
 bpy.ops.curve.duplicate_move(CURVE_OT_duplicate={}, TRANSFORM_OT_translate={"value":(8, 0, 0), "orient_type":'GLOBAL', "orient_matrix":((1, 0, 0), (0, 1, 0), (0, 0, 1)), "orient_matrix_type":'GLOBAL', "constraint_axis":(True, True, True), "mirror":False, "use_proportional_edit":False, "proportional_edit_falloff":'SMOOTH', "proportional_size":1, "use_proportional_connected":False, "use_proportional_projected":False, "snap":False, "snap_elements":{'INCREMENT'}, "use_snap_project":False, "snap_target":'CLOSEST', "use_snap_self":True, "use_snap_edit":True, "use_snap_nonedit":True, "use_snap_selectable":False, "snap_point":(0, 0, 0), "snap_align":False, "snap_normal":(0, 0, 0), "gpencil_strokes":False, "cursor_transform":False, "texture_space":False, "remove_on_cancel":False, "use_duplicated_keyframes":False, "view2d_edge_pan":False, "release_confirm":False, "use_accurate":False, "use_automerge_and_split":False})
-bpy.ops.transform.rotate(value=math.radians(180), orient_axis='Z', orient_type='GLOBAL', orient_matrix=((1, 0, 0), (0, 1, 0), (0, 0, 1)), orient_matrix_type='GLOBAL', constraint_axis=(False, False, True), mirror=False, use_proportional_edit=False, proportional_edit_falloff='SMOOTH', proportional_size=1, use_proportional_connected=False, use_proportional_projected=False, snap=False, snap_elements={'INCREMENT'}, use_snap_project=False, snap_target='CLOSEST', use_snap_self=True, use_snap_edit=True, use_snap_nonedit=True, use_snap_selectable=False)
-obj = bpy.context.object
+# the duplicate is the last spline
+copy = [spiral.splines[-1]]
+transform_curve(spiral, compose(rotate=(math.radians(180), 'Z'), pivot=curve_median(spiral, copy)), copy)
 bpy.ops.curve.select_all(action='DESELECT')
 obj.data.splines[0].points[-1].select=True
 obj.data.splines[1].points[-1].select=True
 bpy.ops.curve.make_segment()
-bpy.ops.curve.select_all(action='SELECT')
-bpy.ops.transform.resize(value=(0.05, 0.05, 0.05), orient_type='GLOBAL', orient_matrix=((1, 0, 0), (0, 1, 0), (0, 0, 1)), orient_matrix_type='GLOBAL', mirror=False, use_proportional_edit=False, proportional_edit_falloff='SMOOTH', proportional_size=1, use_proportional_connected=False, use_proportional_projected=False, snap=False, snap_elements={'INCREMENT'}, use_snap_project=False, snap_target='CLOSEST', use_snap_self=True, use_snap_edit=True, use_snap_nonedit=True, use_snap_selectable=False)
-bpy.ops.transform.translate(value=(-3.75, 0, 0.44), orient_type='GLOBAL', orient_matrix=((1, 0, 0), (0, 1, 0), (0, 0, 1)), orient_matrix_type='GLOBAL', constraint_axis=(True, True, True), mirror=False, use_proportional_edit=False, proportional_edit_falloff='SMOOTH', proportional_size=1, use_proportional_connected=False, use_proportional_projected=False, snap=False, snap_elements={'INCREMENT'}, use_snap_project=False, snap_target='CLOSEST', use_snap_self=True, use_snap_edit=True, use_snap_nonedit=True, use_snap_selectable=False)
+transform_curve(spiral, compose(translate=(-3.75, 0, 0.44), scale=0.05, pivot=curve_median(spiral)))
 bpy.ops.object.mode_set(mode='OBJECT')
 bpy.context.object.hide_viewport = True
 bpy.context.object.hide_render=True
 
 # plane
 bpy.ops.mesh.primitive_plane_add(size=2, enter_editmode=False, align='WORLD', location=(0, 0, 0), scale=(1, 1, 1))
+transform_mesh(bpy.context.object.data, compose(scale=(2, 1, 1)))
 bpy.ops.object.editmode_toggle()
-bpy.ops.transform.resize(value=(2, 1, 1), orient_type='GLOBAL', orient_matrix=((1, 0, 0), (0, 1, 0), (0, 0, 1)), orient_matrix_type='GLOBAL', constraint_axis=(True, False, False), mirror=True, use_proportional_edit=False, proportional_edit_falloff='SMOOTH', proportional_size=1, use_proportional_connected=False, use_proportional_projected=False, snap=False, snap_elements={'INCREMENT'}, use_snap_project=False, snap_target='CLOSEST', use_snap_self=True, use_snap_edit=True, use_snap_nonedit=True, use_snap_selectable=False)
 bpy.ops.mesh.select_mode(use_extend=False, use_expand=False, type='EDGE')
 bpy.ops.mesh.select_all(action = 'DESELECT')
 # we need to switch from Edit mode to Object mode so the selection gets updated
@@ -210,9 +233,11 @@ bpy.ops.object.modifier_add(type='CURVE')
 bpy.context.object.modifiers["Curve"].object = bpy.data.objects["Spiral"]
 bpy.ops.transform.translate(value=(2.55, 0, 0), orient_type='GLOBAL', orient_matrix=((1, 0, 0), (0, 1, 0), (0, 0, 1)), orient_matrix_type='GLOBAL', constraint_axis=(True, True, True), mirror=False, use_proportional_edit=False, proportional_edit_falloff='SMOOTH', proportional_size=1, use_proportional_connected=False, use_proportional_projected=False, snap=False, snap_elements={'INCREMENT'}, use_snap_project=False, snap_target='CLOSEST', use_snap_self=False, use_snap_edit=True, use_snap_nonedit=True, use_snap_selectable=False)
 
-bpy.ops.object.modifier_add(type='CLOTH')
-bpy.context.object.modifiers["Cloth"].settings.quality = 10
-bpy.context.object.modifiers["Cloth"].collision_settings.use_self_collision = True
+if (SCROLL_CLOTH == 'proxy'):
+    cloth_object = create_cloth_proxy(obj, quality_value('cloth_proxy_cuts'))
+else:
+    add_cloth(obj)
+    cloth_object = obj
 bpy.ops.object.modifier_add(type='SUBSURF')
 bpy.context.object.modifiers["Subdivision"].levels = 2
 bpy.ops.object.shade_smooth()
@@ -222,6 +247,8 @@ material = scroll_material(color="./video.mp4")
 bpy.context.object.data.materials.append(material)
 
 render('BLENDER_EEVEE', 150)
+# simulated once, scrubbing and render workers read the cloth from disk
+bake_cloth(cloth_object)
 create_light(3000, 3)
 
 # set camera
@@ -0,0 +1,88 @@
+import bpy
+import numpy as np
+
+AXES = {'X': 0, 'Y': 1, 'Z': 2}
+
+# predicates take an (n, 3) coordinate array and return a boolean mask
+def half_space(axis, value, above=True):
+    axis = AXES.get(axis, axis)
+    if (above):
+        return lambda co: co[:, axis] > value
+    return lambda co: co[:, axis] < value
+
+def slab(axis, low, high):
+    axis = AXES.get(axis, axis)
+    return lambda co: (co[:, axis] > low) & (co[:, axis] < high)
+
+def box(min_corner, max_corner):
+    low = np.asarray(min_corner, dtype=np.float32)
+    high = np.asarray(max_corner, dtype=np.float32)
+    return lambda co: np.all((co > low) & (co < high), axis=1)
+
+def all_of(*predicates):
+    def predicate(co):
+        mask = np.ones(len(co), dtype=bool)
+        for p in predicates:
+            mask &= p(co)
+        return mask
+    return predicate
+
+def vectors(collection, attribute='co'):
+    data = np.empty(len(collection) * 3, dtype=np.float32)
+    collection.foreach_get(attribute, data)
+    return data.reshape(-1, 3)
+
+def _through_object_mode(obj, select):
+    # edit mode is left once, which writes the edit mesh back, so the selection is made with foreach_set
+    # on the mesh and entering edit mode again loads it; no per element python work either way
+    with bpy.context.temp_override(object=obj, active_object=obj):
+        bpy.ops.object.mode_set(mode='OBJECT')
+        try:
+            return select(obj)
+        finally:
+            bpy.ops.object.mode_set(mode='EDIT')
+
+def _flush_mesh(mesh, vert_mask):
+    # edges and faces are selected when all their vertices are
+    edge_verts = np.empty(len(mesh.edges) * 2, dtype=np.int32)
+    mesh.edges.foreach_get('vertices', edge_verts)
+    edge_mask = vert_mask[edge_verts].reshape(-1, 2).all(axis=1)
+    mesh.edges.foreach_set('select', edge_mask)
+
+    if (len(mesh.polygons)):
+        loop_verts = np.empty(len(mesh.loops), dtype=np.int32)
+        mesh.loops.foreach_get('vertex_index', loop_verts)
+        loop_start = np.empty(len(mesh.polygons), dtype=np.int32)
+        mesh.polygons.foreach_get('loop_start', loop_start)
+        face_mask = np.logical_and.reduceat(vert_mask[loop_verts], loop_start)
+        mesh.polygons.foreach_set('select', face_mask)
+
+def select_vertices(obj, predicate):
+    # replaces the selection with the vertices matching predicate, works in object and edit mode
+    if (obj.mode == 'EDIT'):
+        bpy.context.tool_settings.mesh_select_mode = (True, False, False)
+        return _through_object_mode(obj, lambda o: select_vertices(o, predicate))
+    mesh = obj.data
+    mask = predicate(vectors(mesh.vertices))
+    mesh.vertices.foreach_set('select', mask)
+    _flush_mesh(mesh, mask)
+    return int(mask.sum())
+
+def select_faces(obj, predicate):
+    # same as select_vertices, the predicate is evaluated on polygon centers
+    if (obj.mode == 'EDIT'):
+        bpy.context.tool_settings.mesh_select_mode = (False, False, True)
+        return _through_object_mode(obj, lambda o: select_faces(o, predicate))
+    mesh = obj.data
+    mask = predicate(vectors(mesh.polygons, 'center'))
+    # vertices of the selected faces too, so entering edit mode in vertex select mode keeps them
+    loop_verts = np.empty(len(mesh.loops), dtype=np.int32)
+    mesh.loops.foreach_get('vertex_index', loop_verts)
+    loop_total = np.empty(len(mesh.polygons), dtype=np.int32)
+    mesh.polygons.foreach_get('loop_total', loop_total)
+    vert_mask = np.zeros(len(mesh.vertices), dtype=bool)
+    vert_mask[loop_verts[np.repeat(mask, loop_total)]] = True
+    mesh.vertices.foreach_set('select', vert_mask)
+    _flush_mesh(mesh, vert_mask)
+    mesh.polygons.foreach_set('select', mask)
+    return int(mask.sum())
@@ -1,7 +1,18 @@
-import bpy
+import bpy, bmesh
 import mathutils
-from mathutils import Vector
+from mathutils import Vector, kdtree
 import math
+import os, sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from colors import hex_to_rgb
+from dynamic_paint import bake_canvas
+from materials import cached_material
+from node_graph import build_material, material_build_report, math_spec
+from point_cache import bake_scene_particles
 
 def eulerToDegree(euler):
     return ( (euler) / (2 * math.pi) ) * 360
@@ -9,22 +20,6 @@ def eulerToDegree(euler):
 def degreeToEuler(degree):
     return degree / 180 * math.pi
 
-def srgb_to_linearrgb(c):
-    if   c < 0:       return 0
-    elif c < 0.04045: return c/12.92
-    else:             return ((c+0.055)/1.055)**2.4
-
-def hex_to_rgb(h,alpha=1):
-    r = (h & 0xff0000) >> 16
-    g = (h & 0x00ff00) >> 8
-    b = (h & 0x0000ff)
-    return tuple([srgb_to_linearrgb(c/0xff) for c in (r,g,b)] + [alpha])
-
-def math_node(nodes, operation):
-    math_node = nodes.new(type='ShaderNodeMath')
-    math_node.operation = operation
-    return math_node
-
 def render(engine, frame_end, samples=32, fps=30):
     scene = bpy.context.scene
     scene.frame_end = frame_end
@@ -59,82 +54,146 @@ def background_settings(color=(0, 0, 0, 1), image_path=bpy.utils.resource_path('
     else:
         background.inputs[0].default_value = color
 
+@cached_material
 def terrain_material(color=(0.8, 0.8, 0.8, 1), roughness=0):
-    material = bpy.data.materials.new(name="terrain")
-    material.use_nodes = True
-    nodes = material.node_tree.nodes
-    links = material.node_tree.links
-
-    nodes.clear()
-    output_node = nodes.new(type='ShaderNodeOutputMaterial')
-
-    # principled shader
-    principled_node = nodes.new(type='ShaderNodeBsdfPrincipled')
+    graph = {
+        'nodes': {
+            'output': {'type': 'ShaderNodeOutputMaterial'},
+            # principled shader
+            'principled': {'type': 'ShaderNodeBsdfPrincipled', 'inputs': {'Roughness': 1}},
+            'principled1': {'type': 'ShaderNodeBsdfPrincipled', 'inputs': {'Base Color': hex_to_rgb(0xffbe9f), 'Roughness': 1}},
+            'texcoord': {'type': 'ShaderNodeTexCoord'},
+            'noise': {'type': 'ShaderNodeTexNoise', 'inputs': {'Scale': 5, 'Detail': 16}},
+            'wave': {'type': 'ShaderNodeTexWave'},
+            'multiply': math_spec('MULTIPLY', {1: 10}),
+            'displacement': {'type': 'ShaderNodeDisplacement', 'inputs': {'Scale': 0.1, 'Midlevel': 0}},
+            'mix': {'type': 'ShaderNodeMixShader'},
+            'geometry': {'type': 'ShaderNodeNewGeometry'},
+            'multiply1': math_spec('MULTIPLY', {1: 10}),
+            'add': math_spec('ADD', {1: -4.8}),
+        },
+        'links': [
+            ('texcoord', 'Object', 'noise', 'Vector'),
+            ('noise', 'Color', 'wave', 'Scale'),
+            ('wave', 'Color', 'multiply', 0),
+            ('multiply', 0, 'displacement', 'Height'),
+            ('geometry', 'Pointiness', 'multiply1', 0),
+            ('multiply1', 0, 'add', 0),
+            ('add', 0, 'mix', 0),
+            ('principled', 0, 'mix', 1),
+            ('principled1', 0, 'mix', 2),
+            ('mix', 0, 'output', 0),
+            ('displacement', 0, 'output', 'Displacement'),
+        ],
+    }
+    nodes = graph['nodes']
+    links = graph['links']
     if (color == 'TexSky'):
-        sky_node = nodes.new(type='ShaderNodeTexSky')
-        sky_node.sky_type = 'HOSEK_WILKIE'
-        links.new(sky_node.outputs[0], principled_node.inputs['Base Color'])
+        nodes['sky'] = {'type': 'ShaderNodeTexSky', 'props': {'sky_type': 'HOSEK_WILKIE'}}
+        links.append(('sky', 0, 'principled', 'Base Color'))
     if (color == 'TexMagic'):
-        magic_node = nodes.new(type='ShaderNodeTexMagic')
-        magic_node.turbulence_depth = 6
-        magic_node.inputs['Scale'].default_value = 10
-        magic_node.inputs['Distortion'].default_value = 2
-        links.new(magic_node.outputs[0], principled_node.inputs['Base Color'])
+        nodes['magic'] = {'type': 'ShaderNodeTexMagic', 'props': {'turbulence_depth': 6}, 'inputs': {'Scale': 10, 'Distortion': 2}}
+        links.append(('magic', 0, 'principled', 'Base Color'))
     else:
-        principled_node.inputs['Base Color'].default_value = hex_to_rgb(0x3a2b24)
-    principled_node.inputs['Roughness'].default_value = 1
-    #principled_node.inputs['Metallic'].default_value = 0
-
-    principled_node1 = nodes.new(type='ShaderNodeBsdfPrincipled')
-    principled_node1.inputs['Base Color'].default_value = hex_to_rgb(0xffbe9f)
-    principled_node1.inputs['Roughness'].default_value = 1
-    #principled_node1.inputs['Metallic'].default_value = 0
-
-    texcoord_node = nodes.new(type='ShaderNodeTexCoord')
-    noise_node = nodes.new(type='ShaderNodeTexNoise')
-    noise_node.inputs['Scale'].default_value = 5
-    noise_node.inputs['Detail'].default_value = 16
-    links.new(noise_node.inputs['Vector'], texcoord_node.outputs['Object'])
-
-    wave_node = nodes.new(type='ShaderNodeTexWave')
-    links.new(wave_node.inputs['Scale'], noise_node.outputs['Color'])
-
-    multiply = math_node(nodes, 'MULTIPLY')
-    multiply.inputs[1].default_value = 10
-    links.new(multiply.inputs[0], wave_node.outputs['Color'])
-
-    displacement_node = nodes.new(type='ShaderNodeDisplacement')
-    displacement_node.inputs['Scale'].default_value = 0.1
-    displacement_node.inputs['Midlevel'].default_value = 0
-    links.new(multiply.outputs[0], displacement_node.inputs['Height'])
-
-    mix_node = nodes.new(type='ShaderNodeMixShader')
-
-    geometry_node = nodes.new(type='ShaderNodeNewGeometry')
-    multiply = math_node(nodes, 'MULTIPLY')
-    multiply.inputs[1].default_value = 10
-    links.new(multiply.inputs[0], geometry_node.outputs['Pointiness'])
-
-    add = math_node(nodes, 'ADD')
-    add.inputs[1].default_value = -4.8
-    links.new(add.inputs[0], multiply.outputs[0])
-
-    links.new(mix_node.inputs[0], add.outputs[0])
-    links.new(mix_node.inputs[1], principled_node.outputs[0]) 
-    links.new(mix_node.inputs[2], principled_node1.outputs[0])
-
-    links.new(mix_node.outputs[0], output_node.inputs[0])
-    links.new(displacement_node.outputs[0], output_node.inputs['Displacement'])
+        nodes['principled']['inputs']['Base Color'] = hex_to_rgb(0x3a2b24)
+
+    material, nodes = build_material("terrain", graph)
     return material
 
+# 'subsurf' subdivides the whole plane, 'adaptive' only refines where the particle brush lands;
+# the emitter rains over nearly all of this plane, so adaptive keeps most of the vertices here,
+# both modes print their canvas vertex count to compare, adaptive is opt-in
+TERRAIN_MODE = os.environ.get("TERRAIN_MODE", 'subsurf')
+SUBSURF_LEVELS = 9
+ADAPTIVE_BASE_LEVEL = 6
+
+def particle_impacts(obj, height=0, frame_end=None):
+    # where each particle crosses z = height, solved from its emission state,
+    # gravity is the only force on the default particle settings so one evaluation is enough
+    scene = bpy.context.scene
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    psys = obj.evaluated_get(depsgraph).particle_systems[0]
+    settings = psys.settings
+    particles = psys.particles
+    count = len(particles)
+    location = np.empty(count * 3, dtype=np.float32)
+    particles.foreach_get('location', location)
+    location = location.reshape(-1, 3)
+    velocity = np.empty(count * 3, dtype=np.float32)
+    particles.foreach_get('velocity', velocity)
+    velocity = velocity.reshape(-1, 3)
+    birth = np.empty(count, dtype=np.float32)
+    particles.foreach_get('birth_time', birth)
+    lifetime = np.empty(count, dtype=np.float32)
+    particles.foreach_get('lifetime', lifetime)
+
+    gravity = scene.gravity.z * settings.effector_weights.gravity * settings.effector_weights.all if scene.use_gravity else 0
+    drop = location[:, 2] - height
+    vz = velocity[:, 2]
+    if (gravity < 0):
+        t = (-vz - np.sqrt(np.maximum(vz * vz - 2 * gravity * drop, 0))) / gravity
+    else:
+        t = np.where(vz < 0, drop / -np.minimum(vz, -1e-6), np.inf)
+    # settings.timestep is seconds per frame
+    frames = t / settings.timestep
+    hit = (drop > 0) & (frames <= lifetime)
+    if (frame_end is not None):
+        hit &= birth + frames <= frame_end
+    impacts = location[hit, :2] + velocity[hit, :2] * t[hit, None]
+    return impacts
+
+def adaptive_terrain(obj, impacts, radius, base_level=ADAPTIVE_BASE_LEVEL, levels=SUBSURF_LEVELS):
+    # uniform grid at base_level, then faces within reach of an impact are split again until
+    # they are as small as subsurf at levels; split edges on the border get fan patterns so the mesh stays conforming
+    inverse = obj.matrix_world.inverted()
+    tree = kdtree.KDTree(len(impacts))
+    for i, (x, y) in enumerate(impacts):
+        co = inverse @ Vector((x, y, 0))
+        tree.insert((co.x, co.y, 0), i)
+    tree.balance()
+
+    bm = bmesh.new()
+    bm.from_mesh(obj.data)
+    xs = [v.co.x for v in bm.verts]
+    size = (max(xs) - min(xs)) / 2 ** base_level
+    bmesh.ops.subdivide_edges(bm, edges=bm.edges[:], cuts=2 ** base_level - 1, use_grid_fill=True)
+    for level in range(base_level, levels):
+        if (not len(impacts)):
+            break
+        # a face center is at most size * 0.71 from its corners, so only faces the brush disk overlaps are split
+        reach = radius + size * 0.71
+        edges = set()
+        for face in bm.faces:
+            center = face.calc_center_median()
+            if (tree.find((center.x, center.y, 0))[2] < reach):
+                edges.update(face.edges)
+        if (not edges):
+            break
+        bmesh.ops.subdivide_edges(bm, edges=list(edges), cuts=1, use_grid_fill=True, quad_corner_type='FAN')
+        size /= 2
+    bm.to_mesh(obj.data)
+    bm.free()
+    obj.data.update()
+
+def refine_terrain(terrain, source):
+    start = time.perf_counter()
+    brush_settings = source.modifiers["brush"].brush_settings
+    impacts = particle_impacts(source, height=terrain.location.z, frame_end=bpy.context.scene.frame_end)
+    adaptive_terrain(terrain, impacts, brush_settings.solid_radius)
+    print("terrain (adaptive): %d impacts, %d canvas vertices (subsurf level %d: %d), %.2f s"
+          % (len(impacts), len(terrain.data.vertices), SUBSURF_LEVELS, (2 ** SUBSURF_LEVELS + 1) ** 2,
+             time.perf_counter() - start))
+
 bpy.ops.mesh.primitive_plane_add(enter_editmode=False, align='WORLD', location=(0, 0, 0), size=2)
 obj = bpy.context.object
+terrain = obj
 
-bpy.ops.object.modifier_add(type='SUBSURF')
-subsurf_settings = bpy.context.object.modifiers["Subdivision"]
-subsurf_settings.levels = 9
-subsurf_settings.render_levels = 9
-subsurf_settings.subdivision_type = 'SIMPLE'
+if (TERRAIN_MODE == 'subsurf'):
+    bpy.ops.object.modifier_add(type='SUBSURF')
+    subsurf_settings = bpy.context.object.modifiers["Subdivision"]
+    subsurf_settings.levels = SUBSURF_LEVELS
+    subsurf_settings.render_levels = SUBSURF_LEVELS
+    subsurf_settings.subdivision_type = 'SIMPLE'
 
 bpy.ops.object.modifier_add(type='DYNAMIC_PAINT')
 bpy.ops.dpaint.type_toggle(type='CANVAS')
@@ -143,6 +202,7 @@ canvas_settings.canvas_surfaces["Surface"].surface_type = 'WAVE'
 bpy.ops.object.shade_smooth()
 material = terrain_material()
 bpy.context.object.data.materials.append(material)
+material_build_report()
 
 # source
 bpy.ops.mesh.primitive_plane_add(enter_editmode=False, align='WORLD', location=(0, 0, 1), size=2)
@@ -166,6 +226,16 @@ brush_settings.particle_system = obj.particle_systems["ParticleSystem"]
 brush_settings.solid_radius = 0.05
 
 render('CYCLES', 120, 10, 3)
+# the brush particles first, the canvas bake then reads them instead of simulating them again
+bake_scene_particles()
+if (TERRAIN_MODE == 'adaptive'):
+    refine_terrain(terrain, obj)
+else:
+    print("terrain (subsurf): %d canvas vertices" % (2 ** SUBSURF_LEVELS + 1) ** 2)
+
+# simulate the ripples once, rendering reads the baked displacement
+bake_canvas(terrain)
+
 create_light(2000)
 background_settings(color='TexEnvironment', image_path=bpy.utils.resource_path('LOCAL') + "/datafiles/studiolights/world/night.exr", strength=1)
 
@@ -0,0 +1,40 @@
+# the lookup table conversions against the per channel formula, no blender needed
+# run with: python -m pytest tests (or python -m unittest discover tests)
+import os, sys
+import unittest
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import colors
+
+TOLERANCE = 1e-7
+
+def formula(value):
+    return colors.srgb_to_linearrgb(value / 0xff)
+
+class HexToRgbTest(unittest.TestCase):
+    def test_every_channel_value(self):
+        # each of the 256 values in the red, green and blue position
+        for shift, channel in ((16, 0), (8, 1), (0, 2)):
+            for value in range(256):
+                rgba = colors.hex_to_rgb(value << shift)
+                self.assertAlmostEqual(rgba[channel], formula(value), delta=TOLERANCE)
+                self.assertEqual(rgba[3], 1)
+
+    def test_array_matches_formula(self):
+        values = np.arange(256)
+        expected = np.array([formula(value) for value in range(256)])
+        for shift, channel in ((16, 0), (8, 1), (0, 2)):
+            rgba = colors.hex_to_rgb_array(values << shift)
+            self.assertEqual(rgba.shape, (256, 4))
+            self.assertLessEqual(np.abs(rgba[:, channel] - expected).max(), TOLERANCE)
+            self.assertTrue((rgba[:, 3] == 1).all())
+
+    def test_array_matches_scalar(self):
+        palette = np.random.default_rng(0).integers(0, 0x1000000, 1000)
+        scalar = np.array([colors.hex_to_rgb(int(h), alpha=0.5) for h in palette])
+        self.assertLessEqual(np.abs(colors.hex_to_rgb_array(palette, alpha=0.5) - scalar).max(), TOLERANCE)
+
+if __name__ == "__main__":
+    unittest.main()
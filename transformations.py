@@ -2,6 +2,19 @@ import bpy
 import mathutils
 from mathutils import Vector
 import math
+import os, sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from colors import hex_to_rgb
+from materials import cached_material
+from point_cache import bake_particles
+from profiling import profiled
+
+# EXPLODE_FRAGMENTS sets how many pieces each torus breaks into,
+# the subdivision level and the particle count are picked to match it
+EXPLODE_FRAGMENTS = int(os.environ.get("EXPLODE_FRAGMENTS", 36000))
+# faces of the default torus, 48 x 12 segments, each subdivision level quadruples them
+TORUS_FACES = 48 * 12
 
 def eulerToDegree(euler):
     return ( (euler) / (2 * math.pi) ) * 360
@@ -9,17 +22,13 @@ def eulerToDegree(euler):
 def degreeToEuler(degree):
     return degree / 180 * math.pi
 
-def srgb_to_linearrgb(c):
-    if   c < 0:       return 0
-    elif c < 0.04045: return c/12.92
-    else:             return ((c+0.055)/1.055)**2.4
-
-def hex_to_rgb(h,alpha=1):
-    r = (h & 0xff0000) >> 16
-    g = (h & 0x00ff00) >> 8
-    b = (h & 0x0000ff)
-    return tuple([srgb_to_linearrgb(c/0xff) for c in (r,g,b)] + [alpha])
+def fragment_budget(fragments):
+    # the explode modifier moves every face with one particle, so the level whose face count
+    # is closest to the budget, and one particle per face up to the budget
+    level = max(0, round(math.log(fragments / TORUS_FACES, 4)))
+    return level, min(fragments, TORUS_FACES * 4 ** level)
 
+@cached_material
 def principled_material(color=(0.8, 0.8, 0.8, 1), roughness=0.5):
     material = bpy.data.materials.new(name="Principled")
     material.use_nodes = True
@@ -41,17 +50,19 @@ def principled_material(color=(0.8, 0.8, 0.8, 1), roughness=0.5):
     links.new(principled_node.outputs[0], output_node.inputs[0])
     return material
 
-def create_explode(size, frame_start, frame_end, physics_type, show_unborn, show_dead, color=hex_to_rgb(0x0000ff), location=(0,0,0)):
+@profiled
+def create_explode(size, frame_start, frame_end, physics_type, show_unborn, show_dead, color=hex_to_rgb(0x0000ff), location=(0,0,0), fragments=EXPLODE_FRAGMENTS):
+    level, count = fragment_budget(fragments)
     bpy.ops.mesh.primitive_torus_add(align='WORLD', location=location, rotation=(math.radians(90), 0, math.radians(90)), major_radius=1, minor_radius=0.25, abso_major_rad=1.25, abso_minor_rad=0.75)
     bpy.ops.transform.resize(value=size, orient_type='GLOBAL', orient_matrix=((1, 0, 0), (0, 1, 0), (0, 0, 1)), orient_matrix_type='GLOBAL', mirror=False, use_proportional_edit=False, proportional_edit_falloff='SMOOTH', proportional_size=1, use_proportional_connected=False, use_proportional_projected=False, snap=False, snap_elements={'INCREMENT'}, use_snap_project=False, snap_target='CLOSEST', use_snap_self=True, use_snap_edit=True, use_snap_nonedit=True, use_snap_selectable=False)
-    bpy.ops.object.subdivision_set(level=3, relative=False)
-    bpy.context.object.modifiers["Subdivision"].render_levels = 3
+    bpy.ops.object.subdivision_set(level=level, relative=False)
+    bpy.context.object.modifiers["Subdivision"].render_levels = level
     bpy.ops.object.shade_smooth()
     bpy.ops.object.quick_explode(frame_start=1, frame_end=51)
     #settings = bpy.data.particles["ParticleSettings"]
     obj = bpy.context.object
     settings = obj.particle_systems[0].settings
-    settings.count = 36000
+    settings.count = count
     settings.frame_start = frame_start
     settings.frame_end = frame_end
     settings.normal_factor = 0
@@ -81,17 +92,22 @@ def create_explode(size, frame_start, frame_end, physics_type, show_unborn, show
     bpy.ops.object.material_slot_remove()
     material = principled_material(color, roughness=0.4)
     bpy.context.object.data.materials.append(material)
+    print("explode: %d particles, subdivision level %d, %d faces" % (count, level, TORUS_FACES * 4 ** level))
+    return obj
 
+@profiled
 def create_turbulence():
     # make particle fly
     bpy.ops.object.effector_add(type='TURBULENCE', enter_editmode=False, align='WORLD', location=(0, 0, 0), scale=(1, 1, 1))
     bpy.context.object.field.strength = 0.5
 
+@profiled
 def position_camera():
     camera = bpy.data.objects['Camera']
     camera.location = Vector((11, 0, 0))
     camera.rotation_euler = mathutils.Euler((math.radians(90.0), 0.0, math.radians(90.0)), 'XYZ')
 
+@profiled
 def render(engine, frame_end, samples=32):
     scene = bpy.context.scene
     scene.frame_end = frame_end
@@ -103,6 +119,7 @@ def render(engine, frame_end, samples=32):
         scene.cycles.preview_samples = samples
         scene.cycles.samples = samples
 
+@profiled
 def create_light(energy):
     light = bpy.data.objects['Light']
     light.data.energy = energy
@@ -114,11 +131,11 @@ class transformations(bpy.types.Operator):
     bl_options = {'REGISTER', 'UNDO'}  # Enable undo for the operator.
 
     def execute(self, context):        # execute() is called when running the operator.
-        create_explode(size=(1.5, 1.5, 1.5), frame_start=10, frame_end=110, physics_type='NEWTON', show_unborn=True, show_dead=False)
+        blue = create_explode(size=(1.5, 1.5, 1.5), frame_start=10, frame_end=110, physics_type='NEWTON', show_unborn=True, show_dead=False)
         #create_explode(size=(0.75, 0.75, 0.75), frame_start=60, frame_end=160, physics_type='KEYED', show_unborn=False, show_dead=True)
         
         # blue to red
-        create_explode(size=(0.75, 0.75, 0.75), frame_start=60, frame_end=160, physics_type='KEYED', show_unborn=False, show_dead=True, color=hex_to_rgb(0xff0000))
+        red = create_explode(size=(0.75, 0.75, 0.75), frame_start=60, frame_end=160, physics_type='KEYED', show_unborn=False, show_dead=True, color=hex_to_rgb(0xff0000))
         
         # different location
         #create_explode(size=(1.5, 1.5, 1.5), frame_start=10, frame_end=110, physics_type='NEWTON', show_unborn=True, show_dead=False, location=(0, 1.5, 0))
@@ -127,6 +144,9 @@ class transformations(bpy.types.Operator):
         create_turbulence()
         position_camera()
         render('BLENDER_EEVEE', 210)
+        # after the turbulence and the frame range, the explode modifiers then read the bake while scrubbing
+        bake_particles(blue)
+        bake_particles(red)
         create_light(3000)
         # set world to black
         bpy.data.worlds["World"].node_tree.nodes["Background"].inputs[0].default_value = (0, 0, 0, 1)
@@ -0,0 +1,67 @@
+import bmesh
+from mathutils import Matrix, Vector
+import numpy as np
+
+from selection import vectors
+
+def compose(translate=(0, 0, 0), rotate=None, scale=1, pivot=(0, 0, 0)):
+    # one matrix for transform.resize, then transform.rotate, then transform.translate, the first two about pivot.
+    # rotate is (angle, axis) or a list of them applied in order, axis is 'X', 'Y', 'Z' or a vector
+    if (isinstance(scale, (int, float))):
+        scale = (scale, scale, scale)
+    if (rotate and isinstance(rotate[0], (int, float))):
+        rotate = [rotate]
+    rotation = Matrix.Identity(4)
+    for angle, axis in rotate or []:
+        rotation = Matrix.Rotation(angle, 4, axis) @ rotation
+    to_pivot = Matrix.Translation(Vector(pivot))
+    return (Matrix.Translation(Vector(translate)) @ to_pivot @ rotation
+            @ Matrix.Diagonal(Vector(scale)).to_4x4() @ to_pivot.inverted())
+
+def _apply(co, matrix):
+    # (n, 3) coordinates through a 4x4 matrix
+    m = np.array(matrix, dtype=np.float32)
+    return co @ m[:3, :3].T + m[:3, 3]
+
+def transform_object(obj, matrix):
+    # object mode transform.* in global orientation
+    obj.matrix_world = matrix @ obj.matrix_world
+
+def transform_mesh(mesh, matrix, matrix_world=None):
+    # every vertex, in object mode straight on the mesh, in edit mode on the edit mesh, no mode switch either way;
+    # matrix is in object space, or in global space like orient_type='GLOBAL' when the object's matrix_world is given
+    if (matrix_world is not None):
+        matrix = matrix_world.inverted() @ matrix @ matrix_world
+    if (mesh.is_editmode):
+        bm = bmesh.from_edit_mesh(mesh)
+        bmesh.ops.transform(bm, matrix=matrix, verts=bm.verts)
+        bmesh.update_edit_mesh(mesh)
+    else:
+        mesh.transform(matrix)
+        mesh.update()
+
+def _spline_co(spline):
+    # poly and nurbs points carry their weight in w
+    co = np.empty(len(spline.points) * 4, dtype=np.float32)
+    spline.points.foreach_get('co', co)
+    return co.reshape(-1, 4)
+
+def curve_median(curve, splines=None):
+    # the pivot transform.* uses by default, the mean of the control points
+    co = np.concatenate([vectors(spline.bezier_points) if spline.type == 'BEZIER' else _spline_co(spline)[:, :3]
+                         for spline in (splines or curve.splines)])
+    return Vector(co.mean(axis=0).tolist())
+
+def transform_curve(curve, matrix, splines=None):
+    # control points and bezier handles of splines (all when None), one foreach pass per spline;
+    # in edit mode curve.splines is the edit data, so it works there too
+    for spline in (splines or curve.splines):
+        if (spline.type == 'BEZIER'):
+            for attribute in ('co', 'handle_left', 'handle_right'):
+                co = vectors(spline.bezier_points, attribute)
+                spline.bezier_points.foreach_set(attribute, _apply(co, matrix).ravel())
+        else:
+            co = _spline_co(spline)
+            co[:, :3] = _apply(co[:, :3], matrix)
+            spline.points.foreach_set('co', co.ravel())
+    curve.update_tag()
@@ -3,18 +3,17 @@ from addon_utils import enable
 import mathutils
 from mathutils import Vector
 import math
+import os, sys
 
-def srgb_to_linearrgb(c):
-    if   c < 0:       return 0
-    elif c < 0.04045: return c/12.92
-    else:             return ((c+0.055)/1.055)**2.4
-
-def hex_to_rgb(h,alpha=1):
-    r = (h & 0xff0000) >> 16
-    g = (h & 0x00ff00) >> 8
-    b = (h & 0x0000ff)
-    return tuple([srgb_to_linearrgb(c/0xff) for c in (r,g,b)] + [alpha])
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from bake_cache import bake_fluid
+from colors import hex_to_rgb
+from dynamic_paint import bake_canvas
+from keyframes import insert_keys
+from materials import cached_material
+from quality import apply_quality
 
+@cached_material
 def glass_material(color=(1, 1, 1, 1), roughness=0.5):
     material = bpy.data.materials.new(name="Glass")
     material.use_nodes = True
@@ -31,6 +30,7 @@ def glass_material(color=(1, 1, 1, 1), roughness=0.5):
     links.new(glass_node.outputs[0], output_node.inputs[0])
     return material
 
+@cached_material
 def glossy_material(color=(0.8, 0.8, 0.8, 1), roughness=0.5):
     material = bpy.data.materials.new(name="Glossy")
     material.use_nodes = True
@@ -47,6 +47,7 @@ def glossy_material(color=(0.8, 0.8, 0.8, 1), roughness=0.5):
     links.new(glossy_node.outputs[0], output_node.inputs[0])
     return material
 
+@cached_material
 def diffuse_material(color, roughness):
     material = bpy.data.materials.new(name="Diffuse")
     material.use_nodes = True
@@ -63,6 +64,7 @@ def diffuse_material(color, roughness):
     links.new(diffuse_node.outputs[0], output_node.inputs[0])
     return material
 
+@cached_material
 def principled_material(color=(0.8, 0.8, 0.8, 1), roughness=0.5, metallic=0, transmission=0):
     material = bpy.data.materials.new(name="Principled")
     material.use_nodes = True
@@ -102,6 +104,7 @@ def background_settings():
     sky_node.sky_type = 'HOSEK_WILKIE'
     links.new(sky_node.outputs[0], background.inputs['Color'])
 
+@cached_material
 def diffuse_glossy_material(diffuse_color, diffuse_roughness, glossy_color, glossy_roughness, blend):
     material = bpy.data.materials.new(name="diffuse_glossy")
     material.use_nodes = True
@@ -262,6 +265,7 @@ bpy.ops.dpaint.output_toggle(output='A')
 
 # fluid domain
 bpy.ops.mesh.primitive_cube_add(size=2, enter_editmode=False, align='WORLD', location=(1.5, -1.5, 0.7), scale=(2, 2, 1))
+domain = bpy.context.object
 bpy.ops.object.shade_smooth()
 bpy.ops.object.modifier_add(type='FLUID')
 bpy.context.object.modifiers["Fluid"].fluid_type = 'DOMAIN'
@@ -275,6 +279,8 @@ bpy.context.object.modifiers["Fluid"].domain_settings.use_collision_border_top =
 bpy.context.object.modifiers["Fluid"].domain_settings.use_collision_border_bottom = False
 bpy.context.object.modifiers["Fluid"].domain_settings.use_mesh = True
 bpy.context.object.modifiers["Fluid"].domain_settings.cache_frame_end = 150
+# resolution, upres and bake range come from the quality profile when one is asked for
+apply_quality(bpy.context.object.modifiers["Fluid"].domain_settings)
 
 material = principled_material(roughness=0, transmission=1)
 bpy.context.object.data.materials.append(material)
@@ -296,31 +302,18 @@ settings.flow_type = 'LIQUID'
 obj.modifiers["Fluid"].flow_settings.flow_behavior = 'INFLOW'
 obj.modifiers["Fluid"].flow_settings.use_plane_init = True
 obj.modifiers["Fluid"].flow_settings.use_initial_velocity = True
-settings.velocity_coord[1] = 15
-settings.velocity_coord[2] = -2
-settings.keyframe_insert(data_path='velocity_coord', frame=1)
-settings.keyframe_insert(data_path='velocity_coord', frame=60)
-settings.velocity_coord[1] = 15
-settings.velocity_coord[2] = 2
-settings.keyframe_insert(data_path='velocity_coord', frame=61)
-settings.keyframe_insert(data_path='velocity_coord', frame=120)
-settings.velocity_coord[1] = 0
-settings.velocity_coord[2] = 0
-settings.keyframe_insert(data_path='velocity_coord', frame=121)
-
-bpy.context.scene.frame_current = 1
-obj.keyframe_insert(data_path='location')
-
-bpy.context.scene.frame_current = 60
-obj.location = Vector((3.3, -3, 0.34))
-obj.keyframe_insert(data_path='location')
-
-bpy.context.scene.frame_current = 120
-obj.location = Vector((-0.1, -3, 0.34))
-obj.keyframe_insert(data_path='location')
+insert_keys(settings, 'velocity_coord', [1, 60, 61, 120, 121],
+            [(0, 15, -2), (0, 15, -2), (0, 15, 2), (0, 15, 2), (0, 0, 0)])
+
+insert_keys(obj, 'location', [1, 60, 120], [(-0.1, -3, 0.34), (3.3, -3, 0.34), (-0.1, -3, 0.34)])
 
 render('CYCLES', 150, 10)
 # set camera
 camera = bpy.data.objects['Camera']
 camera.location = Vector((1.5, -6, 3.5))
 camera.rotation_euler = mathutils.Euler((math.radians(60), 0, 0), 'XYZ')
+
+# bake once, later runs with the same parameters replay the cache
+bake_fluid(domain)
+# the water paints the dirty text, bake that after the fluid it depends on
+bake_canvas(bpy.data.objects["Text.001_cell"])
@@ -1,19 +1,19 @@
 import bpy, bmesh
 import mathutils
-from mathutils import Vector
+from mathutils import Matrix, Vector, kdtree
 import math
-
-def srgb_to_linearrgb(c):
-    if   c < 0:       return 0
-    elif c < 0.04045: return c/12.92
-    else:             return ((c+0.055)/1.055)**2.4
-
-def hex_to_rgb(h,alpha=1):
-    r = (h & 0xff0000) >> 16
-    g = (h & 0x00ff00) >> 8
-    b = (h & 0x0000ff)
-    return tuple([srgb_to_linearrgb(c/0xff) for c in (r,g,b)] + [alpha])
-
+import os, sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from bake_cache import bake_fluid
+from colors import hex_to_rgb
+from keyframes import insert_keys
+from materials import cached_material
+from profiling import profiled
+from quality import apply_quality, quality_value
+from transforms import compose, transform_mesh, transform_object
+
+@cached_material
 def glass_material(color=(1, 1, 1, 1), roughness=0.5):
     material = bpy.data.materials.new(name="Glass")
     material.use_nodes = True
@@ -30,6 +30,7 @@ def glass_material(color=(1, 1, 1, 1), roughness=0.5):
     links.new(glass_node.outputs[0], output_node.inputs[0])
     return material
 
+@cached_material
 def glossy_material(color=(0.8, 0.8, 0.8, 1), roughness=0.5):
     material = bpy.data.materials.new(name="Glossy")
     material.use_nodes = True
@@ -46,6 +47,7 @@ def glossy_material(color=(0.8, 0.8, 0.8, 1), roughness=0.5):
     links.new(glossy_node.outputs[0], output_node.inputs[0])
     return material
 
+@cached_material
 def diffuse_material(color, roughness):
     material = bpy.data.materials.new(name="Diffuse")
     material.use_nodes = True
@@ -62,6 +64,7 @@ def diffuse_material(color, roughness):
     links.new(diffuse_node.outputs[0], output_node.inputs[0])
     return material
 
+@cached_material
 def principled_material():
     material = bpy.data.materials.new(name="Principled")
     material.use_nodes = True
@@ -79,6 +82,7 @@ def principled_material():
     links.new(principled_node.outputs[0], output_node.inputs[0])
     return material
 
+@profiled
 def background_settings():
     #bpy.data.worlds["World"].node_tree.nodes["Background"].inputs[0].default_value = (0.5, 0.5, 0.5, 1)
     nodes = bpy.data.worlds["World"].node_tree.nodes
@@ -89,6 +93,7 @@ def background_settings():
     sky_node.sky_type = 'HOSEK_WILKIE'
     links.new(sky_node.outputs[0], background.inputs['Color'])
 
+@cached_material
 def diffuse_glossy_material(diffuse_color, diffuse_roughness, glossy_color, glossy_roughness, blend):
     material = bpy.data.materials.new(name="diffuse_glossy")
     material.use_nodes = True
@@ -114,82 +119,150 @@ def diffuse_glossy_material(diffuse_color, diffuse_roughness, glossy_color, glos
     links.new(mix_node.outputs[0], output_node.inputs[0])
     return material
 
-def create_pipe():
-    bpy.ops.mesh.primitive_torus_add(align='WORLD', location=(0, 0, 0), rotation=(0, 0, 0), major_radius=0.5, minor_radius=0.3, abso_major_rad=1.25, abso_minor_rad=0.75)
-
-    # get created object
-    obj = bpy.context.object
-    obj.name = 'Pipe'
-    # get the mesh data
-    mesh = obj.data
-
-    bpy.ops.object.mode_set(mode='EDIT')
-    bpy.ops.transform.rotate(value=math.radians(90.0), orient_axis='X')
-    bpy.ops.transform.resize(value=(0.6, 0.6, 0.6))
-
-    bm = bmesh.from_edit_mesh(mesh)
-    # delete vertices
-    verts = [v for v in bm.verts if v.co[0] > 0.001 or v.co[2] > 0.001]
-    bmesh.ops.delete(bm, geom=verts, context="VERTS")
-    verts = [v for v in bm.verts if v.co[2] > -0.001]
-
-    # select top circle
-    bpy.ops.mesh.select_mode(type="VERT")
-    bpy.ops.mesh.select_all(action = 'DESELECT')
-    # we need to switch from Edit mode to Object mode so the selection gets updated
-    bpy.ops.object.mode_set(mode='OBJECT')
-    for v in mesh.vertices:
-        if v.co[2] > -0.001:
-            v.select = True
-    bpy.ops.object.mode_set(mode='EDIT')
-
-    # extrude and scale it
-    bpy.ops.mesh.extrude_region_move()
-    bpy.ops.transform.resize(value=(1.1, 1.1, 1.1), constraint_axis=(False, False, False))
-
-    # extrude z 0.2
-    bpy.ops.mesh.extrude_region_move(MESH_OT_extrude_region={"use_normal_flip":False, "use_dissolve_ortho_edges":False, "mirror":False}, TRANSFORM_OT_translate={"value":(0, 0, 0.2), "orient_type":'GLOBAL', "orient_matrix":((1, 0, 0), (0, 1, 0), (0, 0, 1)), "orient_matrix_type":'GLOBAL', "constraint_axis":(False, False, True), "mirror":False, "use_proportional_edit":False, "proportional_edit_falloff":'SMOOTH', "proportional_size":1, "use_proportional_connected":False, "use_proportional_projected":False, "snap":False, "snap_elements":{'INCREMENT'}, "use_snap_project":False, "snap_target":'CLOSEST', "use_snap_self":True, "use_snap_edit":True, "use_snap_nonedit":True, "use_snap_selectable":False, "snap_point":(0, 0, 0), "snap_align":False, "snap_normal":(0, 0, 0), "gpencil_strokes":False, "cursor_transform":False, "texture_space":False, "remove_on_cancel":False, "use_duplicated_keyframes":False, "view2d_edge_pan":False, "release_confirm":False, "use_accurate":False, "use_automerge_and_split":False})
-
-    # extrude and scale it
-    bpy.ops.mesh.extrude_region_move()
-    bpy.ops.transform.resize(value=(0.9, 0.9, 0.9), constraint_axis=(False, False, False))
-
-    # extrude z -0.2
-    bpy.ops.mesh.extrude_region_move(MESH_OT_extrude_region={"use_normal_flip":False, "use_dissolve_ortho_edges":False, "mirror":False}, TRANSFORM_OT_translate={"value":(0, 0, -0.2), "orient_type":'GLOBAL', "orient_matrix":((1, 0, 0), (0, 1, 0), (0, 0, 1)), "orient_matrix_type":'GLOBAL', "constraint_axis":(False, False, True), "mirror":False, "use_proportional_edit":False, "proportional_edit_falloff":'SMOOTH', "proportional_size":1, "use_proportional_connected":False, "use_proportional_projected":False, "snap":False, "snap_elements":{'INCREMENT'}, "use_snap_project":False, "snap_target":'CLOSEST', "use_snap_self":True, "use_snap_edit":True, "use_snap_nonedit":True, "use_snap_selectable":False, "snap_point":(0, 0, 0), "snap_align":False, "snap_normal":(0, 0, 0), "gpencil_strokes":False, "cursor_transform":False, "texture_space":False, "remove_on_cancel":False, "use_duplicated_keyframes":False, "view2d_edge_pan":False, "release_confirm":False, "use_accurate":False, "use_automerge_and_split":False})
-
-    # select right circle (TODO: make it method)
-    bpy.ops.mesh.select_mode(type="VERT")
-    bpy.ops.mesh.select_all(action = 'DESELECT')
-    # we need to switch from Edit mode to Object mode so the selection gets updated
-    bpy.ops.object.mode_set(mode='OBJECT')
-    for v in mesh.vertices:
-        if v.co[0] > -0.001:
-            v.select = True
-    bpy.ops.object.mode_set(mode='EDIT')
-
-    # extrude and scale it
-    bpy.ops.mesh.extrude_region_move()
-    bpy.ops.transform.resize(value=(1.1, 1.1, 1.1), constraint_axis=(False, False, False))
-
-    # extrude x 0.2
-    bpy.ops.mesh.extrude_region_move(MESH_OT_extrude_region={"use_normal_flip":False, "use_dissolve_ortho_edges":False, "mirror":False}, TRANSFORM_OT_translate={"value":(0.2, 0, 0), "orient_type":'GLOBAL', "orient_matrix":((1, 0, 0), (0, 1, 0), (0, 0, 1)), "orient_matrix_type":'GLOBAL', "constraint_axis":(False, False, True), "mirror":False, "use_proportional_edit":False, "proportional_edit_falloff":'SMOOTH', "proportional_size":1, "use_proportional_connected":False, "use_proportional_projected":False, "snap":False, "snap_elements":{'INCREMENT'}, "use_snap_project":False, "snap_target":'CLOSEST', "use_snap_self":True, "use_snap_edit":True, "use_snap_nonedit":True, "use_snap_selectable":False, "snap_point":(0, 0, 0), "snap_align":False, "snap_normal":(0, 0, 0), "gpencil_strokes":False, "cursor_transform":False, "texture_space":False, "remove_on_cancel":False, "use_duplicated_keyframes":False, "view2d_edge_pan":False, "release_confirm":False, "use_accurate":False, "use_automerge_and_split":False})
-
-    # extrude and scale it
-    bpy.ops.mesh.extrude_region_move()
-    bpy.ops.transform.resize(value=(0.9, 0.9, 0.9), constraint_axis=(False, False, False))
-
-    bpy.ops.mesh.duplicate_move(MESH_OT_duplicate={"mode":1}, TRANSFORM_OT_translate={"value":(0, 0, 0), "orient_type":'GLOBAL', "orient_matrix":((1, 0, 0), (0, 1, 0), (0, 0, 1)), "orient_matrix_type":'GLOBAL', "constraint_axis":(False, False, False), "mirror":False, "use_proportional_edit":False, "proportional_edit_falloff":'SMOOTH', "proportional_size":1, "use_proportional_connected":False, "use_proportional_projected":False, "snap":False, "snap_elements":{'INCREMENT'}, "use_snap_project":False, "snap_target":'CLOSEST', "use_snap_self":True, "use_snap_edit":True, "use_snap_nonedit":True, "use_snap_selectable":False, "snap_point":(0, 0, 0), "snap_align":False, "snap_normal":(0, 0, 0), "gpencil_strokes":False, "cursor_transform":False, "texture_space":False, "remove_on_cancel":False, "use_duplicated_keyframes":False, "view2d_edge_pan":False, "release_confirm":False, "use_accurate":False, "use_automerge_and_split":False})
-    # extrude x 0.05
-    bpy.ops.mesh.extrude_region_move(MESH_OT_extrude_region={"use_normal_flip":False, "use_dissolve_ortho_edges":False, "mirror":False}, TRANSFORM_OT_translate={"value":(0.05, 0, 0), "orient_type":'GLOBAL', "orient_matrix":((1, 0, 0), (0, 1, 0), (0, 0, 1)), "orient_matrix_type":'GLOBAL', "constraint_axis":(False, False, True), "mirror":False, "use_proportional_edit":False, "proportional_edit_falloff":'SMOOTH', "proportional_size":1, "use_proportional_connected":False, "use_proportional_projected":False, "snap":False, "snap_elements":{'INCREMENT'}, "use_snap_project":False, "snap_target":'CLOSEST', "use_snap_self":True, "use_snap_edit":True, "use_snap_nonedit":True, "use_snap_selectable":False, "snap_point":(0, 0, 0), "snap_align":False, "snap_normal":(0, 0, 0), "gpencil_strokes":False, "cursor_transform":False, "texture_space":False, "remove_on_cancel":False, "use_duplicated_keyframes":False, "view2d_edge_pan":False, "release_confirm":False, "use_accurate":False, "use_automerge_and_split":False})
-    # extrude x 3
-    bpy.ops.mesh.extrude_region_move(MESH_OT_extrude_region={"use_normal_flip":False, "use_dissolve_ortho_edges":False, "mirror":False}, TRANSFORM_OT_translate={"value":(3.0, 0, 0), "orient_type":'GLOBAL', "orient_matrix":((1, 0, 0), (0, 1, 0), (0, 0, 1)), "orient_matrix_type":'GLOBAL', "constraint_axis":(False, False, True), "mirror":False, "use_proportional_edit":False, "proportional_edit_falloff":'SMOOTH', "proportional_size":1, "use_proportional_connected":False, "use_proportional_projected":False, "snap":False, "snap_elements":{'INCREMENT'}, "use_snap_project":False, "snap_target":'CLOSEST', "use_snap_self":True, "use_snap_edit":True, "use_snap_nonedit":True, "use_snap_selectable":False, "snap_point":(0, 0, 0), "snap_align":False, "snap_normal":(0, 0, 0), "gpencil_strokes":False, "cursor_transform":False, "texture_space":False, "remove_on_cancel":False, "use_duplicated_keyframes":False, "view2d_edge_pan":False, "release_confirm":False, "use_accurate":False, "use_automerge_and_split":False})
-
-    bmesh.update_edit_mesh(mesh)
+def extrude_loop(bm, edges, translate=(0, 0, 0), scale=1):
+    # extrude_region_move + resize on an edge loop: the new loop moves by translate and is scaled about its median
+    geom = bmesh.ops.extrude_edge_only(bm, edges=edges)['geom']
+    verts = [g for g in geom if isinstance(g, bmesh.types.BMVert)]
+    center = sum((v.co for v in verts), Vector()) / len(verts)
+    bmesh.ops.transform(bm, matrix=compose(translate=translate, scale=scale, pivot=center), verts=verts)
+    new = set(verts)
+    edges = [g for g in geom if isinstance(g, bmesh.types.BMEdge) and set(g.verts) <= new]
+    faces = [g for g in geom if isinstance(g, bmesh.types.BMFace)]
+    return edges, faces
+
+def edge_ring(edge):
+    # the edges facing each other across quads, the ring loopcut_slide splits
+    ring = [edge]
+    seen = {edge}
+    for start in edge.link_loops:
+        loop = start
+        while (len(loop.face.verts) == 4):
+            opposite = loop.link_loop_next.link_loop_next
+            if (opposite.edge in seen):
+                break
+            seen.add(opposite.edge)
+            ring.append(opposite.edge)
+            loop = opposite.link_loop_radial_next
+            if (loop is opposite):
+                break
+    return ring
+
+def loop_cut(bm, point, normal, scale=1, candidates=64):
+    # loopcut_slide without an edge index: the ring is the one nearest to point that crosses the plane
+    # through point, the new loop lies on that plane and is scaled about its median
+    point = Vector(point)
+    normal = Vector(normal).normalized()
+    edges = bm.edges[:]
+    tree = kdtree.KDTree(len(edges))
+    for index, edge in enumerate(edges):
+        tree.insert((edge.verts[0].co + edge.verts[1].co) / 2, index)
+    tree.balance()
+
+    level = point.dot(normal)
+    for _, index, _ in tree.find_n(point, candidates):
+        a, b = (v.co.dot(normal) - level for v in edges[index].verts)
+        if (a * b < 0):
+            break
+    else:
+        raise ValueError("no edge ring crosses the plane through %s" % tuple(point))
+
+    ring = edge_ring(edges[index])
+    percents = {}
+    for edge in ring:
+        a, b = (v.co.dot(normal) for v in edge.verts)
+        percents[edge] = (level - a) / (b - a)
+    before = set(bm.verts)
+    bmesh.ops.subdivide_edges(bm, edges=ring, cuts=1, use_grid_fill=True, edge_percents=percents)
+    verts = [v for v in bm.verts if v not in before]
+    if (scale != 1):
+        center = sum((v.co for v in verts), Vector()) / len(verts)
+        bmesh.ops.transform(bm, matrix=compose(scale=scale, pivot=center), verts=verts)
+    return verts
+
+def loop_verts(edges):
+    # the vertices of a closed edge loop in walking order
+    edges = set(edges)
+    vert = next(iter(edges)).verts[0]
+    ordered = [vert]
+    previous = None
+    while True:
+        edge = next(e for e in vert.link_edges if e in edges and e.other_vert(vert) is not previous)
+        previous, vert = vert, edge.other_vert(vert)
+        if (vert is ordered[0]):
+            return ordered
+        ordered.append(vert)
+
+def link_new_object(name, mesh):
+    # linked, selected and active like the primitive operators leave it
+    obj = bpy.data.objects.new(name, mesh)
+    bpy.context.collection.objects.link(obj)
+    for other in bpy.context.selected_objects:
+        other.select_set(False)
+    obj.select_set(True)
+    bpy.context.view_layer.objects.active = obj
+    return obj
+
+# support loops of the pipe as (point outside the pipe on the cut plane, plane normal, scale of the new loop),
+# found by position, so they land in the same place at every resolution
+PIPE_LOOP_CUTS = [
+    # both ends of the collar sleeves, for sharp edges
+    ((0, 0, 0.01), (0, 0, 1), 1),
+    ((0, 0, 0.19), (0, 0, 1), 1),
+    ((0.01, 0, 0), (1, 0, 0), 1),
+    ((0.19, 0, 0), (1, 0, 0), 1),
+    # behind the band, before the outlet, and a slightly wider ridge at the outlet
+    ((0.31, 0, 0), (1, 0, 0), 1),
+    ((2.95, 0, 0), (1, 0, 0), 1),
+    ((3.22, 0, 0), (1, 0, 0), 1.02),
+]
+
+@profiled
+def create_pipe(segments=None):
+    # segments around the pipe and along the elbow, from the quality profile unless given, even for the band
+    segments = segments or quality_value('pipe_segments')
+    # the whole pipe is built in one bmesh and written to the mesh once, no edit mode
+    bm = bmesh.new()
+    # quarter torus elbow, major radius 0.3, minor radius 0.18, from the top opening at z = 0 to the right one at x = 0
+    top = bmesh.ops.create_circle(bm, cap_ends=False, radius=0.18, segments=segments, matrix=Matrix.Translation((-0.3, 0, 0)))['verts']
+    top_edges = list({e for v in top for e in v.link_edges})
+    spin = bmesh.ops.spin(bm, geom=top + top_edges, cent=(0, 0, 0), axis=(0, 1, 0), angle=math.radians(-90.0), steps=segments)
+    right_edges = [g for g in spin['geom_last'] if isinstance(g, bmesh.types.BMEdge)]
+
+    # top collar
+    edges, _ = extrude_loop(bm, top_edges, scale=1.1)
+    edges, _ = extrude_loop(bm, edges, translate=(0, 0, 0.2))
+    edges, _ = extrude_loop(bm, edges, scale=0.9)
+    extrude_loop(bm, edges, translate=(0, 0, -0.2))
+
+    # right collar
+    edges, _ = extrude_loop(bm, right_edges, scale=1.1)
+    edges, _ = extrude_loop(bm, edges, translate=(0.2, 0, 0))
+    edges, _ = extrude_loop(bm, edges, scale=0.9)
+
+    # the long pipe starts from a copy of the collar opening, with a band in the second material
+    geom = bmesh.ops.duplicate(bm, geom=edges + list({v for e in edges for v in e.verts}))['geom']
+    edges = [g for g in geom if isinstance(g, bmesh.types.BMEdge)]
+    band_edges, band_faces = extrude_loop(bm, edges, translate=(0.05, 0, 0))
+    extrude_loop(bm, band_edges, translate=(3.0, 0, 0))
+    for face in band_faces:
+        face.material_index = 1
+    # every other vertex of the band edge moves out, select_nth + translate did this
+    for vert in loop_verts(band_edges)[::2]:
+        vert.co.x += 0.05
+
+    for point, normal, scale in PIPE_LOOP_CUTS:
+        loop_cut(bm, point, normal, scale)
+
+    for face in bm.faces:
+        face.smooth = True
+    bmesh.ops.recalc_face_normals(bm, faces=bm.faces[:])
+    mesh = bpy.data.meshes.new('Pipe')
+    bm.to_mesh(mesh)
+    bm.free()
+    obj = link_new_object('Pipe', mesh)
 
     # add subdivision
-    bpy.ops.object.mode_set(mode='OBJECT')
-    bpy.ops.object.subdivision_set(level=2, relative=False)
-    bpy.ops.object.shade_smooth()
+    obj.modifiers.new("Subdivision", type='SUBSURF').levels = 2
 
     # add material
     material = glossy_material(hex_to_rgb(0xe7966b), 0.4)#0.15
@@ -197,47 +270,7 @@ def create_pipe():
     material = glossy_material(roughness=0.35)#0.05
     obj.data.materials.append(material)
 
-    # assign material to face
-    bpy.ops.object.mode_set(mode='EDIT')
-    bpy.ops.mesh.select_mode(type="FACE")
-    bpy.ops.mesh.select_all(action = 'DESELECT')
-    # we need to switch from Edit mode to Object mode so the selection gets updated
-    bpy.ops.object.mode_set(mode='OBJECT')
-    for v in mesh.polygons:
-        if v.center[0] > 0.22 and v.center[0] < 0.3:
-            v.select = True
-    bpy.ops.object.mode_set(mode='EDIT')
-
-    bpy.context.object.active_material_index = 1
-    bpy.ops.object.material_slot_assign()
-
-    # add more geometry
-    bpy.ops.mesh.select_mode(type="VERT")
-    bpy.ops.mesh.select_all(action = 'DESELECT')
-    # we need to switch from Edit mode to Object mode so the selection gets updated
-    bpy.ops.object.mode_set(mode='OBJECT')
-    for v in mesh.vertices:
-        if v.co[0] > 0.22 and v.co[0] < 0.3:
-            v.select = True
-    bpy.ops.object.mode_set(mode='EDIT')
-    bpy.ops.mesh.select_nth()
-    bpy.ops.transform.translate(value=(0.05, 0, 0), orient_type='GLOBAL', orient_matrix=((1, 0, 0), (0, 1, 0), (0, 0, 1)), orient_matrix_type='GLOBAL', constraint_axis=(True, False, False), mirror=True, use_proportional_edit=False, proportional_edit_falloff='SMOOTH', proportional_size=1, use_proportional_connected=False, use_proportional_projected=False, snap=False, snap_elements={'INCREMENT'}, use_snap_project=False, snap_target='CLOSEST', use_snap_self=True, use_snap_edit=True, use_snap_nonedit=True, use_snap_selectable=False)
-
-    bpy.ops.mesh.loopcut_slide(MESH_OT_loopcut={"number_cuts":1, "smoothness":0, "falloff":'INVERSE_SQUARE', "object_index":0, "edge_index":519, "mesh_select_mode_init":(True, False, False)}, TRANSFORM_OT_edge_slide={"value":0.99, "single_side":False, "use_even":False, "flipped":False, "use_clamp":True, "mirror":True, "snap":False, "snap_elements":{'INCREMENT'}, "use_snap_project":False, "snap_target":'CLOSEST', "use_snap_self":True, "use_snap_edit":True, "use_snap_nonedit":True, "use_snap_selectable":False, "snap_point":(0, 0, 0), "correct_uv":True, "release_confirm":False, "use_accurate":False})
-
-    # add depth
-    bpy.ops.mesh.loopcut_slide(MESH_OT_loopcut={"number_cuts":1, "smoothness":0, "falloff":'INVERSE_SQUARE', "object_index":0, "edge_index":503, "mesh_select_mode_init":(True, False, False)}, TRANSFORM_OT_edge_slide={"value":-1, "single_side":False, "use_even":False, "flipped":False, "use_clamp":True, "mirror":True, "snap":False, "snap_elements":{'INCREMENT'}, "use_snap_project":False, "snap_target":'CLOSEST', "use_snap_self":True, "use_snap_edit":True, "use_snap_nonedit":True, "use_snap_selectable":False, "snap_point":(0, 0, 0), "correct_uv":True, "release_confirm":False, "use_accurate":False})
-    bpy.ops.transform.resize(value=(1.02, 1.02, 1.02), orient_type='GLOBAL', orient_matrix=((1, 0, 0), (0, 1, 0), (0, 0, 1)), orient_matrix_type='GLOBAL', mirror=True, use_proportional_edit=False, proportional_edit_falloff='SMOOTH', proportional_size=1, use_proportional_connected=False, use_proportional_projected=False, snap=False, snap_elements={'INCREMENT'}, use_snap_project=False, snap_target='CLOSEST', use_snap_self=True, use_snap_edit=True, use_snap_nonedit=True, use_snap_selectable=False)
-    bpy.ops.mesh.loopcut_slide(MESH_OT_loopcut={"number_cuts":1, "smoothness":0, "falloff":'INVERSE_SQUARE', "object_index":0, "edge_index":563, "mesh_select_mode_init":(True, False, False)}, TRANSFORM_OT_edge_slide={"value":-0.9, "single_side":False, "use_even":False, "flipped":False, "use_clamp":True, "mirror":True, "snap":False, "snap_elements":{'INCREMENT'}, "use_snap_project":False, "snap_target":'CLOSEST', "use_snap_self":True, "use_snap_edit":True, "use_snap_nonedit":True, "use_snap_selectable":False, "snap_point":(0, 0, 0), "correct_uv":True, "release_confirm":False, "use_accurate":False})
-
-    # add loopcut sharp edge
-    bpy.ops.mesh.loopcut_slide(MESH_OT_loopcut={"number_cuts":1, "smoothness":0, "falloff":'INVERSE_SQUARE', "object_index":0, "edge_index":343, "mesh_select_mode_init":(True, False, False)}, TRANSFORM_OT_edge_slide={"value":0.95, "single_side":False, "use_even":False, "flipped":False, "use_clamp":True, "mirror":True, "snap":False, "snap_elements":{'INCREMENT'}, "use_snap_project":False, "snap_target":'CLOSEST', "use_snap_self":True, "use_snap_edit":True, "use_snap_nonedit":True, "use_snap_selectable":False, "snap_point":(0, 0, 0), "correct_uv":True, "release_confirm":False, "use_accurate":False})
-    bpy.ops.mesh.loopcut_slide(MESH_OT_loopcut={"number_cuts":1, "smoothness":0, "falloff":'INVERSE_SQUARE', "object_index":0, "edge_index":347, "mesh_select_mode_init":(True, False, False)}, TRANSFORM_OT_edge_slide={"value":-0.95, "single_side":False, "use_even":False, "flipped":False, "use_clamp":True, "mirror":True, "snap":False, "snap_elements":{'INCREMENT'}, "use_snap_project":False, "snap_target":'CLOSEST', "use_snap_self":True, "use_snap_edit":True, "use_snap_nonedit":True, "use_snap_selectable":False, "snap_point":(0, 0, 0), "correct_uv":True, "release_confirm":False, "use_accurate":False})
-    bpy.ops.mesh.loopcut_slide(MESH_OT_loopcut={"number_cuts":1, "smoothness":0, "falloff":'INVERSE_SQUARE', "object_index":0, "edge_index":395, "mesh_select_mode_init":(True, False, False)}, TRANSFORM_OT_edge_slide={"value":0.95, "single_side":False, "use_even":False, "flipped":False, "use_clamp":True, "mirror":True, "snap":False, "snap_elements":{'INCREMENT'}, "use_snap_project":False, "snap_target":'CLOSEST', "use_snap_self":True, "use_snap_edit":True, "use_snap_nonedit":True, "use_snap_selectable":False, "snap_point":(0, 0, 0), "correct_uv":True, "release_confirm":False, "use_accurate":False})
-
-    bpy.ops.mesh.loopcut_slide(MESH_OT_loopcut={"number_cuts":1, "smoothness":0, "falloff":'INVERSE_SQUARE', "object_index":0, "edge_index":434, "mesh_select_mode_init":(True, False, False)}, TRANSFORM_OT_edge_slide={"value":0.95, "single_side":False, "use_even":False, "flipped":False, "use_clamp":True, "mirror":True, "snap":False, "snap_elements":{'INCREMENT'}, "use_snap_project":False, "snap_target":'CLOSEST', "use_snap_self":True, "use_snap_edit":True, "use_snap_nonedit":True, "use_snap_selectable":False, "snap_point":(0, 0, 0), "correct_uv":True, "release_confirm":False, "use_accurate":False})
-    bpy.ops.mesh.loopcut_slide(MESH_OT_loopcut={"number_cuts":1, "smoothness":0, "falloff":'INVERSE_SQUARE', "object_index":0, "edge_index":675, "mesh_select_mode_init":(True, False, False)}, TRANSFORM_OT_edge_slide={"value":-0.95, "single_side":False, "use_even":False, "flipped":False, "use_clamp":True, "mirror":True, "snap":False, "snap_elements":{'INCREMENT'}, "use_snap_project":False, "snap_target":'CLOSEST', "use_snap_self":True, "use_snap_edit":True, "use_snap_nonedit":True, "use_snap_selectable":False, "snap_point":(0, 0, 0), "correct_uv":True, "release_confirm":False, "use_accurate":False})
-
+@profiled
 def create_domain():
     bpy.ops.object.mode_set(mode='OBJECT')
     bpy.ops.mesh.primitive_cube_add(enter_editmode=False, align='WORLD', location=(-0.3, 0, 0.7), scale=(1.5, 1.5, 1.5))
@@ -248,7 +281,9 @@ def create_domain():
     fluid.domain_settings.domain_type = 'LIQUID'
     fluid.domain_settings.use_mesh = True
     fluid.domain_settings.cache_frame_end = 120
-    #fluid.domain_settings.cache_type = 'ALL'
+    # resolution, upres and bake range come from the quality profile when one is asked for,
+    # otherwise the domain default of 32
+    apply_quality(fluid.domain_settings)
 
     bpy.ops.object.shade_smooth()
     # add material
@@ -258,6 +293,7 @@ def create_domain():
     # fix water too much
     bpy.ops.transform.translate(value=(0, 0, -0.45), orient_type='GLOBAL', orient_matrix=((1, 0, 0), (0, 1, 0), (0, 0, 1)), orient_matrix_type='GLOBAL', constraint_axis=(True, True, True), mirror=False, use_proportional_edit=False, proportional_edit_falloff='SMOOTH', proportional_size=1, use_proportional_connected=False, use_proportional_projected=False, snap=False, snap_elements={'INCREMENT'}, use_snap_project=False, snap_target='CLOSEST', use_snap_self=False, use_snap_edit=True, use_snap_nonedit=True, use_snap_selectable=False)
 
+@profiled
 def create_inflow():
     bpy.ops.object.mode_set(mode='OBJECT')
     bpy.ops.mesh.primitive_uv_sphere_add(radius=1, enter_editmode=False, align='WORLD', location=(-0.3, 0, -0.05), scale=(0.15, 0.15, 0.15))
@@ -290,6 +326,7 @@ def add_fcurve_noise(fcurve, scale, strength, offset):
     fcurve.modifiers['Noise'].frame_start = 10
     fcurve.modifiers['Noise'].frame_end = 120
 
+@profiled
 def create_effector():
     text = add_text("Blender", 0.1, 0.02, 3)
     # make text as fluid collision
@@ -297,17 +334,14 @@ def create_effector():
     bpy.ops.object.modifier_add(type='FLUID')
     fluid = bpy.context.object.modifiers["Fluid"]
     fluid.fluid_type = 'EFFECTOR'
-    # position text
-    bpy.ops.object.mode_set(mode='EDIT')
-    bpy.ops.mesh.select_all(action='SELECT')
-    bpy.ops.transform.translate(value=(-1.5, 0, 0.02), orient_type='GLOBAL', orient_matrix=((1, 0, 0), (0, 1, 0), (0, 0, 1)), orient_matrix_type='GLOBAL', constraint_axis=(True, True, True), mirror=True, use_proportional_edit=False, proportional_edit_falloff='SMOOTH', proportional_size=1, use_proportional_connected=False, use_proportional_projected=False, snap=False, snap_elements={'INCREMENT'}, use_snap_project=False, snap_target='CLOSEST', use_snap_self=True, use_snap_edit=True, use_snap_nonedit=True, use_snap_selectable=False)
-    bpy.ops.object.mode_set(mode='OBJECT')
-    bpy.ops.transform.translate(value=(-0.3, 0, 1), orient_type='GLOBAL', orient_matrix=((1, 0, 0), (0, 1, 0), (0, 0, 1)), orient_matrix_type='GLOBAL', constraint_axis=(True, True, True), mirror=False, use_proportional_edit=False, proportional_edit_falloff='SMOOTH', proportional_size=1, use_proportional_connected=False, use_proportional_projected=False, snap=False, snap_elements={'INCREMENT'}, use_snap_project=False, snap_target='CLOSEST', use_snap_self=False, use_snap_edit=True, use_snap_nonedit=True, use_snap_selectable=False)
-
-    # add animation
-    #bpy.context.scene.frame_current = 10
-    bpy.ops.anim.keyframe_insert_by_name(type="BUILTIN_KSI_LocRot")
-    fcurves = text.animation_data.action.fcurves
+    # position text, the mesh offset is global like the edit mode translate it replaces, the text is rotated 90 about x
+    transform_mesh(text.data, compose(translate=(-1.5, 0, 0.02)), text.matrix_world)
+    transform_object(text, compose(translate=(-0.3, 0, 1)))
+
+    # add animation, one key at the current frame, the noise modifiers do the moving
+    frame = bpy.context.scene.frame_current
+    fcurves = insert_keys(text, 'location', [frame], [text.location], group="Object Transforms")
+    fcurves += insert_keys(text, 'rotation_euler', [frame], [text.rotation_euler], group="Object Transforms")
     # location z
     add_fcurve_noise(fcurves[2], 10, 0.5, 0)
     # location y
@@ -326,64 +360,46 @@ def create_effector():
     text.data.materials.append(material)
     bpy.ops.object.modifier_add(type='EDGE_SPLIT')
 
+@profiled
 def create_pan():
-    bpy.ops.object.mode_set(mode='OBJECT')
-    bpy.ops.mesh.primitive_cube_add(enter_editmode=False, align='WORLD', location=(-0.3, 0, 0.7), scale=(1.5, 1.5, 0.135))
-    bpy.ops.object.mode_set(mode='EDIT')
-    # get created object
-    obj = bpy.context.object
-    obj.name = 'Pan'
-    # get the mesh data
-    mesh = obj.data
-    bm = bmesh.from_edit_mesh(mesh)
+    bm = bmesh.new()
+    bmesh.ops.create_cube(bm, size=1, matrix=Matrix.Diagonal((3, 3, 0.27, 1)))
     # delete top face
-    bm.faces.ensure_lookup_table()
-    faces = bm.faces[5]
-    bmesh.ops.delete(bm, geom=[faces], context="FACES")
-
-    # select top edge
-    bpy.ops.mesh.select_mode(type="VERT")
-    bpy.ops.mesh.select_all(action = 'DESELECT')
-    # we need to switch from Edit mode to Object mode so the selection gets updated
-    bpy.ops.object.mode_set(mode='OBJECT')
-    for v in mesh.vertices:
-        if v.co[2] > 0:
-            v.select = True
-    bpy.ops.object.mode_set(mode='EDIT')
-
-    # extrude and scale it
-    bpy.ops.mesh.extrude_region_move()
-    bpy.ops.transform.resize(value=(1.05, 1.05, 1.05), constraint_axis=(False, False, False))
-    # extrude z -0.07
-    bpy.ops.mesh.extrude_region_move(MESH_OT_extrude_region={"use_normal_flip":False, "use_dissolve_ortho_edges":False, "mirror":False}, TRANSFORM_OT_translate={"value":(0, 0, -0.07), "orient_type":'GLOBAL', "orient_matrix":((1, 0, 0), (0, 1, 0), (0, 0, 1)), "orient_matrix_type":'GLOBAL', "constraint_axis":(False, False, True), "mirror":False, "use_proportional_edit":False, "proportional_edit_falloff":'SMOOTH', "proportional_size":1, "use_proportional_connected":False, "use_proportional_projected":False, "snap":False, "snap_elements":{'INCREMENT'}, "use_snap_project":False, "snap_target":'CLOSEST', "use_snap_self":True, "use_snap_edit":True, "use_snap_nonedit":True, "use_snap_selectable":False, "snap_point":(0, 0, 0), "snap_align":False, "snap_normal":(0, 0, 0), "gpencil_strokes":False, "cursor_transform":False, "texture_space":False, "remove_on_cancel":False, "use_duplicated_keyframes":False, "view2d_edge_pan":False, "release_confirm":False, "use_accurate":False, "use_automerge_and_split":False})
-    # extrude and scale it
-    bpy.ops.mesh.extrude_region_move()
-    bpy.ops.transform.resize(value=(0.97, 0.97, 0.97), constraint_axis=(False, False, False))
+    bmesh.ops.delete(bm, geom=[f for f in bm.faces if f.calc_center_median().z > 0], context='FACES')
+
+    # extrude the top edge out, down and back in for the rim
+    edges = [e for e in bm.edges if e.is_boundary]
+    edges, _ = extrude_loop(bm, edges, scale=1.05)
+    edges, _ = extrude_loop(bm, edges, translate=(0, 0, -0.07))
+    extrude_loop(bm, edges, scale=0.97)
 
     # bevel edge
-    bpy.ops.mesh.select_all(action = 'SELECT')
-    bpy.ops.mesh.bevel(offset=0.01, offset_pct=0, affect='EDGES')
+    bmesh.ops.bevel(bm, geom=bm.verts[:] + bm.edges[:], offset=0.01, offset_type='OFFSET', segments=1, profile=0.5, affect='EDGES')
+    for face in bm.faces:
+        face.smooth = True
+    mesh = bpy.data.meshes.new('Pan')
+    bm.to_mesh(mesh)
+    bm.free()
+    obj = link_new_object('Pan', mesh)
+    # moved down 1.3 and 0.27 and stretched 3 times in z to fix water too much
+    obj.location = (-0.3, 0, 0.7 - 1.3 - 0.27)
+    obj.scale = (1, 1, 3)
 
-    bmesh.update_edit_mesh(mesh)
     # add subdivision
-    bpy.ops.object.mode_set(mode='OBJECT')
-    bpy.ops.object.subdivision_set(level=3, relative=False)
-    bpy.context.object.modifiers["Subdivision"].render_levels = 3
-    bpy.ops.object.shade_smooth()
-    bpy.ops.transform.translate(value=(-0, -0, -1.3), orient_type='GLOBAL', orient_matrix=((1, 0, 0), (0, 1, 0), (0, 0, 1)), orient_matrix_type='GLOBAL', constraint_axis=(True, True, True), mirror=False, use_proportional_edit=False, proportional_edit_falloff='SMOOTH', proportional_size=1, use_proportional_connected=False, use_proportional_projected=False, snap=False, snap_elements={'INCREMENT'}, use_snap_project=False, snap_target='CLOSEST', use_snap_self=False, use_snap_edit=True, use_snap_nonedit=True, use_snap_selectable=False)
+    subdivision = obj.modifiers.new("Subdivision", type='SUBSURF')
+    subdivision.levels = 3
+    subdivision.render_levels = 3
     # add material
     material = glossy_material(roughness=0.3)
-    bpy.context.object.data.materials.append(material)
-
-    # fix water too much
-    bpy.ops.transform.resize(value=(1, 1, 3), orient_type='GLOBAL', orient_matrix=((1, 0, 0), (0, 1, 0), (0, 0, 1)), orient_matrix_type='GLOBAL', constraint_axis=(False, False, True), mirror=False, use_proportional_edit=False, proportional_edit_falloff='SMOOTH', proportional_size=1, use_proportional_connected=False, use_proportional_projected=False, snap=False, snap_elements={'INCREMENT'}, use_snap_project=False, snap_target='CLOSEST', use_snap_self=True, use_snap_edit=True, use_snap_nonedit=True, use_snap_selectable=False)
-    bpy.ops.transform.translate(value=(0, 0, -0.27), orient_type='GLOBAL', orient_matrix=((1, 0, 0), (0, 1, 0), (0, 0, 1)), orient_matrix_type='GLOBAL', constraint_axis=(True, True, True), mirror=False, use_proportional_edit=False, proportional_edit_falloff='SMOOTH', proportional_size=1, use_proportional_connected=False, use_proportional_projected=False, snap=False, snap_elements={'INCREMENT'}, use_snap_project=False, snap_target='CLOSEST', use_snap_self=False, use_snap_edit=True, use_snap_nonedit=True, use_snap_selectable=False)
+    obj.data.materials.append(material)
 
+@profiled
 def create_light():
     light = bpy.data.objects['Light']
     light.data.energy = 5000
     light.data.shadow_soft_size = 3
 
+@profiled
 def cycles_render(samples):
     bpy.context.scene.frame_end = 120
     bpy.context.scene.render.fps = 30
@@ -392,6 +408,7 @@ def cycles_render(samples):
     bpy.context.scene.cycles.preview_samples = samples
     bpy.context.scene.cycles.samples = samples
 
+@profiled
 def create_plane():
     bpy.ops.object.mode_set(mode='OBJECT')
     bpy.ops.mesh.primitive_plane_add(enter_editmode=False, align='WORLD', location=(0, 0, -0.74), size=100)
@@ -401,6 +418,7 @@ def create_plane():
     bpy.context.object.data.materials.append(material)
     bpy.ops.transform.translate(value=(-0, -0, -0.54), orient_type='GLOBAL', orient_matrix=((1, 0, 0), (0, 1, 0), (0, 0, 1)), orient_matrix_type='GLOBAL', constraint_axis=(True, True, True), mirror=False, use_proportional_edit=False, proportional_edit_falloff='SMOOTH', proportional_size=1, use_proportional_connected=False, use_proportional_projected=False, snap=False, snap_elements={'INCREMENT'}, use_snap_project=False, snap_target='CLOSEST', use_snap_self=False, use_snap_edit=True, use_snap_nonedit=True, use_snap_selectable=False)
 
+@profiled
 def position_camera():
     #camera = bpy.data.objects['Camera']
     bpy.ops.object.select_all(action='DESELECT')
@@ -428,6 +446,8 @@ class WaterBalancing(bpy.types.Operator):
         create_plane()
         background_settings()
         position_camera()
+        # bake once, later runs with the same parameters replay the cache
+        bake_fluid(bpy.data.objects['Water'])
 
         return {'FINISHED'}            # Lets Blender know the operator finished successfully.
 